@@ -44,6 +44,32 @@ const LoginView = ({role, setRole, setLoggedIn, setAccountMessage, setCheckedOut
     // Map to input-boxes
     const inputFields : string[] = ["UserID", "Username", "Password", "RoleID"];
 
+    // Is the typed username still free? | debounced point-check (GET /api/users/usernames/<name>/available),
+    // instead of downloading every username. Only a hint: logging in w/ your OWN (taken) username is fine, so it never blocks 'Submit'
+    const [userNameTaken, setUserNameTaken] = useState<boolean>(false)
+
+    useEffect(() => {
+        if (userName === "") {
+            setUserNameTaken(false)
+            return
+        }
+
+        const timeout = setTimeout(async () => {
+            const backend_url = "http://127.0.0.1:5000"
+            try {
+                const response = await fetch(`${backend_url}/api/users/usernames/${encodeURIComponent(userName)}/available`)
+                const res = await response.json()
+                if (response.ok) {
+                    setUserNameTaken(!res.available)
+                }
+            } catch(error) {
+                console.error(error)
+            }
+        }, 300) // (Not on every keystroke)
+
+        return () => clearTimeout(timeout)
+    }, [userName])
+
     // Get list of role_id's
     useEffect(() => {
 
@@ -226,6 +252,12 @@ const LoginView = ({role, setRole, setLoggedIn, setAccountMessage, setCheckedOut
             
             console.log(res.message) // Welcome Back or Congratulations! You have made an account (Returnign Log-In vs. New Signup)
 
+            // Signed session token -> sent as 'Authorization: Bearer <token>' on every later request
+            // (who the user is + their role/permissions come from it, not from request bodies)
+            if (res.token) {
+                sessionStorage.setItem("auth_token", res.token)
+            }
+
             // IFF no error prior :)
             setLoggedIn(true)
             setCheckedOutBooks(res.book_checkouts)
@@ -306,6 +338,12 @@ const LoginView = ({role, setRole, setLoggedIn, setAccountMessage, setCheckedOut
                                     </div>
                                 )
                             }
+
+                            {(inputField === "Username" && errorMessages[idx] === "" && userNameTaken) &&
+                                (
+                                    <p className="text-gray-500 text-xs text-left mt-[2.5px]"> Username is taken (fine if it's yours and you're logging in) </p>
+                                )
+                            }
                         </div>
                         // inputStates[idx](event.value);
                     ))
@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react"
+import { useEffect, useRef, useState } from "react"
 
 type BookCatalogProps = {
     roleID: number,
@@ -9,6 +9,10 @@ type BookCatalogProps = {
 const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
 
     const [books, setBooks] = useState([])
+
+    // Search box | empty -> the whole catalog, else the ranked matches from GET /api/books/search (best match first)
+    const [searchQuery, setSearchQuery] = useState<string>("")
+    const searchQueryRef = useRef<string>("") // (For the SSE 'resync' handler, which is registered once)
     const bookInfoTags = {
         "book_isbn_id" : "ISBN #", 
         "title" : "Title", 
@@ -22,23 +26,16 @@ const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
         
         const backend_url = "http://127.0.0.1:5000";
 
-        // Get requests don't allow request-'body' — use url-query-params instead :)
-        const queryParams = {
-            role_id: `${roleID}`, // Convert integer to string for url-query-params :)
-            table_name: "books", 
-            action: "SELECT",
-            column_field: "*"
-        }
-        const queryString = new URLSearchParams(queryParams).toString();
         const requestData = {
             method: "GET",
             headers: {
-                "Content-Type" : "application/json"
+                "Content-Type" : "application/json",
+                "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}`
             }
         }
 
         try {
-            const response = await fetch(`${backend_url}/api/books?${queryString}`, requestData)
+            const response = await fetch(`${backend_url}/api/books`, requestData)
             console.log(response)
             // If not 200-response-code
             if (!response.ok) { 
@@ -56,6 +53,47 @@ const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
         }
     }
 
+    const searchBookCatalog = async (query : string) => {
+
+        const backend_url = "http://127.0.0.1:5000";
+
+        const requestData = {
+            method: "GET",
+            headers: {
+                "Content-Type" : "application/json",
+                "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}`
+            }
+        }
+
+        try {
+            const response = await fetch(`${backend_url}/api/books/search?${new URLSearchParams({ q: query, limit: "50" }).toString()}`, requestData)
+            // If not 200-response-code
+            if (!response.ok) { 
+                throw new Error(`${response.status}`)
+            }
+
+            const res = await response.json()
+            // Only if the box still says the same thing (an older, slower response mustn't overwrite a newer one)
+            if (searchQueryRef.current === query) {
+                setBooks(res.books)
+            }
+
+        } catch(error) {
+            console.error(error)
+        }
+    }
+
+    const refreshBooks = () => {
+        searchQueryRef.current.trim() === "" ? getBookCatalog() : searchBookCatalog(searchQueryRef.current)
+    }
+
+    // Search-as-you-type, debounced (not 1 request per keystroke)
+    useEffect(() => {
+        searchQueryRef.current = searchQuery
+        const timeout = setTimeout(refreshBooks, 250)
+        return () => clearTimeout(timeout)
+    }, [searchQuery])
+
     const deleteBook = async (isbnID : string) => {
 
         const backend_url = "http://127.0.0.1:5000";
@@ -63,13 +101,8 @@ const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
             method: "DELETE",
             headers: {
                 "Content-Type" : "application/json",
-            }, 
-            body: JSON.stringify({
-                role_id: `${roleID}`, // Convert integer to string for url-query-params :)
-                table_name: "books", 
-                action: "DELETE",
-                column_field: "N/A"
-            })
+                "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}`
+            }
         }
 
         try {
@@ -89,19 +122,16 @@ const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
         }
     }
 
-    const borrowBook = async (userID : string, isbnID : string, roleID : string) => {
+    const borrowBook = async (userID : string, isbnID : string) => {
 
         const backend_url = "http://127.0.0.1:5000";
         const requestData = {
             method: "PATCH",
             headers: {
                 "Content-Type" : "application/json",
+                "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}`
             },
             body: JSON.stringify({
-                role_id: roleID,
-                table_name: "user_book_checkouts",
-                action: "INSERT",
-                column_field: "N/A",
                 book_isbn_id: isbnID
             })
         }
@@ -127,10 +157,39 @@ const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
     }
     
     useEffect(() => {
-        getBookCatalog()
+        // Live availability (Server-Sent Events) -> only the changed books are patched in, no re-polling the whole catalog
+        // (EventSource reconnects + resumes from the last event-id on its own | it can't send headers -> token as a query-param)
+        const backend_url = "http://127.0.0.1:5000";
+        const catalogEvents = new EventSource(`${backend_url}/api/books/events?${new URLSearchParams({ token: sessionStorage.getItem("auth_token") ?? "" }).toString()}`);
+
+        catalogEvents.addEventListener("availability", (event) => {
+            const { changes } = JSON.parse((event as MessageEvent).data);
+            const changedBooks = new Map(changes.map((change : any) => [change.book_isbn_id, change]));
+
+            setBooks((currentBooks) => currentBooks
+                // @ts-expect-error
+                .filter((book) => !(changedBooks.get(book["book_isbn_id"])?.deleted))
+                .map((book) => {
+                    // @ts-expect-error
+                    const change : any = changedBooks.get(book["book_isbn_id"]);
+                    return change ? { ...(book as object), available_count: change.available_count, total_book_count: change.total_book_count } : book;
+                }) as any
+            );
+        });
+
+        // Missed (or too many) changes -> refetch the catalog (or the current search) once
+        catalogEvents.addEventListener("resync", () => {
+            refreshBooks()
+        });
+
+        return () => catalogEvents.close();
     }, []);
 
     return (
+        <div className="flex flex-col">
+        <input value={searchQuery} onChange={(event) => setSearchQuery(event.target.value)} placeholder="Search by title or author"
+               className="rounded-md bg-white ring-2 ring-gray-300 text-black h-[30px] p-1.5 mx-13 mt-5 w-[360px]" />
+
         <div className="flex flex-row flex-wrap gap-8 ml-5 overflow-scroll p-8"> 
             {books.map((book) => {
                 return (
@@ -154,11 +213,11 @@ const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
                         {
                             roleID == 1 ? (
                                 <div className="flex flex-row justify-evenly align-center">
-                                    <button className={"p-1 mt-1 w-[40%] self-center text-xs text-white bg-blue-500"} onClick={() => {setBooks([]); /* updateBook(book["book_isbn_id"]); */ getBookCatalog();}}> 
+                                    <button className={"p-1 mt-1 w-[40%] self-center text-xs text-white bg-blue-500"} onClick={() => {setBooks([]); /* updateBook(book["book_isbn_id"]); */ refreshBooks();}}> 
                                         Update Book
                                     </button> 
                                     
-                                    <button className={"p-1 mt-1 w-[40%] self-center text-xs text-white bg-red-500"} onClick={() => {setBooks([]); deleteBook(book["book_isbn_id"]); getBookCatalog();}}> 
+                                    <button className={"p-1 mt-1 w-[40%] self-center text-xs text-white bg-red-500"} onClick={() => {setBooks([]); deleteBook(book["book_isbn_id"]); refreshBooks();}}> 
                                         Delete Book
                                     </button>
                                 </div>
@@ -183,6 +242,7 @@ const BookCatalog = ({roleID, checkedOutBooks, userID} : BookCatalogProps) => {
                 )
             })} 
         </div>
+        </div>
     )
 
 }
@@ -3,14 +3,31 @@ import './LibrarianDashboard.css'
 
 import { IoMdRefresh } from "react-icons/io";
 
-type LibrarianDashboardProps = {
-    roleID : number
-}
-
-const LibrarianDashboard = ({roleID} : LibrarianDashboardProps) => {
+// (The librarian's role comes from their session token now -> no props needed)
+const LibrarianDashboard = () => {
 
     const [displayOption, setDisplayOption] = useState<"Approvals" | "Excessive Overdue" | "All Users">("All Users");
     const [displayedUsers, setDisplayedUsers] = useState([]);
+    const [statusCounts, setStatusCounts] = useState<{[status : string] : number}>({});
+    const [totalUsers, setTotalUsers] = useState<number | null>(null);
+
+    // Per-status counts (GET /api/users/summary) | no user-rows are fetched for these
+    const getSummary = async () => {
+        const backend_url = "http://127.0.0.1:5000"
+        try {
+            const response = await fetch(`${backend_url}/api/users/summary`, {
+                headers: { "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}` }
+            })
+            const res = await response.json()
+            if (!response.ok) {
+                throw new Error(`${response.status}`)
+            }
+            setStatusCounts(res.summary)
+            setTotalUsers(res.total)
+        } catch(error) {
+            console.error(error)
+        }
+    }
 
     const getDisplay = async () => {
         const backend_url = "http://127.0.0.1:5000"
@@ -18,7 +35,8 @@ const LibrarianDashboard = ({roleID} : LibrarianDashboardProps) => {
         const requestData = {
             method: "GET",
             headers: {
-                "Content-Type" : "application/json"
+                "Content-Type" : "application/json",
+                "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}`
             }
         }
         
@@ -56,12 +74,9 @@ const LibrarianDashboard = ({roleID} : LibrarianDashboardProps) => {
             method: "PATCH",
             headers: {
                 "Content-Type" : "application/json",
+                "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}`
             },
             body : JSON.stringify({ 
-                role_id : roleID, 
-                table_name : "users",
-                action: "UPDATE",
-                column_field : "is_active_account",
                 new_active_status : newActiveStatus}) 
         }
     
@@ -81,13 +96,51 @@ const LibrarianDashboard = ({roleID} : LibrarianDashboardProps) => {
         }
     }
 
+    // Every user in a dashboard status at once (PATCH /api/users/active-status) | 1 request, not 1 per user
+    const updateAccountStatusForAll = async (status : "needs-approval" | "excessive-overdue", newActiveStatus : boolean) => {
+        const backend_url = "http://127.0.0.1:5000";
+        const requestData = {
+            method: "PATCH",
+            headers: {
+                "Content-Type" : "application/json",
+                "Authorization" : `Bearer ${sessionStorage.getItem("auth_token")}`
+            },
+            body : JSON.stringify({ 
+                new_active_status : newActiveStatus,
+                status : status}) 
+        }
+    
+        try {
+            const response = await fetch(`${backend_url}/api/users/active-status`, requestData)
+            const res = await response.json()
+            // If not 200-response-code
+            if (!response.ok) { 
+                throw new Error(`${response.status}`)
+            }
+            
+            console.log(`${res.updated} account(s) updated`)
+            setDisplayedUsers([]);
+            getDisplay();
+            getSummary();
+
+        } catch(error) {
+            console.error(error)
+        }
+    }
+
     useEffect(() => {
 
         getDisplay()
+        getSummary()
         console.log(displayOption)
 
     }, [displayOption])
 
+    const optionCount = (option : string) => {
+        const count = option === "Approvals" ? statusCounts["needs-approval"] : option === "Excessive Overdue" ? statusCounts["excessive-overdue"] : totalUsers;
+        return count === undefined || count === null ? "" : ` (${count})`;
+    }
+
     const showDisplay = () => {
 
         const userInfoTags = {
@@ -120,6 +173,11 @@ const LibrarianDashboard = ({roleID} : LibrarianDashboardProps) => {
 
             return (
                 <div className="flex flex-row flex-wrap gap-4 ml-6"> 
+                    {displayedUsers.length > 0 && (
+                        <button className={"p-1 w-full text-xs text-white bg-red-500"} onClick={() => {updateAccountStatusForAll("excessive-overdue", false)}}> 
+                            Deactivate All
+                        </button>
+                    )}
                     {displayedUsers.map((user, idx) => {
                         return (
                             <ul className='flex flex-col justify-center gap-2 align-center rounded-md ring-2 ring-gray-300 w-[27.5%] h-[125px]' key={idx}> 
@@ -154,6 +212,11 @@ const LibrarianDashboard = ({roleID} : LibrarianDashboardProps) => {
 
             return (
                 <div className="flex flex-row flex-wrap gap-4 ml-6"> 
+                    {displayedUsers.length > 0 && (
+                        <button className={"p-1 w-full text-xs text-white bg-green-500"} onClick={() => {updateAccountStatusForAll("needs-approval", true)}}> 
+                            Activate All
+                        </button>
+                    )}
                     {displayedUsers.map((user, idx) => {
                         return (
                             <ul className='rounded-md ring-2 ring-gray-300 w-[30%] flex flex-col p-2 gap-1' key={idx}> 
@@ -189,13 +252,13 @@ const LibrarianDashboard = ({roleID} : LibrarianDashboardProps) => {
     return (
         <div className="lib-dashboard bg-white rounded-3xl text-black flex flex-col gap-3 p-[1em] mt-8">
             <div className="w-full flex flex-row justify-between align-start mb-[0.65em] sticky"> 
-                <IoMdRefresh className="mt-[0.15em] w-[15%] cursor-pointer" size={"20px"} onClick={() => {setDisplayedUsers([]); getDisplay();}}/>
+                <IoMdRefresh className="mt-[0.15em] w-[15%] cursor-pointer" size={"20px"} onClick={() => {setDisplayedUsers([]); getDisplay(); getSummary();}}/>
 
                 <ul className="flex flex-row justify-around w-[85%]">
                     {options.map((option) => <li className = {displayOption === option ? "text-blue-500 font-bold cursor-pointer" : "text-black font-bold cursor-pointer"} 
                                                 // @ts-expect-error
                                                 onClick={() => {setDisplayedUsers([]); setDisplayOption(option);}}> 
-                                                {option} 
+                                                {option}{optionCount(option)} 
                                             </li>
                     )}
                 </ul>
@@ -12,7 +12,7 @@ const LibrarianView = ({roleID} : LibrarianViewProps) => {
     return (
         <div className="bg-gray-100 w-full h-full flex flex-row lib-view overflow-scroll"> 
             <Routes> 
-                <Route path = '/user-info' element = {<LibrarianDashboard roleID={roleID}/>}/>
+                <Route path = '/user-info' element = {<LibrarianDashboard/>}/>
                 <Route path = '/books' element = {<BookCatalog roleID={roleID}/>}/>
             </Routes>
         </div>
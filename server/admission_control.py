@@ -0,0 +1,175 @@
+# Admission control: overload -> fast, controlled 503's (+ Retry-After) instead of requests piling up on a slow database
+# -> Every API route belongs to a route-class (@routeClass(LOGIN | CATALOG_READ | CIRCULATION | ADMIN)), each w/ its own
+#    concurrency cap, short wait-queue + request deadline | 1 class being slow (i.e. a librarian's 50k-row import, a login
+#    storm) can't take every worker-thread w/ it
+#      ADMISSION_<CLASS>_MAX_CONCURRENT   requests of that class running at once per server-process (0 === no cap)
+#      ADMISSION_<CLASS>_MAX_QUEUE        requests allowed to wait for a slot (beyond that -> 503 right away)
+#      ADMISSION_<CLASS>_DEADLINE         seconds from arrival the request may take (pool wait + every statement)
+#      ADMISSION_QUEUE_TIMEOUT            max. seconds spent waiting for a slot (capped by the deadline)
+# -> The deadline is enforced downstream: the pool-checkout waits at most the time left, and every transaction's first
+#    statement carries 'SET LOCAL statement_timeout = <time left>' (same round-trip, see db_pool.InstrumentedConnection)
+#    | Postgres cancels the statement once the client would've given up anyway
+# -> Priority: while the database is under pressure (pool-wait, decayed average >= ADMISSION_DB_WAIT_SHED_MS + someone
+#    is queued on the pool), CATALOG_READ (cacheable, safe to retry) is shed first -> borrow/return, log-ins + librarian
+#    work keep the connections
+#
+# NOTE: Per server-process (like the pool itself) -> the caps multiply by the number of gunicorn workers
+
+import math
+import os
+import threading
+import time
+
+LOGIN = "login"
+CATALOG_READ = "catalog_read"
+CIRCULATION = "circulation"
+ADMIN = "admin"
+
+DB_WAIT_HALF_LIFE = 1.0 # seconds | pool-wait average decays by half every second w/o new observations
+
+
+class RequestRejected(Exception):
+    def __init__(self, route_class, reason, retry_after):
+        super().__init__("The server is busy. Please try again shortly.")
+        self.route_class = route_class
+        self.reason = reason # 'concurrency' | 'queue_timeout' | 'db_pressure' | 'deadline'
+        self.retry_after = retry_after
+
+
+# @routeClass(CATALOG_READ) | read by AdmissionController.admit() before the route runs (routes w/o one aren't admitted,
+# i.e. GET /metrics + the SSE stream, which has its own subscriber-cap)
+def routeClass(name):
+    def decorator(route):
+        route.route_class = name
+        return route
+    return decorator
+
+
+class RouteClass:
+
+    def __init__(self, name, max_concurrent, max_queue, deadline, shed_on_db_pressure=False):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.deadline = deadline # seconds
+        self.shed_on_db_pressure = shed_on_db_pressure
+
+        self.in_flight = 0
+        self.queued = 0
+        self.condition = threading.Condition()
+
+
+class Ticket:
+
+    __slots__ = ("route_class", "deadline")
+
+    def __init__(self, route_class, deadline):
+        self.route_class = route_class
+        self.deadline = deadline # time.monotonic()-based
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+
+class AdmissionController:
+
+    def __init__(self, route_classes, queue_timeout=0.5, db_wait_shed_threshold=0.25, db_waiting=lambda: 0):
+        self.route_classes = {route_class.name: route_class for route_class in route_classes}
+        self.queue_timeout = queue_timeout
+        self.db_wait_shed_threshold = db_wait_shed_threshold # seconds | <= 0 -> never shed on db pressure
+        self.db_waiting = db_waiting # -> requests currently queued on the connection pool
+
+        self._lock = threading.Lock()
+        self._db_wait = 0.0 # Decayed average of pool-checkout waits (seconds)
+        self._db_wait_at = time.monotonic()
+
+    # ---- Database pressure ----
+
+    def _decayedDbWait(self, now):
+        return self._db_wait * 0.5 ** ((now - self._db_wait_at) / DB_WAIT_HALF_LIFE)
+
+    def observeDbWait(self, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._db_wait = 0.8 * self._decayedDbWait(now) + 0.2 * seconds
+            self._db_wait_at = now
+
+    def dbWait(self):
+        with self._lock:
+            return self._decayedDbWait(time.monotonic())
+
+    def underDbPressure(self):
+        return 0 < self.db_wait_shed_threshold <= self.dbWait() and self.db_waiting() > 0
+
+    # ---- Admission ----
+
+    # -> Ticket (release() it when the request ends) | raises RequestRejected
+    def admit(self, name):
+        route_class = self.route_classes[name]
+        arrived = time.monotonic()
+        deadline = arrived + route_class.deadline
+
+        if route_class.shed_on_db_pressure and self.underDbPressure():
+            raise RequestRejected(name, "db_pressure", max(1, math.ceil(self.dbWait())))
+
+        with route_class.condition:
+            if route_class.max_concurrent > 0 and route_class.in_flight >= route_class.max_concurrent:
+                if route_class.queued >= route_class.max_queue:
+                    raise RequestRejected(name, "concurrency", 1)
+
+                wait_until = min(arrived + self.queue_timeout, deadline)
+                route_class.queued += 1
+                try:
+                    while route_class.in_flight >= route_class.max_concurrent:
+                        remaining = wait_until - time.monotonic()
+                        if remaining <= 0:
+                            raise RequestRejected(name, "queue_timeout", 1)
+                        route_class.condition.wait(remaining)
+                finally:
+                    route_class.queued -= 1
+
+            route_class.in_flight += 1
+
+        return Ticket(name, deadline)
+
+    def release(self, ticket):
+        route_class = self.route_classes[ticket.route_class]
+        with route_class.condition:
+            route_class.in_flight -= 1
+            route_class.condition.notify()
+
+    # Pool-checkout timeout for a request | the pool's own acquire_timeout, but never past the deadline
+    def connectionTimeout(self, ticket, acquire_timeout):
+        if ticket is None:
+            return acquire_timeout
+        remaining = ticket.remaining()
+        if remaining <= 0:
+            raise RequestRejected(ticket.route_class, "deadline", 1)
+        return min(acquire_timeout, remaining)
+
+    def stats(self):
+        return [(name, route_class.in_flight, route_class.queued) for name, route_class in self.route_classes.items()]
+
+
+def _routeClassFromEnv(name, max_concurrent, max_queue, deadline, shed_on_db_pressure=False):
+    prefix = f"ADMISSION_{name.upper()}_"
+    return RouteClass(
+        name,
+        max_concurrent=int(os.getenv(prefix + "MAX_CONCURRENT", str(max_concurrent))),
+        max_queue=int(os.getenv(prefix + "MAX_QUEUE", str(max_queue))),
+        deadline=float(os.getenv(prefix + "DEADLINE", str(deadline))),
+        shed_on_db_pressure=shed_on_db_pressure,
+    )
+
+def createAdmissionControllerFromEnv(db_waiting):
+    return AdmissionController(
+        [
+            _routeClassFromEnv(LOGIN, 16, 32, 10.0), # (bcrypt has its own queue, see password_hashing.py)
+            _routeClassFromEnv(CATALOG_READ, 32, 64, 5.0, shed_on_db_pressure=True),
+            _routeClassFromEnv(CIRCULATION, 16, 32, 5.0),
+            _routeClassFromEnv(ADMIN, 4, 8, 60.0), # Imports/exports
+        ],
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "0.5")),
+        db_wait_shed_threshold=float(os.getenv("ADMISSION_DB_WAIT_SHED_MS", "250")) / 1000,
+        db_waiting=db_waiting,
+    )
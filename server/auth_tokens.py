@@ -0,0 +1,181 @@
+# Stateless, signed session tokens (HS256 JWTs)
+# -> Login (POST /api/users) issues a token carrying the user_id, role_id + the role's permission-set, signed w/
+#    AUTH_TOKEN_SECRET | every later request sends it as 'Authorization: Bearer <token>'
+# -> Verifying === 1 HMAC + a constant-time compare (hmac.compare_digest), NO SQL | the caller can't claim a role
+#    (or table/action) anymore, since those come from the signed token instead of the request body
+# -> Deactivated accounts (PATCH .../update-active-status) are revoked: 'revoked_user_tokens' + its version-trigger
+#    (NOTIFY 'data_version_changed') keep every process' in-memory RevocationList in sync, so a deactivated user's
+#    EXISTING tokens stop working everywhere w/o a per-request lookup
+
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import secrets
+import threading
+import time
+
+WILDCARD_COLUMN = "*"
+
+TOKEN_HEADER = {"alg": "HS256", "typ": "JWT"}
+
+CREATE_REVOKED_USER_TOKENS_TABLE = (
+    """
+        CREATE TABLE IF NOT EXISTS revoked_user_tokens (
+            user_id TEXT PRIMARY KEY REFERENCES users(user_id) ON DELETE CASCADE,
+            revoked_at TIMESTAMPTZ NOT NULL DEFAULT now() -- tokens issued at/before this are rejected
+        );
+    """
+)
+
+REVOCATIONS_VERSION_QUERY = "SELECT COALESCE((SELECT version FROM data_versions WHERE table_name = 'revoked_user_tokens'), 0);"
+# Revocations older than the token-lifetime can't match a live token anymore -> not loaded
+RECENT_REVOCATIONS_QUERY = "SELECT user_id, extract(epoch FROM revoked_at) FROM revoked_user_tokens WHERE revoked_at > now() - make_interval(secs => %s);"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64decode(segment):
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+
+class RevocationList:
+    # Same freshness-scheme as the PermissionIndex: NOTIFY marks it stale, a version-check every 'refresh_interval' as fallback
+
+    def __init__(self, token_ttl, refresh_interval=30.0):
+        self.token_ttl = token_ttl
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._revoked = {} # user_id : revoked_at (epoch seconds)
+        self._version = None
+        self._stale = True
+        self._last_checked = 0.0
+
+    def load(self, cursor):
+        self._stale = False
+
+        try:
+            cursor.execute(REVOCATIONS_VERSION_QUERY)
+            version = cursor.fetchone()[0]
+            cursor.execute(RECENT_REVOCATIONS_QUERY, (self.token_ttl,))
+            revoked = {user_id: float(revoked_at) for user_id, revoked_at in cursor.fetchall()}
+        except Exception:
+            self._stale = True
+            raise
+
+        with self._lock:
+            self._revoked = revoked
+            self._version = version
+            self._last_checked = time.monotonic()
+
+    def needsRefresh(self):
+        return self._stale or time.monotonic() - self._last_checked >= self.refresh_interval
+
+    def ensureFresh(self, cursor):
+        if self._stale:
+            self.load(cursor)
+            return
+
+        if time.monotonic() - self._last_checked < self.refresh_interval:
+            return
+
+        cursor.execute(REVOCATIONS_VERSION_QUERY)
+        if cursor.fetchone()[0] != self._version:
+            self.load(cursor)
+        else:
+            self._last_checked = time.monotonic()
+
+    def onDataVersionChanged(self, payload):
+        if payload is None or payload.split(":", 1)[0] == "revoked_user_tokens":
+            self._stale = True
+
+    # Write-through after OUR commit (so this process rejects the tokens right away)
+    def revoke(self, user_id, revoked_at):
+        with self._lock:
+            self._revoked = {**self._revoked, user_id: revoked_at}
+
+    # issued_at: the token's 'iat' (ms, rounded DOWN -> never later than the real issue time) | revoked_at: microseconds
+    # -> a token issued before the revocation is always rejected, one issued after only within the same millisecond
+    def isRevoked(self, user_id, issued_at):
+        revoked_at = self._revoked.get(user_id)
+        return revoked_at is not None and issued_at <= revoked_at
+
+
+class TokenAuthenticator:
+
+    def __init__(self, secret, ttl=3600):
+        if not secret:
+            raise ValueError("An AUTH_TOKEN_SECRET is required")
+
+        self._key = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self.ttl = ttl
+        self._header_segment = _b64encode(json.dumps(TOKEN_HEADER, separators=(",", ":")).encode("utf-8"))
+
+    def _sign(self, signing_input):
+        return _b64encode(hmac.new(self._key, signing_input, hashlib.sha256).digest())
+
+    # permissions: [(table_name, action, column_field), ...] of the user's role | permissions_version: the PermissionIndex version they came from
+    def issue(self, user_id, role_id, permissions, permissions_version, now=None):
+        issued_at = math.floor((now if now is not None else time.time()) * 1000) / 1000 # (ms | see RevocationList.isRevoked)
+        claims = {
+            "sub": user_id,
+            "role": role_id,
+            "perms": [list(permission) for permission in permissions],
+            "pv": permissions_version,
+            "iat": issued_at,
+            "exp": int(issued_at) + self.ttl, # (whole seconds, as before)
+        }
+
+        signing_input = self._header_segment + b"." + _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+        return (signing_input + b"." + self._sign(signing_input)).decode("ascii"), claims
+
+    def verify(self, token, now=None):
+        try:
+            header_segment, claims_segment, signature = token.encode("ascii").split(b".")
+        except (AttributeError, UnicodeEncodeError, ValueError):
+            raise InvalidToken("Malformed token")
+
+        # Only tokens w/ OUR header (-> no 'alg: none' / algorithm-confusion) + a matching signature (constant-time compare)
+        if not hmac.compare_digest(header_segment, self._header_segment) or not hmac.compare_digest(signature, self._sign(header_segment + b"." + claims_segment)):
+            raise InvalidToken("Invalid token signature")
+
+        try:
+            claims = json.loads(_b64decode(claims_segment))
+        except ValueError:
+            raise InvalidToken("Malformed token")
+
+        if (now if now is not None else time.time()) >= claims.get("exp", 0):
+            raise InvalidToken("Token expired")
+
+        return claims
+
+
+def tokenPermissions(claims):
+    return frozenset(tuple(permission) for permission in claims.get("perms", ()))
+
+def isAllowedByClaims(permissions, table_name, action, column_field):
+    # Same '*'-semantics as the PermissionIndex
+    if (table_name, action, column_field) in permissions:
+        return True
+    return column_field != WILDCARD_COLUMN and (table_name, action, WILDCARD_COLUMN) in permissions
+
+
+def createAuthenticatorFromEnv():
+    secret = os.getenv("AUTH_TOKEN_SECRET")
+    if not secret:
+        # Only OK for 1 local dev process (FLASK_DEBUG, see .flaskenv) | multiple workers/instances MUST share 1 secret
+        # (else they reject each other's tokens) -> anywhere else refuse to start instead of silently picking 1
+        if os.getenv("FLASK_DEBUG", "False").lower() not in ("true", "1", "yes"):
+            raise RuntimeError("AUTH_TOKEN_SECRET is not set (required unless FLASK_DEBUG is on)")
+        print("AUTH_TOKEN_SECRET is not set -> using a random per-process secret (tokens won't survive a restart)")
+        secret = secrets.token_urlsafe(32)
+
+    return TokenAuthenticator(secret, ttl=int(os.getenv("AUTH_TOKEN_TTL_SECONDS", "3600")))
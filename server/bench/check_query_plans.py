@@ -0,0 +1,351 @@
+# Query-plan regression check | EXPLAIN (FORMAT JSON) of every hot statement against the bench dataset in a LOCAL Postgres
+#
+#   1. python -m bench.generate_data --dsn ... --users 100000 --books 20000 --checkouts 500000 --reset
+#      (or '--generate' below does the same in 1 step)
+#   2. python -m bench.check_query_plans --dsn "dbname=library_bench user=postgres host=localhost" \
+#          --users 100000 --books 20000 --out plans.json [--compare baseline-plans.json]
+#
+# -> Migrates the target database first -> the plans are the ones the CURRENT schema (indexes) gives
+# -> Every registered Query (queries.QUERIES) needs a plan case below -> a new statement w/o one fails the check
+# -> Queries are PREPARE'd + EXPLAIN EXECUTE'd like the server runs them, w/ both a custom AND a generic plan
+#    (after 5 executions Postgres may switch a prepared statement to its generic plan)
+# -> Fails (exit 1) if a case:
+#    | Seq Scans one of LARGE_TABLES (unless the case is a full pass by design, see seq_scan_ok)
+#    | is estimated above its max_cost (cost units at the generate_data default scale | '--cost-scale' for bigger datasets)
+#    | '--compare': got more than '--max-regression' costlier than in a previous run's results-file
+#
+# NOTE: EXPLAIN w/o ANALYZE never executes the statement (the writes included) | everything is rolled back anyway
+
+import argparse
+import json
+import platform
+import sys
+
+import psycopg2
+
+# Every module that registers Query's (NOT server.py: importing it starts the app)
+import bulk_admin
+import checkout_history
+import circulation
+import overdue_engine
+import user_accounts
+from bench.dataset import bookIsbn, studentId
+from bench.generate_data import generate
+from catalog_listing import buildListingQuery, encodeCursor, parseListingArgs
+from catalog_search import buildSearchQuery, parseSearchArgs
+from migrations import migrate
+from queries import QUERIES, Query
+
+RESULTS_FORMAT_VERSION = 1
+MIN_BOOKS = 1000 # Below this, the planner rightly prefers Seq Scans everywhere -> the check would mean nothing
+BATCH_SIZE = 5 # ISBNs / users / patches per sample batch
+
+# Seq Scans on these fail a case | checkout_history's monthly partitions count as checkout_history
+LARGE_TABLES = ("users", "books", "user_book_checkouts", "circulation_daily", "checkout_history")
+
+PLAN_CASES = {} # name : (max_cost | None, seq_scan_ok, build(ctx) -> (Query | sql, params))
+
+
+def planCase(name, max_cost, seq_scan_ok=()):
+    def register(build):
+        PLAN_CASES[name] = (max_cost, frozenset(seq_scan_ok), build)
+        return build
+    return register
+
+
+def sampleUser(ctx, offset=0):
+    return studentId((ctx["users"] // 2 + offset) % ctx["users"])
+
+def sampleIsbns(ctx, count=BATCH_SIZE):
+    return [bookIsbn((ctx["books"] // 3 + i * 7) % ctx["books"]) for i in range(count)]
+
+def sampleTitle(ctx):
+    return f"Bench Title {ctx['books'] // 3:07d}" # (generate_data's titles)
+
+
+# ---- Log-in / sign-up ----
+
+@planCase("login_lookup", max_cost=60)
+def loginLookupCase(ctx):
+    return user_accounts.LOGIN_LOOKUP, {"user_id": sampleUser(ctx)}
+
+@planCase("user_name_taken", max_cost=20)
+def userNameTakenCase(ctx):
+    return user_accounts.USER_NAME_TAKEN, {"user_name": "Bench_User_1"}
+
+@planCase("update_password_hash", max_cost=20)
+def updatePasswordHashCase(ctx):
+    return user_accounts.UPDATE_PASSWORD_HASH, {"password_hash": b"\x00", "user_id": sampleUser(ctx)}
+
+@planCase("insert_user", max_cost=20)
+def insertUserCase(ctx):
+    return user_accounts.INSERT_USER, {"role_id": 2, "user_id": "999999999", "user_name": "plan_check", "password_hash": b"\x00", "is_active_account": False}
+
+# ---- Librarian dashboard ----
+
+# Every user, in user_id-order -> a full pass by design (only --compare guards it)
+@planCase("users_listing", max_cost=None, seq_scan_ok=("users",))
+def usersListingCase(ctx):
+    return user_accounts.USERS_LISTING, None
+
+@planCase("users_listing_by_status", max_cost=1000)
+def usersListingByStatusCase(ctx):
+    return user_accounts.USERS_LISTING_BY_STATUS, {"status": "needs-approval"}
+
+@planCase("users_summary", max_cost=None, seq_scan_ok=("users",))
+def usersSummaryCase(ctx):
+    return user_accounts.USERS_SUMMARY, None
+
+@planCase("set_users_active_status", max_cost=200)
+def setUsersActiveStatusCase(ctx):
+    return bulk_admin.SET_USERS_ACTIVE_STATUS, {"user_ids": [sampleUser(ctx, i) for i in range(BATCH_SIZE)], "active": True}
+
+@planCase("set_active_status_by_account_status", max_cost=2000)
+def setActiveStatusByAccountStatusCase(ctx):
+    return bulk_admin.SET_ACTIVE_STATUS_BY_ACCOUNT_STATUS, {"status": "needs-approval", "active": True}
+
+@planCase("circulation_daily", max_cost=2000)
+def circulationDailyCase(ctx):
+    return checkout_history.CIRCULATION_DAILY, {"from_day": "2025-01-01", "to_day": "2025-01-30"}
+
+@planCase("circulation_top_books", max_cost=5000)
+def circulationTopBooksCase(ctx):
+    return checkout_history.CIRCULATION_TOP_BOOKS, {"from_day": "2025-01-01", "to_day": "2025-01-30", "top": 10}
+
+# ---- Circulation ----
+
+@planCase("refresh_overdue_books_for_user", max_cost=100)
+def refreshOverdueBooksForUserCase(ctx):
+    return overdue_engine.REFRESH_OVERDUE_BOOKS_FOR_USER, {"user_id": sampleUser(ctx)}
+
+@planCase("borrow_books", max_cost=300)
+def borrowBooksCase(ctx):
+    return circulation.BORROW_BOOKS, {"book_isbn_ids": sampleIsbns(ctx), "user_id": sampleUser(ctx)}
+
+@planCase("return_books", max_cost=300)
+def returnBooksCase(ctx):
+    return circulation.RETURN_BOOKS, {"book_isbn_ids": sampleIsbns(ctx), "user_id": sampleUser(ctx)}
+
+@planCase("book_checked_out", max_cost=20)
+def bookCheckedOutCase(ctx):
+    return circulation.BOOK_CHECKED_OUT, {"book_isbn_id": sampleIsbns(ctx, 1)[0]}
+
+# Plain SQL (runs once per OverdueScheduler tick, not prepared)
+@planCase("overdue_tick", max_cost=5000)
+def overdueTickCase(ctx):
+    return overdue_engine.MARK_NEWLY_OVERDUE_BOOKS_QUERY, None
+
+# ---- Catalog ----
+
+@planCase("patch_books", max_cost=300)
+def patchBooksCase(ctx):
+    patches = [{"book_isbn_id": book_isbn_id, "available_count": 1} for book_isbn_id in sampleIsbns(ctx)]
+    return bulk_admin.PATCH_BOOKS, {"patches": json.dumps(patches)}
+
+@planCase("books_listing_first_page", max_cost=200)
+def booksListingFirstPageCase(ctx):
+    return buildListingQuery(parseListingArgs({"sort": "title", "limit": "20"}))
+
+@planCase("books_listing_next_page", max_cost=200)
+def booksListingNextPageCase(ctx):
+    after = encodeCursor("title", [sampleTitle(ctx), sampleIsbns(ctx, 1)[0]])
+    return buildListingQuery(parseListingArgs({"sort": "title", "limit": "20", "cursor": after}))
+
+@planCase("books_listing_by_author", max_cost=500)
+def booksListingByAuthorCase(ctx):
+    return buildListingQuery(parseListingArgs({"author": "Bench Author 0042", "limit": "20"}))
+
+# (Typo-tolerant: tsquery OR trigram word-similarity)
+@planCase("books_search", max_cost=20000)
+def booksSearchCase(ctx):
+    return buildSearchQuery(parseSearchArgs({"q": f"{ctx['books'] // 3:07d}"}))
+
+# (< MIN_TRIGRAM_QUERY_LENGTH characters -> tsquery prefix only)
+@planCase("books_search_prefix", max_cost=5000)
+def booksSearchPrefixCase(ctx):
+    return buildSearchQuery(parseSearchArgs({"q": "zq"}))
+
+
+def planNodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from planNodes(child)
+
+def largeTable(relation_name):
+    if relation_name.startswith("checkout_history_"):
+        return "checkout_history"
+    return relation_name if relation_name in LARGE_TABLES else None
+
+# -> the top plan node | Query's are prepared (+ deallocated) like runQuery does: PREPARE + EXECUTE in 1 round-trip
+# ('%%' in their SQL is only unescaped when params are bound -> never executed w/o them)
+def explain(conn, statement, params, plan_cache_mode):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SET LOCAL plan_cache_mode = {plan_cache_mode};")
+        if isinstance(statement, Query):
+            cursor.execute(statement.prepare_sql + " EXPLAIN (FORMAT JSON) " + statement.execute_sql, params or {})
+        else:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, params)
+        return cursor.fetchone()[0][0]["Plan"]
+    finally:
+        conn.rollback()
+        if isinstance(statement, Query):
+            cursor.execute("DEALLOCATE ALL;")
+            conn.rollback()
+
+def describePlan(plan, depth=0):
+    target = plan.get("Index Name") or plan.get("Relation Name") or ""
+    lines = [f"{'  ' * depth}{plan['Node Type']} {target}".rstrip() + f"  (cost {plan['Total Cost']})"]
+    for child in plan.get("Plans", ()):
+        lines.extend(describePlan(child, depth + 1))
+    return lines
+
+def checkCase(conn, name, ctx, cost_scale):
+    max_cost, seq_scan_ok, build = PLAN_CASES[name]
+    statement, params = build(ctx)
+
+    modes = ("force_custom_plan", "force_generic_plan") if isinstance(statement, Query) else ("force_custom_plan",)
+    result = {"query": statement.name if isinstance(statement, Query) else None, "plans": {}}
+    failures = []
+
+    for mode in modes:
+        mode_name = mode.split("_")[1] # custom | generic
+        try:
+            plan = explain(conn, statement, params, mode)
+        except psycopg2.Error as e:
+            failures.append(f"{name} ({mode_name} plan): EXPLAIN failed: {str(e).strip()}")
+            continue
+
+        seq_scans = set()
+        for node in planNodes(plan):
+            table = largeTable(node.get("Relation Name", "")) if node["Node Type"] == "Seq Scan" else None
+            if table is not None and table not in seq_scan_ok:
+                seq_scans.add(table)
+
+        seq_scans = sorted(seq_scans)
+        result["plans"][mode_name] = {"cost": plan["Total Cost"], "seq_scans": seq_scans}
+
+        problems = [f"Seq Scan on {table}" for table in seq_scans]
+        if max_cost is not None and plan["Total Cost"] > max_cost * cost_scale:
+            problems.append(f"cost {plan['Total Cost']} > budget {max_cost * cost_scale:g}")
+        if problems:
+            failures.append(f"{name} ({mode_name} plan): {', '.join(problems)}\n" + "\n".join("      " + line for line in describePlan(plan)))
+
+    return result, failures
+
+# names: a subset of PLAN_CASES | None -> all of them, + the coverage check (every registered Query has a case)
+def runChecks(conn, ctx, cost_scale, names=None):
+    registered = set(QUERIES) # (Before the cases build their dynamic Query's)
+    results, failures = {}, []
+
+    for name in names or PLAN_CASES:
+        results[name], case_failures = checkCase(conn, name, ctx, cost_scale)
+        failures.extend(case_failures)
+
+    if names is None:
+        uncovered = registered - {result["query"] for result in results.values()}
+        failures.extend(f"{query_name}: registered Query w/o a plan case (add one to bench/check_query_plans.py)" for query_name in sorted(uncovered))
+    return results, failures
+
+def tableSizes(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT relname, reltuples::BIGINT FROM pg_class WHERE relname = ANY(%s) AND relkind IN ('r', 'p');", (list(LARGE_TABLES),))
+        return dict(cursor.fetchall())
+
+
+def printReport(results):
+    print(f"{'case':<36}{'custom cost':>14}{'generic cost':>14}  seq scans")
+    for name, result in results.items():
+        plans = result["plans"]
+        custom, generic = plans.get("custom"), plans.get("generic")
+        seq_scans = sorted({table for plan in plans.values() for table in plan["seq_scans"]})
+        print(f"{name:<36}{custom['cost'] if custom else '-':>14}{generic['cost'] if generic else '-':>14}  {', '.join(seq_scans) or '-'}")
+
+# Returns the list of regressions (empty -> none) | cases + plan-modes present in BOTH runs
+def compareResults(baseline, current, max_regression):
+    regressions = []
+
+    for name, result in current["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if before is None:
+            continue
+        for mode, plan in result["plans"].items():
+            cost_before = before["plans"].get(mode, {}).get("cost")
+            if cost_before and plan["cost"] > cost_before * (1 + max_regression):
+                regressions.append(f"{name} ({mode} plan): cost {cost_before} -> {plan['cost']} ({(plan['cost'] - cost_before) / cost_before:+.1%})")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EXPLAIN every hot statement against the bench dataset; fail on Seq Scans / cost regressions.")
+    parser.add_argument("--dsn", required=True, help="Target database (never point this at production!)")
+    parser.add_argument("--users", type=int, default=100_000, help="Must match generate_data's --users")
+    parser.add_argument("--books", type=int, default=20_000, help="Must match generate_data's --books")
+    parser.add_argument("--checkouts", type=int, default=500_000, help="Only used w/ --generate")
+    parser.add_argument("--generate", action="store_true", help="(Re)load the bench dataset first (generate_data w/ --reset)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cost-scale", type=float, default=1.0, help="Multiplies every case's max_cost (i.e. 10 for a 10x dataset)")
+    parser.add_argument("--case", dest="cases", action="append", choices=sorted(PLAN_CASES), help="Only check these (repeatable) | default: all")
+    parser.add_argument("--label", default=None, help="Free-form label stored in the results (i.e. the git commit)")
+    parser.add_argument("--out", default=None, help="Write results as JSON")
+    parser.add_argument("--compare", default=None, help="Baseline results-JSON to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.50, help="Allowed estimated-cost increase before failing (0.50 === +50%%)")
+    args = parser.parse_args(argv)
+
+    if args.users < 1 or args.books < 1:
+        parser.error("--users and --books must be >= 1")
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        migrate(conn)
+        if args.generate:
+            generate(conn, args.users, args.books, args.checkouts, 0.05, 0.02, 4, args.seed, reset=True)
+
+        sizes = tableSizes(conn)
+        if sizes.get("books", 0) < MIN_BOOKS:
+            print(f"Only {sizes.get('books', 0)} books in the target database -> load the bench dataset first (--generate)", file=sys.stderr)
+            return 2
+
+        ctx = {"users": args.users, "books": args.books}
+        cases, failures = runChecks(conn, ctx, args.cost_scale, args.cases)
+
+        with conn.cursor() as cursor:
+            cursor.execute("SHOW server_version;")
+            server_version = cursor.fetchone()[0]
+        conn.rollback()
+    finally:
+        conn.close()
+
+    results = {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "label": args.label,
+        "postgres": server_version,
+        "python": platform.python_version(),
+        "table_rows": sizes,
+        "cost_scale": args.cost_scale,
+        "cases": cases,
+    }
+    printReport(results["cases"])
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        failures.extend(compareResults(baseline, results, args.max_regression))
+
+    if failures:
+        print("\nPLAN REGRESSIONS:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+
+    print("\nNo plan regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# Read/write routing check against a primary + streaming replica (see db_routing.py for the local setup)
+#
+#   DB_REPLICA_DSNS="host=localhost port=5433 ..." EXPOSE_DB_TARGET=True LOGIN_IP_RATE_PER_MINUTE=0 flask run
+#   python -m bench.check_read_routing --base-url http://127.0.0.1:5000 --users 100000 --rounds 50
+#
+# -> Plain catalog reads: how many were served by a replica (X-DB-Target) | --min-replica-share fails the run below that share
+# -> Read-your-writes: borrow a book, IMMEDIATELY re-read its page, compare available_count w/ what the borrow returned
+#    (then return it) | any stale read -> exit 1
+# -> Needs the bench dataset (python -m bench.generate_data ...) for the student log-ins
+
+import argparse
+import collections
+import http.client
+import json
+import random
+import sys
+import urllib.parse
+
+from bench.dataset import BENCH_PASSWORD, studentId, studentName
+
+
+class RoutingClient:
+
+    def __init__(self, base_url, timeout):
+        parsed = urllib.parse.urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self._conn = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+        self._prefix = parsed.path.rstrip("/")
+        self.token = None
+
+    # -> (status, body, X-DB-Target)
+    def request(self, method, path, params=None, body=None):
+        url = self._prefix + path + ("?" + urllib.parse.urlencode(params) if params else "")
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+
+        self._conn.request(method, url, body=payload, headers=headers)
+        response = self._conn.getresponse()
+        data = response.read()
+        return response.status, json.loads(data) if data else None, response.getheader("X-DB-Target")
+
+    def close(self):
+        self._conn.close()
+
+
+def loginStudent(client, users, rng, attempts=50):
+    for _ in range(attempts):
+        index = rng.randrange(users)
+        status, body, _ = client.request("POST", "/api/users", body={"role_id": 2, "user_id": studentId(index), "user_name": studentName(index), "password": BENCH_PASSWORD})
+        if status == 201:
+            client.token = body["token"]
+            return studentId(index)
+    raise RuntimeError("Couldn't log in any bench student (was bench.generate_data run against this server's database?)")
+
+# First available book + the cursor whose page starts w/ it (re-reading that page === re-reading that book)
+def findAvailableBook(client, max_pages=200):
+    page_cursor = None
+    for _ in range(max_pages):
+        params = {"limit": 1, **({"cursor": page_cursor} if page_cursor else {})}
+        status, body, _ = client.request("GET", "/api/books", params=params)
+        if status != 200 or not body["books"]:
+            break
+        if body["books"][0]["available_count"] > 0:
+            return body["books"][0], page_cursor
+        page_cursor = body["next_cursor"]
+    raise RuntimeError("No available book found")
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    client = RoutingClient(args.base_url, args.timeout)
+    targets = collections.Counter()
+    stale_reads = []
+
+    try:
+        user_id = loginStudent(client, args.users, rng)
+
+        for _ in range(args.rounds):
+            status, _, target = client.request("GET", "/api/books", params={"limit": 20})
+            targets[target or "(no X-DB-Target header)"] += 1
+
+        for _ in range(args.rounds):
+            book, page_cursor = findAvailableBook(client)
+            status, borrowed, _ = client.request("PATCH", f"/api/users/{user_id}/borrow-book", body={"book_isbn_id": book["book_isbn_id"]})
+            if status != 200:
+                continue
+
+            params = {"limit": 1, **({"cursor": page_cursor} if page_cursor else {})}
+            _, body, target = client.request("GET", "/api/books", params=params)
+            read_back = body["books"][0] if body and body["books"] else None
+            if read_back is None or read_back["book_isbn_id"] != book["book_isbn_id"] or read_back["available_count"] != borrowed["available_count"]:
+                stale_reads.append((book["book_isbn_id"], borrowed["available_count"], read_back and read_back["available_count"], target))
+
+            client.request("PATCH", f"/api/users/{user_id}/return-book", body={"book_isbn_id": book["book_isbn_id"]})
+    finally:
+        client.close()
+
+    return targets, stale_reads
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check read-replica routing + read-your-writes (see db_routing.py).")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=100_000, help="Must match generate_data's --users")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--min-replica-share", type=float, default=0.0, help="Fail if fewer plain reads than this (0-1) came from replicas")
+    args = parser.parse_args(argv)
+
+    targets, stale_reads = run(args)
+
+    total_reads = sum(targets.values())
+    replica_reads = sum(count for target, count in targets.items() if target.startswith("replica"))
+    print("Plain catalog reads by target:")
+    for target, count in sorted(targets.items()):
+        print(f"  {target:<28}{count:>6}")
+
+    print(f"\nRead-your-writes: {len(stale_reads)} stale read(s) after {args.rounds} borrow(s)")
+    for book_isbn_id, expected, seen, target in stale_reads:
+        print(f"  {book_isbn_id}: expected available_count={expected}, read {seen} from {target}")
+
+    if stale_reads:
+        return 1
+    if total_reads and replica_reads / total_reads < args.min_replica_share:
+        print(f"\nOnly {replica_reads}/{total_reads} reads came from replicas (--min-replica-share {args.min_replica_share})")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
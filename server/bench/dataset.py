@@ -0,0 +1,33 @@
+# Shape of the synthetic library (shared by generate_data.py + run_benchmark.py, so the load-test only ever asks for
+# users/books that the generator actually created)
+
+BENCH_PASSWORD = "bench-password" # Every generated user's password
+BENCH_LIBRARIAN_COUNT = 20 # Librarian IDs are 4 digits -> kept small
+
+STUDENT_ID_OFFSET = 100_000_000 # 9-digit student IDs
+LIBRARIAN_ID_OFFSET = 1_000 # 4-digit librarian IDs
+ISBN_OFFSET = 9_780_000_000_000 # 13-digit ISBNs
+SCRATCH_ISBN_OFFSET = 9_790_000_000_000 # Books the load-test itself inserts/imports/deletes (never collide w/ generated ones)
+AUTHOR_COUNT = 5000
+
+
+def studentId(index):
+    return str(STUDENT_ID_OFFSET + index)
+
+def studentName(index):
+    return f"bench_user_{index}"
+
+def librarianId(index):
+    return str(LIBRARIAN_ID_OFFSET + index)
+
+def librarianName(index):
+    return f"bench_librarian_{index}"
+
+def bookIsbn(index):
+    return str(ISBN_OFFSET + index)
+
+def scratchIsbn(index):
+    return str(SCRATCH_ISBN_OFFSET + index)
+
+def authorName(index):
+    return f"Bench Author {index % AUTHOR_COUNT:04d}"
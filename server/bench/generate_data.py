@@ -0,0 +1,152 @@
+# Synthetic large-library data generator (for benchmarks / query-plan checks against a LOCAL Postgres)
+#
+#   cd server && python -m bench.generate_data --dsn "dbname=library_bench user=postgres host=localhost" \
+#       --users 1000000 --books 200000 --checkouts 5000000 --overdue-fraction 0.05 --reset
+#
+# -> Migrates the target database first (same schema as the server), then bulk-loads everything through COPY.
+# -> Deterministic for a given --seed, so two runs (i.e. before/after a change) benchmark the same data.
+# -> Every generated user's password is bench.dataset.BENCH_PASSWORD (hashed once, reused for all rows), so the load-test can log them in.
+
+import argparse
+import io
+import math
+import random
+import sys
+import time
+
+import bcrypt
+import psycopg2
+
+from bench.dataset import BENCH_LIBRARIAN_COUNT, BENCH_PASSWORD, authorName, bookIsbn, librarianId, librarianName, studentId, studentName
+from migrations import migrate
+from overdue_engine import reconcileAllOverdueBooks
+
+COPY_CHUNK_BYTES = 1 << 20
+
+
+# File-like view over a generator of text-lines -> COPY streams rows as they're generated
+class _LineReader(io.RawIOBase):
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while len(self._buffer) < len(target):
+            batch = []
+            size = 0
+            for line in self._lines:
+                batch.append(line)
+                size += len(line)
+                if size >= COPY_CHUNK_BYTES:
+                    break
+            if not batch:
+                break
+            self._buffer += "".join(batch).encode("utf-8")
+
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def copyRows(cursor, table_and_columns, lines):
+    cursor.copy_expert(f"COPY {table_and_columns} FROM STDIN WITH (FORMAT text)", _LineReader(lines))
+
+
+# Checkout i of user u -> book (start + j * step) % n_books: distinct books per user w/o any bookkeeping
+# (step is coprime to n_books, so a user's books never repeat as long as they borrow < n_books)
+def checkoutPlan(n_users, n_books, n_checkouts):
+    per_user, remainder = divmod(n_checkouts, n_users)
+    step = next(candidate for candidate in range(7919, 7919 + n_books + 2) if math.gcd(candidate, n_books) == 1)
+
+    for user_index in range(n_users):
+        count = min(per_user + (1 if user_index < remainder else 0), n_books)
+        start = (user_index * 104_729) % n_books
+        for j in range(count):
+            yield user_index, (start + j * step) % n_books
+
+def generate(conn, n_users, n_books, n_checkouts, overdue_fraction, inactive_fraction, bcrypt_rounds, seed, reset):
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+
+    if reset:
+        cursor.execute("TRUNCATE user_book_checkouts, users, books RESTART IDENTITY CASCADE;")
+        conn.commit()
+
+    started = time.monotonic()
+
+    # Pass 1: copies out per book (so every book's available_count is consistent w/ its checkouts)
+    copies_out = [0] * n_books
+    for _, book_index in checkoutPlan(n_users, n_books, n_checkouts):
+        copies_out[book_index] += 1
+
+    def bookLines():
+        for book_index in range(n_books):
+            total = copies_out[book_index] + rng.randint(0, 10)
+            yield f"{bookIsbn(book_index)}\tBench Title {book_index:07d}\t{authorName(book_index)}\t{rng.randint(1850, 2024)}\t{total}\t{total - copies_out[book_index]}\n"
+
+    copyRows(cursor, "books (book_isbn_id, title, author, published_year, total_book_count, available_count)", bookLines())
+    print(f"books: {n_books} rows ({time.monotonic() - started:.1f}s)")
+
+    # Same (cheap-ish) hash for every user -> generation isn't bottlenecked on bcrypt
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds=bcrypt_rounds))
+    bytea_hash = "\\\\x" + password_hash.hex()
+    text_hash = password_hash.decode("utf-8")
+
+    def userLines():
+        for librarian_index in range(BENCH_LIBRARIAN_COUNT):
+            yield f"1\t{librarianId(librarian_index)}\t{librarianName(librarian_index)}\t{bytea_hash}\tt\t{{}}\t{text_hash}\n"
+        for user_index in range(n_users):
+            is_active = "f" if rng.random() < inactive_fraction else "t"
+            yield f"2\t{studentId(user_index)}\t{studentName(user_index)}\t{bytea_hash}\t{is_active}\t{{}}\t{text_hash}\n"
+
+    copyRows(cursor, "users (role_id, user_id, user_name, password_hash, is_active_account, books_overdue, string_password_hash)", userLines())
+    print(f"users: {n_users + BENCH_LIBRARIAN_COUNT} rows ({time.monotonic() - started:.1f}s)")
+
+    def checkoutLines():
+        for user_index, book_index in checkoutPlan(n_users, n_books, n_checkouts):
+            days_ago = rng.randint(32, 180) if rng.random() < overdue_fraction else rng.randint(0, 27)
+            yield f"{studentId(user_index)}\t{bookIsbn(book_index)}\t{time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(time.time() - days_ago * 86400))}\n"
+
+    copyRows(cursor, "user_book_checkouts (user_id, book_isbn_id, checkout_time)", checkoutLines())
+    print(f"user_book_checkouts: ~{n_checkouts} rows ({time.monotonic() - started:.1f}s)")
+
+    # books_overdue via the server's own (set-based) reconcile + fresh planner statistics
+    reconcileAllOverdueBooks(cursor)
+    conn.commit()
+
+    conn.autocommit = True
+    cursor.execute("VACUUM ANALYZE books, users, user_book_checkouts;")
+    conn.autocommit = False
+    print(f"Done in {time.monotonic() - started:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load a synthetic large library into a local Postgres.")
+    parser.add_argument("--dsn", required=True, help="Target database (never point this at production!)")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--checkouts", type=int, default=500_000)
+    parser.add_argument("--overdue-fraction", type=float, default=0.05, help="Fraction of checkouts older than 1 month")
+    parser.add_argument("--inactive-fraction", type=float, default=0.02, help="Fraction of students awaiting approval")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="Cost of the shared password hash (login benchmark cost)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="TRUNCATE users, books and checkouts first")
+    args = parser.parse_args(argv)
+
+    if args.users < 1 or args.books < 1 or args.checkouts < 0:
+        parser.error("--users and --books must be >= 1, --checkouts >= 0")
+
+    conn = psycopg2.connect(args.dsn)
+    try:
+        migrate(conn)
+        generate(conn, args.users, args.books, args.checkouts, args.overdue_fraction, args.inactive_fraction, args.bcrypt_rounds, args.seed, args.reset)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
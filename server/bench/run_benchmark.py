@@ -0,0 +1,420 @@
+# Load-test | scripted workloads against every route in server.py, w/ N concurrent clients for a fixed duration
+#
+#   1. python -m bench.generate_data --dsn ... --users 100000 --books 20000 --checkouts 500000 --reset
+#   2. EXPOSE_SQL_STATEMENT_COUNT=True LOGIN_IP_RATE_PER_MINUTE=0 flask run   (or gunicorn ... | the header is what
+#      'sql_statements' is measured from | every bench client shares 1 IP -> the per-IP log-in limit is turned off)
+#   3. python -m bench.run_benchmark --base-url http://127.0.0.1:5000 --users 100000 --books 20000 \
+#          --duration 60 --concurrency 16 --out results.json [--compare baseline.json]
+#
+# -> Reports per workload: requests, errors, throughput, p50/p95/p99 latency (ms), mean/max SQL statements per request
+# -> '--compare' diffs against a previous results-file, and exits 1 if a workload's p95 (or statements/request) regressed
+#    by more than '--max-regression' (i.e. usable as a CI / pre-merge check)
+# -> stdlib only (http.client keep-alive connection per client thread) -> no extra dependencies
+
+import argparse
+import http.client
+import json
+import platform
+import random
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.dataset import BENCH_LIBRARIAN_COUNT, BENCH_PASSWORD, authorName, bookIsbn, librarianId, librarianName, scratchIsbn, studentId, studentName
+
+RESULTS_FORMAT_VERSION = 1
+SESSION_STUDENTS_PER_CLIENT = 20 # Students each client logs in as up-front (borrow/return only works as the token's own user)
+
+WORKLOADS = {} # name : (weight, run(client, ctx, rng)) | weight === relative share of the 'mixed' traffic
+
+def workload(name, weight):
+    def register(run):
+        WORKLOADS[name] = (weight, run)
+        return run
+    return register
+
+
+class WorkloadStats:
+
+    def __init__(self):
+        self.latencies = [] # seconds
+        self.statements = []
+        self.status_counts = {}
+        self.errors = 0
+
+    def record(self, latency, status, statements):
+        self.latencies.append(latency)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if statements is not None:
+            self.statements.append(statements)
+        if status == 0 or status >= 500:
+            self.errors += 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.statements.extend(other.statements)
+        self.errors += other.errors
+        for status, count in other.status_counts.items():
+            self.status_counts[status] = self.status_counts.get(status, 0) + count
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest-rank
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(stats, elapsed):
+    latencies = sorted(stats.latencies)
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)
+
+    return {
+        "requests": len(latencies),
+        "errors": stats.errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "mean": to_ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": to_ms(percentile(latencies, 0.50)),
+            "p95": to_ms(percentile(latencies, 0.95)),
+            "p99": to_ms(percentile(latencies, 0.99)),
+            "max": to_ms(latencies[-1]) if latencies else None,
+        },
+        "sql_statements": {
+            "mean": round(sum(stats.statements) / len(stats.statements), 2) if stats.statements else None,
+            "max": max(stats.statements) if stats.statements else None,
+        },
+        "status_counts": {str(status): count for status, count in sorted(stats.status_counts.items())},
+    }
+
+
+# 1 keep-alive connection per client-thread | every request is timed + attributed to the workload currently running
+class BenchClient:
+
+    def __init__(self, base_url, timeout):
+        parsed = urllib.parse.urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self._connect = lambda: connection_class(parsed.hostname, parsed.port, timeout=timeout)
+        self._prefix = parsed.path.rstrip("/")
+        self._conn = self._connect()
+        self.stats = {} # workload name : WorkloadStats
+        self.current_workload = None
+        self.librarian_token = None
+        self.student_sessions = [] # [(user_id, token), ...]
+
+    def request(self, method, path, params=None, body=None, raw_body=None, content_type="application/json", headers=None):
+        url = self._prefix + path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+
+        request_headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode("utf-8")
+        elif raw_body is not None:
+            payload = raw_body.encode("utf-8") if isinstance(raw_body, str) else raw_body
+        if payload is not None:
+            request_headers["Content-Type"] = content_type
+
+        started = time.perf_counter()
+        try:
+            self._conn.request(method, url, body=payload, headers=request_headers)
+            response = self._conn.getresponse()
+            data = response.read() # Whole (streamed) body -> latency === time to the LAST byte
+            status = response.status
+            statements = response.getheader("X-SQL-Statements")
+        except (OSError, http.client.HTTPException):
+            self._conn.close()
+            self._conn = self._connect()
+            status, data, statements = 0, b"", None
+
+        latency = time.perf_counter() - started
+        self.stats.setdefault(self.current_workload, WorkloadStats()).record(latency, status, int(statements) if statements else None)
+
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    def close(self):
+        self._conn.close()
+
+    # Session setup (recorded under '(setup)', which the runner drops) | -> token or None (i.e. inactive account)
+    def login(self, user_id, user_name, role_id):
+        workload_name, self.current_workload = self.current_workload, "(setup)"
+        try:
+            status, body = self.request("POST", "/api/users", body={"role_id": role_id, "user_id": user_id, "user_name": user_name, "password": BENCH_PASSWORD})
+        finally:
+            self.current_workload = workload_name
+        return body.get("token") if status == 201 and body else None
+
+    def startSessions(self, client_index, ctx, rng):
+        librarian_index = client_index % BENCH_LIBRARIAN_COUNT
+        self.librarian_token = self.login(librarianId(librarian_index), librarianName(librarian_index), 1)
+
+        # Generated students are sometimes inactive (-> 403) -> bounded number of attempts
+        for _ in range(SESSION_STUDENTS_PER_CLIENT * 5):
+            if len(self.student_sessions) >= SESSION_STUDENTS_PER_CLIENT:
+                break
+            user_id, user_name = randomStudent(ctx, rng)
+            token = self.login(user_id, user_name, 2)
+            if token:
+                self.student_sessions.append((user_id, token))
+
+        if self.librarian_token is None or not self.student_sessions:
+            raise RuntimeError("Could not log in the benchmark's librarian/students (was bench.generate_data run against this server's database?)")
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+# ---- Workloads (1 call === 1 iteration, may issue several requests) ----
+
+def randomStudent(ctx, rng):
+    index = rng.randrange(ctx["users"])
+    return studentId(index), studentName(index)
+
+def studentSession(client, rng):
+    return rng.choice(client.student_sessions)
+
+@workload("login", weight=10)
+def loginWorkload(client, ctx, rng):
+    user_id, user_name = randomStudent(ctx, rng)
+    client.request("POST", "/api/users", body={"role_id": 2, "user_id": user_id, "user_name": user_name, "password": BENCH_PASSWORD})
+
+@workload("roles", weight=3)
+def rolesWorkload(client, ctx, rng):
+    client.request("GET", "/api/roles")
+
+# Sign-up form's availability check | half taken names (-> the index probe), half new ones (-> mostly the in-memory filter)
+@workload("username_available", weight=5)
+def usernameAvailableWorkload(client, ctx, rng):
+    user_name = randomStudent(ctx, rng)[1] if rng.random() < 0.5 else f"new-user-{rng.randrange(10**9)}"
+    client.request("GET", f"/api/users/usernames/{urllib.parse.quote(user_name, safe='')}/available")
+
+@workload("catalog_browse", weight=25)
+def catalogBrowseWorkload(client, ctx, rng):
+    # First page + follow 'next_cursor' a few pages deep (like scrolling the catalog)
+    _, token = studentSession(client, rng)
+    params = {"limit": 100, "sort": rng.choice(("book_isbn_id", "title"))}
+    for _ in range(rng.randint(1, 5)):
+        status, body = client.request("GET", "/api/books", params=params, headers=bearer(token))
+        if status != 200 or not body or not body.get("next_cursor"):
+            break
+        params["cursor"] = body["next_cursor"]
+
+@workload("catalog_filter", weight=10)
+def catalogFilterWorkload(client, ctx, rng):
+    _, token = studentSession(client, rng)
+    params = {"limit": 50, "author": authorName(rng.randrange(ctx["books"]))}
+    if rng.random() < 0.5:
+        params["available"] = "true"
+    if rng.random() < 0.5:
+        min_year = rng.randint(1850, 2000)
+        params.update({"min_year": min_year, "max_year": min_year + 20})
+    client.request("GET", "/api/books", params=params, headers=bearer(token))
+
+@workload("catalog_full", weight=1)
+def catalogFullWorkload(client, ctx, rng):
+    # The un-paginated listing the current client still uses (whole catalog in 1 response)
+    _, token = studentSession(client, rng)
+    client.request("GET", "/api/books", headers=bearer(token))
+
+@workload("borrow_return", weight=15)
+def borrowReturnWorkload(client, ctx, rng):
+    user_id, token = studentSession(client, rng)
+    book_isbn_id = bookIsbn(rng.randrange(ctx["books"]))
+    status, _ = client.request("PATCH", f"/api/users/{user_id}/borrow-book", body={"book_isbn_id": book_isbn_id}, headers=bearer(token))
+    if status == 200:
+        client.request("PATCH", f"/api/users/{user_id}/return-book", body={"book_isbn_id": book_isbn_id}, headers=bearer(token))
+
+@workload("borrow_return_batch", weight=5)
+def borrowReturnBatchWorkload(client, ctx, rng):
+    user_id, token = studentSession(client, rng)
+    book_isbn_ids = [bookIsbn(rng.randrange(ctx["books"])) for _ in range(5)]
+    status, body = client.request("PATCH", f"/api/users/{user_id}/borrow-books", body={"book_isbn_ids": book_isbn_ids}, headers=bearer(token))
+    borrowed = [result["book_isbn_id"] for result in (body or {}).get("results", []) if result["status"] == "borrowed"]
+    if status == 200 and borrowed:
+        client.request("PATCH", f"/api/users/{user_id}/return-books", body={"book_isbn_ids": borrowed}, headers=bearer(token))
+
+@workload("dashboard", weight=4)
+def dashboardWorkload(client, ctx, rng):
+    # Librarian dashboard filters (the unfiltered list is the whole users-table -> kept rare)
+    status = rng.choice(("needs-approval", "excessive-overdue", "needs-approval", "excessive-overdue", None))
+    client.request("GET", "/api/users", params={"status": status} if status else None, headers=bearer(client.librarian_token))
+
+@workload("dashboard_summary", weight=4)
+def dashboardSummaryWorkload(client, ctx, rng):
+    client.request("GET", "/api/users/summary", headers=bearer(client.librarian_token))
+
+@workload("update_active_status", weight=2)
+def updateActiveStatusWorkload(client, ctx, rng):
+    user_id, _ = randomStudent(ctx, rng)
+    client.request("PATCH", f"/api/{user_id}/update-active-status", body={"new_active_status": True}, headers=bearer(client.librarian_token))
+
+@workload("book_admin", weight=2)
+def bookAdminWorkload(client, ctx, rng):
+    # Insert -> update -> delete a scratch book (librarian)
+    book_isbn_id = scratchIsbn(rng.randrange(10**9))
+    headers = bearer(client.librarian_token)
+    client.request("POST", "/api/books", body={"book_isbn_id": book_isbn_id, "title": "Bench Scratch Book", "author": "Bench Admin",
+                                               "published_year": 2024, "total_book_count": 3, "available_count": 3}, headers=headers)
+    client.request("PATCH", f"/api/books/{book_isbn_id}", body={"title": "Bench Scratch Book (2nd edition)"}, headers=headers)
+    client.request("DELETE", f"/api/books/{book_isbn_id}", headers=headers)
+
+@workload("import", weight=1)
+def importWorkload(client, ctx, rng):
+    # Re-upserts the same 100 scratch books every time (i.e. measures the COPY + merge path, not table growth)
+    lines = (json.dumps({"book_isbn_id": scratchIsbn(index), "title": f"Bench Import {index}", "author": "Bench Importer",
+                         "published_year": 2000 + index % 25, "total_book_count": 5, "available_count": 5}) for index in range(100))
+    client.request("POST", "/api/books/import", params={"format": "ndjson"}, raw_body="\n".join(lines) + "\n", content_type="application/x-ndjson",
+                   headers=bearer(client.librarian_token))
+
+@workload("export", weight=1)
+def exportWorkload(client, ctx, rng):
+    client.request("GET", "/api/books/export", params={"format": rng.choice(("csv", "ndjson"))}, headers=bearer(client.librarian_token))
+
+@workload("permissions", weight=2)
+def permissionsWorkload(client, ctx, rng):
+    client.request("GET", "/api/permissions", headers=bearer(client.librarian_token))
+
+
+# ---- Runner ----
+
+def runClient(client_index, args, ctx, names, weights, deadline):
+    rng = random.Random(args.seed * 1_000_003 + client_index) # Same seed -> same request-sequence per client
+    client = BenchClient(args.base_url, args.timeout)
+    try:
+        client.startSessions(client_index, ctx, rng)
+        client.stats.pop("(setup)", None)
+
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            client.current_workload = name
+            WORKLOADS[name][1](client, ctx, rng)
+    finally:
+        client.close()
+    return client.stats
+
+def runBenchmark(args):
+    names = args.workloads or sorted(WORKLOADS)
+    weights = [WORKLOADS[name][0] for name in names]
+    ctx = {"users": args.users, "books": args.books}
+
+    # Warm-up (not recorded) -> pools, permission-index + plan caches are filled before measuring
+    if args.warmup > 0:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            deadline = time.monotonic() + args.warmup
+            list(executor.map(lambda index: runClient(index + 10_000, args, ctx, names, weights, deadline), range(args.concurrency)))
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        per_client_stats = list(executor.map(lambda index: runClient(index, args, ctx, names, weights, deadline), range(args.concurrency)))
+    elapsed = time.monotonic() - started
+
+    merged = {}
+    overall = WorkloadStats()
+    for client_stats in per_client_stats:
+        for name, stats in client_stats.items():
+            merged.setdefault(name, WorkloadStats()).merge(stats)
+            overall.merge(stats)
+
+    return {
+        "format_version": RESULTS_FORMAT_VERSION,
+        "metadata": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() - elapsed)),
+            "base_url": args.base_url,
+            "duration_s": round(elapsed, 2),
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "dataset": ctx,
+            "workloads": {name: WORKLOADS[name][0] for name in names},
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "label": args.label,
+        },
+        "overall": summarize(overall, elapsed),
+        "workloads": {name: summarize(stats, elapsed) for name, stats in sorted(merged.items())},
+    }
+
+
+def printReport(results):
+    print(f"{'workload':<22}{'reqs':>8}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'sql/req':>9}")
+    rows = list(results["workloads"].items()) + [("(overall)", results["overall"])]
+    for name, summary in rows:
+        latency = summary["latency_ms"]
+        statements = summary["sql_statements"]["mean"]
+        print(f"{name:<22}{summary['requests']:>8}{summary['errors']:>6}{summary['throughput_rps']:>9}"
+              f"{latency['p50'] or '-':>10}{latency['p95'] or '-':>10}{latency['p99'] or '-':>10}{statements if statements is not None else '-':>9}")
+
+# Returns the list of regressions (empty -> none) | only workloads present in BOTH runs w/ enough samples are compared
+def compareResults(baseline, current, max_regression, min_requests=50):
+    regressions = []
+
+    print(f"\n{'workload':<22}{'p95 before':>12}{'p95 after':>12}{'change':>9}{'sql before':>12}{'sql after':>11}")
+    for name, after in current["workloads"].items():
+        before = baseline.get("workloads", {}).get(name)
+        if before is None or before["requests"] < min_requests or after["requests"] < min_requests:
+            continue
+
+        p95_before, p95_after = before["latency_ms"]["p95"], after["latency_ms"]["p95"]
+        change = (p95_after - p95_before) / p95_before if p95_before else 0.0
+        sql_before, sql_after = before["sql_statements"]["mean"], after["sql_statements"]["mean"]
+        print(f"{name:<22}{p95_before:>12}{p95_after:>12}{change:>+9.1%}{sql_before if sql_before is not None else '-':>12}{sql_after if sql_after is not None else '-':>11}")
+
+        if change > max_regression:
+            regressions.append(f"{name}: p95 {p95_before}ms -> {p95_after}ms ({change:+.1%})")
+
+        # Statement counts are deterministic per route -> ANY increase (beyond noise from retries/branches) is a regression
+        if sql_before is not None and sql_after is not None and sql_after > sql_before * (1 + max_regression) + 0.5:
+            regressions.append(f"{name}: SQL statements/request {sql_before} -> {sql_after}")
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the library server (see bench/generate_data.py for the dataset).")
+    parser.add_argument("--base-url", default="http://127.0.0.1:5000")
+    parser.add_argument("--users", type=int, default=100_000, help="Must match generate_data's --users")
+    parser.add_argument("--books", type=int, default=20_000, help="Must match generate_data's --books")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Unrecorded seconds before measuring")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients (threads)")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout (seconds)")
+    parser.add_argument("--workload", dest="workloads", action="append", choices=sorted(WORKLOADS), help="Only run these (repeatable) | default: all, weighted")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--label", default=None, help="Free-form label stored in the results (i.e. the git commit)")
+    parser.add_argument("--out", default=None, help="Write results as JSON")
+    parser.add_argument("--compare", default=None, help="Baseline results-JSON to diff against")
+    parser.add_argument("--max-regression", type=float, default=0.20, help="Allowed p95 increase before failing (0.20 === +20%%)")
+    args = parser.parse_args(argv)
+
+    results = runBenchmark(args)
+    printReport(results)
+
+    if results["workloads"] and all(summary["sql_statements"]["mean"] is None for summary in results["workloads"].values()):
+        print("\n(no 'X-SQL-Statements' headers -> start the server w/ EXPOSE_SQL_STATEMENT_COUNT=True to measure statements/request)")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"\nResults written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+
+        regressions = compareResults(baseline, results, args.max_regression)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions.")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
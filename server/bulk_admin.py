@@ -0,0 +1,273 @@
+# Bulk librarian administration (approving a new intake, post-inventory count corrections) in constant round-trips
+# -> Users: activate/deactivate a list of user_ids, OR every user in a dashboard status ('needs-approval' |
+#    'excessive-overdue') -> ONE statement (UPDATE ... WHERE user_id = ANY(...)), deactivations revoke every token the
+#    users hold in the same statement (like PATCH /api/<user_id>/update-active-status does for 1 user)
+# -> Books: per-book patches (any of BOOK_PATCH_COLUMNS) -> validated + permission-checked per column in Python, then
+#    applied by ONE statement (the patches go in as 1 JSONB array) | items that fail validation/permissions are skipped
+#    (not fatal) + reported
+# -> Rows are locked in primary-key order (ORDER BY ... FOR UPDATE), so overlapping batches can't deadlock
+#    (same as circulation.py)
+# -> Results are reported per item, in request order (users: user_id order)
+#
+# NOTE: Renaming a book (new book_isbn_id) stays a single-book operation (PATCH /api/books/<book_isbn_id>)
+
+import json
+
+from queries import Query, runQuery
+
+MAX_BULK_USERS = 10_000
+MAX_BULK_BOOK_PATCHES = 1000
+BULK_USER_STATUSES = ("needs-approval", "excessive-overdue") # (NOT 'active' -> a librarian can't deactivate every account at once)
+
+BOOK_TEXT_COLUMNS = ("title", "author")
+BOOK_INT_COLUMNS = ("published_year", "total_book_count", "available_count")
+BOOK_PATCH_COLUMNS = BOOK_TEXT_COLUMNS + BOOK_INT_COLUMNS
+
+# Shared tail | 'locked' === the (locked) users to update -> the UPDATE, the token-revocations (deactivating only)
+_SET_ACTIVE_STATUS_TAIL = (
+    """
+        updated AS (
+            UPDATE users SET is_active_account = %(active)s
+            FROM locked
+            WHERE users.user_id = locked.user_id
+            RETURNING users.user_id
+        ), revoked AS (
+            INSERT INTO revoked_user_tokens (user_id, revoked_at)
+            SELECT user_id, now() FROM updated WHERE NOT %(active)s
+            ON CONFLICT (user_id) DO UPDATE SET revoked_at = EXCLUDED.revoked_at
+            RETURNING user_id, extract(epoch FROM revoked_at) AS revoked_at
+        )
+    """
+)
+
+SET_USERS_ACTIVE_STATUS_QUERY = (
+    f"""
+        WITH requested AS (
+            SELECT DISTINCT unnest(%(user_ids)s::TEXT[]) AS user_id
+        ), locked AS (
+            SELECT users.user_id
+            FROM users JOIN requested USING (user_id)
+            ORDER BY users.user_id
+            FOR UPDATE OF users
+        ), {_SET_ACTIVE_STATUS_TAIL.strip()}
+        SELECT requested.user_id, updated.user_id IS NOT NULL AS user_exists, revoked.revoked_at
+        FROM requested
+        LEFT JOIN updated USING (user_id)
+        LEFT JOIN revoked USING (user_id)
+        ORDER BY requested.user_id;
+    """
+)
+
+# By dashboard status | 'account_status' is the generated column (w/ a partial index per status, see migrations.py)
+SET_ACTIVE_STATUS_BY_ACCOUNT_STATUS_QUERY = (
+    f"""
+        WITH locked AS (
+            SELECT user_id
+            FROM users
+            WHERE account_status = %(status)s
+            ORDER BY user_id
+            FOR UPDATE
+        ), {_SET_ACTIVE_STATUS_TAIL.strip()}
+        SELECT updated.user_id, TRUE AS user_exists, revoked.revoked_at
+        FROM updated
+        LEFT JOIN revoked USING (user_id)
+        ORDER BY updated.user_id;
+    """
+)
+
+# patch ? 'column' -> the patched value | else the row's current one (read AFTER the lock -> concurrent borrows/returns
+# aren't overwritten by a stale available_count)
+def _patchedValue(column, sql_type=None):
+    value = f"(patches.patch->>'{column}')::{sql_type}" if sql_type else f"patches.patch->>'{column}'"
+    return f"CASE WHEN patches.patch ? '{column}' THEN {value} ELSE books.{column} END"
+
+_PATCHED_ASSIGNMENTS = ",\n                ".join(
+    f"{column} = {_patchedValue(column, 'INT' if column in BOOK_INT_COLUMNS else None)}" for column in BOOK_PATCH_COLUMNS
+)
+
+# Counts are checked against the row AS PATCHED (i.e. a lower total_book_count w/o a new available_count)
+# -> 'invalid_counts' for that book instead of failing the whole batch
+PATCH_BOOKS_QUERY = (
+    f"""
+        WITH patches AS (
+            SELECT p.position, p.patch->>'book_isbn_id' AS book_isbn_id, p.patch
+            FROM jsonb_array_elements(%(patches)s::JSONB) WITH ORDINALITY AS p(patch, position)
+        ), locked AS (
+            SELECT books.book_isbn_id
+            FROM books JOIN patches USING (book_isbn_id)
+            ORDER BY books.book_isbn_id
+            FOR UPDATE OF books
+        ), updated AS (
+            UPDATE books SET
+                {_PATCHED_ASSIGNMENTS}
+            FROM patches
+            WHERE books.book_isbn_id = patches.book_isbn_id
+              AND books.book_isbn_id IN (SELECT book_isbn_id FROM locked)
+              AND {_patchedValue('available_count', 'INT')} >= 0
+              AND {_patchedValue('available_count', 'INT')} <= {_patchedValue('total_book_count', 'INT')}
+            RETURNING books.book_isbn_id, books.title, books.author, books.published_year, books.total_book_count, books.available_count
+        )
+        SELECT
+            patches.book_isbn_id,
+            locked.book_isbn_id IS NOT NULL AS book_exists,
+            updated.title, updated.author, updated.published_year, updated.total_book_count, updated.available_count,
+            updated.book_isbn_id IS NOT NULL AS is_updated
+        FROM patches
+        LEFT JOIN locked USING (book_isbn_id)
+        LEFT JOIN updated USING (book_isbn_id)
+        ORDER BY patches.position;
+    """
+)
+
+
+# Prepared once per connection (see queries.py)
+SET_USERS_ACTIVE_STATUS = Query("set_users_active_status", SET_USERS_ACTIVE_STATUS_QUERY, {"user_ids": "TEXT[]", "active": "BOOLEAN"})
+SET_ACTIVE_STATUS_BY_ACCOUNT_STATUS = Query("set_active_status_by_account_status", SET_ACTIVE_STATUS_BY_ACCOUNT_STATUS_QUERY,
+                                            {"status": "TEXT", "active": "BOOLEAN"})
+PATCH_BOOKS = Query("patch_books", PATCH_BOOKS_QUERY, {"patches": "JSONB"})
+
+
+class InvalidBulkRequest(Exception):
+    pass
+
+
+# {"new_active_status": bool, "user_ids": [...]} | {"new_active_status": bool, "status": "needs-approval"}
+def parseActiveStatusRequest(body):
+    if not isinstance(body, dict):
+        raise InvalidBulkRequest("Request body must be a JSON object")
+
+    active = body.get("new_active_status")
+    if not isinstance(active, bool):
+        raise InvalidBulkRequest("'new_active_status' must be true or false")
+
+    user_ids = body.get("user_ids")
+    status = body.get("status")
+    if (user_ids is None) == (status is None):
+        raise InvalidBulkRequest("Provide exactly one of 'user_ids' or 'status'")
+
+    if status is not None:
+        if status not in BULK_USER_STATUSES:
+            raise InvalidBulkRequest(f"'status' must be one of {list(BULK_USER_STATUSES)}")
+        return {"active": active, "status": status}
+
+    if not isinstance(user_ids, list) or not user_ids:
+        raise InvalidBulkRequest("'user_ids' must be a non-empty list")
+    if len(user_ids) > MAX_BULK_USERS:
+        raise InvalidBulkRequest(f"At most {MAX_BULK_USERS} users per request")
+    if not all(isinstance(user_id, str) and user_id for user_id in user_ids):
+        raise InvalidBulkRequest("Every user_id must be a non-empty string")
+
+    return {"active": active, "user_ids": user_ids}
+
+# -> [{"user_id", "status": 'updated' | 'not_found'}, ...], [(user_id, revoked_at), ...] | caller commits/rolls back
+def setActiveStatus(cursor, bulk_request):
+    if "status" in bulk_request:
+        runQuery(cursor, SET_ACTIVE_STATUS_BY_ACCOUNT_STATUS, {"status": bulk_request["status"], "active": bulk_request["active"]})
+    else:
+        runQuery(cursor, SET_USERS_ACTIVE_STATUS, {"user_ids": bulk_request["user_ids"], "active": bulk_request["active"]})
+
+    results = []
+    revocations = []
+    for user_id, user_exists, revoked_at in cursor.fetchall():
+        results.append({"user_id": user_id, "status": "updated" if user_exists else "not_found"})
+        if revoked_at is not None:
+            revocations.append((user_id, float(revoked_at)))
+
+    return results, revocations
+
+
+def _invalid(book_isbn_id, position, error):
+    return {"book_isbn_id": book_isbn_id, "position": position, "status": "invalid", "error": error}
+
+# 1 patch -> {column: value} (validated) | raises InvalidBulkRequest w/ the reason
+def _validateBookPatch(patch):
+    changes = {}
+    for column, value in patch.items():
+        if column == "book_isbn_id":
+            continue
+        if column not in BOOK_PATCH_COLUMNS:
+            raise InvalidBulkRequest(f"'{column}' can't be patched in bulk (one of {list(BOOK_PATCH_COLUMNS)})")
+        if value is None:
+            continue
+
+        if column in BOOK_INT_COLUMNS:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise InvalidBulkRequest(f"'{column}' must be an integer")
+            if not -2**31 <= value < 2**31: # (INT column -> 1 out-of-range value would fail the whole statement)
+                raise InvalidBulkRequest(f"'{column}' is out of range")
+            if column != "published_year" and value < 0:
+                raise InvalidBulkRequest(f"'{column}' can't be negative")
+        elif not isinstance(value, str) or not value.strip():
+            raise InvalidBulkRequest(f"'{column}' must be a non-empty string")
+        else:
+            value = value.strip()
+
+        changes[column] = value
+
+    if not changes:
+        raise InvalidBulkRequest("No valid fields provided for update")
+    return changes
+
+# {"patches": [{"book_isbn_id": "...", "title": "...", ...}, ...]} -> (patches to apply, results for the rejected ones)
+# | is_column_allowed(column) -> the caller's UPDATE permission on that books-column
+def parseBookPatches(body, is_column_allowed):
+    if not isinstance(body, dict):
+        raise InvalidBulkRequest("Request body must be a JSON object")
+
+    patches = body.get("patches")
+    if not isinstance(patches, list) or not patches:
+        raise InvalidBulkRequest("'patches' must be a non-empty list")
+    if len(patches) > MAX_BULK_BOOK_PATCHES:
+        raise InvalidBulkRequest(f"At most {MAX_BULK_BOOK_PATCHES} books per request")
+
+    allowed = {column: is_column_allowed(column) for column in BOOK_PATCH_COLUMNS} # (1 permission check per column, not per item)
+
+    valid = []
+    rejected = []
+    seen = set()
+    for position, patch in enumerate(patches):
+        if not isinstance(patch, dict) or not isinstance(patch.get("book_isbn_id"), str) or not patch["book_isbn_id"]:
+            rejected.append(_invalid(None, position, "Every patch needs a 'book_isbn_id'"))
+            continue
+
+        book_isbn_id = patch["book_isbn_id"]
+        if book_isbn_id in seen:
+            rejected.append(_invalid(book_isbn_id, position, "Duplicate 'book_isbn_id' in this request"))
+            continue
+        seen.add(book_isbn_id)
+
+        try:
+            changes = _validateBookPatch(patch)
+        except InvalidBulkRequest as e:
+            rejected.append(_invalid(book_isbn_id, position, str(e)))
+            continue
+
+        forbidden = [column for column in changes if not allowed[column]]
+        if forbidden:
+            rejected.append({"book_isbn_id": book_isbn_id, "position": position, "status": "forbidden",
+                             "error": f"You are not permitted to update {forbidden}"})
+            continue
+
+        valid.append((position, book_isbn_id, changes))
+
+    return valid, rejected
+
+# -> [{"book_isbn_id", "position", "status": 'updated' | 'not_found' | 'invalid_counts', "book"?}, ...] | caller commits/rolls back
+def patchBooks(cursor, patches):
+    payload = json.dumps([dict(changes, book_isbn_id=book_isbn_id) for _, book_isbn_id, changes in patches])
+    runQuery(cursor, PATCH_BOOKS, {"patches": payload})
+
+    results = []
+    for (position, _, _), row in zip(patches, cursor.fetchall()):
+        book_isbn_id, book_exists, title, author, published_year, total_book_count, available_count, is_updated = row
+        if is_updated:
+            results.append({"book_isbn_id": book_isbn_id, "position": position, "status": "updated",
+                            "book": {"book_isbn_id": book_isbn_id, "title": title, "author": author, "published_year": published_year,
+                                     "total_book_count": total_book_count, "available_count": available_count}})
+        elif not book_exists:
+            results.append({"book_isbn_id": book_isbn_id, "position": position, "status": "not_found"})
+        else:
+            results.append({"book_isbn_id": book_isbn_id, "position": position, "status": "invalid_counts",
+                            "error": "'available_count' must be between 0 and 'total_book_count'"})
+
+    return results
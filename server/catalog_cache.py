@@ -0,0 +1,391 @@
+# Per-process, write-through cache of the 'books' catalog (keyed by ISBN)
+# -> GET /api/books is answered from memory (no row read from Postgres) whenever the cache holds EXACTLY the database's
+#    books-version the request's own connection sees (the 1-value read the ETag needs anyway, on a replica too: versions
+#    replicate w/ their rows) | any other version -> the database, as before
+# -> Kept current by NOTIFY 'catalog_rows': 1 per statement on books, w/ the changed rows + the books-version that statement
+#    bumped to (the books-version is now bumped by this trigger, see createCatalogRowNotifications) -> changes are applied
+#    in version order, so the cache's version always names exactly the rows it holds
+#    | a gap that doesn't fill (a lost NOTIFY) / a bulk change / a listener reconnect -> reload
+# -> Reload: 1 pass over 'books' in a REPEATABLE READ snapshot (the version is a row in that same snapshot -> the rows +
+#    the version read alongside them are consistent, w/o holding writers off)
+# -> Write-through: this process' own borrows/returns/patches/inserts/deletes go in right after their COMMIT, as the
+#    message their NOTIFY will carry (at the version their statement bumped to, read inside the writing transaction)
+#    -> applied in version order like any other (-> the cache is at that version at once) | the NOTIFY itself is dropped
+# -> Listing order (book_isbn_id / title) is taken from the database at load time (its collation, not Python's)
+#    -> an insert / rename / retitle leaves that order stale -> those listings use the database until the next reload
+# -> Filters are applied in memory | 'author' only for ASCII values (Python's + Postgres' lower() may disagree otherwise)
+#
+# NOTE: Only listings are answered from memory | borrow/return are decided by the database (circulation.py's conditional
+#       UPDATEs), never refused from here: the NOTIFY stream can be a few ms behind another process' commit
+
+import json
+import threading
+import time
+from operator import attrgetter
+
+from catalog_listing import BOOK_COLUMNS, SORT_KEYS, selectedColumns
+from instrumentation import Counter, timed
+
+CATALOG_ROWS_CHANNEL = "catalog_rows"
+MAX_ROWS_PER_NOTIFICATION = 40
+MAX_NOTIFY_PAYLOAD_BYTES = 7500 # (NOTIFY payloads are capped at 8000 bytes) | bigger statements send 'resync' instead
+
+CATALOG_CACHE_READS = Counter("catalog_cache_reads_total", "GET /api/books listings, by whether the in-memory catalog could answer them.")
+
+# Replaces the generic books version-triggers (data_versions.py): same bump + 'data_version_changed' NOTIFY, but the new
+# version goes out together w/ the rows it covers
+CREATE_NOTIFY_CATALOG_ROWS_FUNCTION = (
+    f"""
+        CREATE OR REPLACE FUNCTION notify_catalog_rows() RETURNS TRIGGER AS $$
+        DECLARE
+            row_count INT := 0;
+            deleted_count INT := 0;
+            changed JSONB;
+            deleted JSONB;
+            new_version BIGINT;
+            payload TEXT;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                SELECT count(*), jsonb_agg(book) INTO row_count, changed FROM (
+                    SELECT jsonb_build_array(book_isbn_id, title, author, published_year, total_book_count, available_count) AS book
+                    FROM new_rows
+                    LIMIT {MAX_ROWS_PER_NOTIFICATION + 1}
+                ) AS changed_books;
+            END IF;
+
+            IF TG_OP = 'UPDATE' THEN -- (ISBN changed -> the old one is gone)
+                SELECT count(*), jsonb_agg(o.book_isbn_id) INTO deleted_count, deleted FROM (
+                    SELECT o.book_isbn_id FROM old_rows o
+                    WHERE NOT EXISTS (SELECT 1 FROM new_rows n WHERE n.book_isbn_id = o.book_isbn_id)
+                    LIMIT {MAX_ROWS_PER_NOTIFICATION + 1}
+                ) AS o;
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT count(*), jsonb_agg(book_isbn_id) INTO deleted_count, deleted FROM (
+                    SELECT book_isbn_id FROM old_rows LIMIT {MAX_ROWS_PER_NOTIFICATION + 1}
+                ) AS removed;
+            END IF;
+
+            IF TG_OP <> 'TRUNCATE' AND row_count = 0 AND deleted_count = 0 THEN
+                RETURN NULL; -- Statement touched no rows -> no new version (like bump_data_version_if_changed)
+            END IF;
+
+            new_version := next_data_version('books');
+            PERFORM pg_notify('data_version_changed', 'books:' || new_version);
+
+            payload := jsonb_build_object('version', new_version, 'rows', coalesce(changed, '[]'::JSONB), 'deleted', coalesce(deleted, '[]'::JSONB))::TEXT;
+            IF TG_OP = 'TRUNCATE' OR row_count + deleted_count > {MAX_ROWS_PER_NOTIFICATION} OR octet_length(payload) > {MAX_NOTIFY_PAYLOAD_BYTES} THEN
+                payload := jsonb_build_object('version', new_version, 'resync', TRUE)::TEXT;
+            END IF;
+
+            PERFORM pg_notify('{CATALOG_ROWS_CHANNEL}', payload);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+)
+
+def _createStatementTriggers(cursor, table_name, prefix, function_name, events):
+    for event, referencing in events:
+        trigger_name = f"{prefix}_{event.lower()}_trigger"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON {table_name};")
+        cursor.execute(
+            f"""
+                CREATE TRIGGER {trigger_name}
+                AFTER {event} ON {table_name}
+                {f"REFERENCING {referencing}" if referencing else ""}
+                FOR EACH STATEMENT EXECUTE FUNCTION {function_name}();
+            """
+        )
+
+_TRANSITION_TABLES = (
+    ("INSERT", "NEW TABLE AS new_rows"),
+    ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ("DELETE", "OLD TABLE AS old_rows"),
+    ("TRUNCATE", None),
+)
+
+def createCatalogRowNotifications(cursor):
+    cursor.execute(CREATE_NOTIFY_CATALOG_ROWS_FUNCTION)
+    for event, _ in _TRANSITION_TABLES: # (the books-version stays -> ETags/versions keep counting from where they are)
+        cursor.execute(f"DROP TRIGGER IF EXISTS books_version_{event.lower()}_trigger ON books;")
+    _createStatementTriggers(cursor, "books", "books_catalog_rows", "notify_catalog_rows", _TRANSITION_TABLES)
+
+
+CATALOG_VERSION_QUERY = "SELECT COALESCE((SELECT version FROM data_versions WHERE table_name = 'books'), 0);"
+ALL_BOOKS_QUERY = f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY book_isbn_id;"
+TITLE_ORDER_QUERY = "SELECT book_isbn_id FROM books ORDER BY title, book_isbn_id;" # (ORDER BY === SORT_KEYS['title'])
+
+
+class CachedBook:
+
+    __slots__ = BOOK_COLUMNS + ("author_key",)
+
+    def __init__(self, book_isbn_id, title, author, published_year, total_book_count, available_count):
+        self.book_isbn_id = book_isbn_id
+        self.title = title
+        self.author = author
+        self.published_year = published_year
+        self.total_book_count = total_book_count
+        self.available_count = available_count
+        self.author_key = author.lower() if author.isascii() else None # ('author' filter | None -> never matched from memory)
+
+    def withAvailability(self, available_count):
+        return CachedBook(self.book_isbn_id, self.title, self.author, self.published_year, self.total_book_count, available_count)
+
+
+class _ListingOrder:
+    # 1 sort's order, as the database sorted it | keys: the sort-key tuple -> its position (for keyset cursors)
+
+    __slots__ = ("isbns", "positions")
+
+    def __init__(self, keys):
+        self.isbns = tuple(key[-1] for key in keys) # (every sort key ends w/ book_isbn_id)
+        self.positions = {key: position for position, key in enumerate(keys)}
+
+
+class CatalogCache:
+
+    def __init__(self, db_pool, stuck_after=1.0, max_pending=1000):
+        self.db_pool = db_pool
+        self.stuck_after = stuck_after # seconds | a version that hasn't arrived by then never will -> reload
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock() # Applying changes / swapping in a reload / a listing's snapshot of the rows
+        self._books = {} # book_isbn_id : CachedBook (CachedBooks are replaced, never mutated) | changed only under _lock
+        self._orders = {} # sort : _ListingOrder | a missing sort -> its order is stale
+        self._version = None # None until loaded (/ after a resync) -> every read goes to the database
+        self._pending = {} # version : NOTIFY message that arrived ahead of an earlier one
+        self._behind = None # (version seen in the database, since) -> stuck-detection
+        self._reload_thread = None
+        self._reload_requested = False
+
+    def ready(self):
+        return self._version is not None
+
+    # ---- Reload ----
+
+    def reload(self):
+        with timed("catalog_cache_reload"), self.db_pool.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;") # (1 snapshot for all 3)
+                    cursor.execute(CATALOG_VERSION_QUERY)
+                    version = cursor.fetchone()[0]
+                    cursor.execute(ALL_BOOKS_QUERY)
+                    books = {row[0]: CachedBook(*row) for row in cursor.fetchall()}
+                    cursor.execute(TITLE_ORDER_QUERY)
+                    title_order = [row[0] for row in cursor.fetchall()]
+            finally:
+                conn.rollback() # (Read-only)
+
+        orders = {
+            "book_isbn_id": _ListingOrder([(book_isbn_id,) for book_isbn_id in books]),
+            "title": _ListingOrder([(books[book_isbn_id].title, book_isbn_id) for book_isbn_id in title_order]),
+        }
+
+        with self._lock:
+            self._books, self._orders, self._version = books, orders, version
+            self._behind = None
+            self._drainPending() # NOTIFY's that arrived while loading (the ones the snapshot already has are dropped)
+
+    # Requested while a reload is already running -> 1 more pass after it
+    def scheduleReload(self):
+        with self._lock:
+            self._reload_requested = True
+            if self._reload_thread is not None:
+                return
+            self._reload_thread = threading.Thread(target=self._reloadInBackground, name="catalog-cache-reload", daemon=True)
+            self._reload_thread.start()
+
+    def _reloadInBackground(self):
+        while True:
+            with self._lock:
+                if not self._reload_requested:
+                    self._reload_thread = None
+                    return
+                self._reload_requested = False
+
+            try:
+                self.reload()
+            except Exception as e: # Not ready / behind until the next trigger -> only costs database reads
+                print(f"Catalog cache reload failed: {e}")
+                time.sleep(self.stuck_after)
+
+    # ---- Applying changes (caller holds self._lock) ----
+
+    def _putBook(self, book):
+        previous = self._books.get(book.book_isbn_id)
+        self._books[book.book_isbn_id] = book
+
+        if previous is None:
+            self._orders.clear() # New key -> both orders are missing it
+        elif previous.title != book.title:
+            self._orders.pop("title", None)
+
+    def _applyMessage(self, message):
+        for row in message["rows"]:
+            self._putBook(CachedBook(*row))
+        for book_isbn_id in message["deleted"]:
+            self._books.pop(book_isbn_id, None) # (Its order-key stays -> cursors past it still resolve, the row is skipped)
+        for book_isbn_id, available_count in message.get("availability", ()): # (Write-through only, see writeAvailability)
+            book = self._books.get(book_isbn_id)
+            if book is not None:
+                self._books[book_isbn_id] = book.withAvailability(available_count)
+
+    def _drainPending(self):
+        if self._version is None:
+            return
+
+        for version in [version for version in self._pending if version <= self._version]:
+            del self._pending[version]
+
+        while self._version + 1 in self._pending:
+            message = self._pending.pop(self._version + 1)
+            if message.get("resync"):
+                self._version = None
+                self._pending.clear()
+                self._reload_requested = True # (Picked up by scheduleReload() below, outside the lock)
+                return
+            self._applyMessage(message)
+            self._version += 1
+
+        if self._behind is not None and self._version >= self._behind[0]:
+            self._behind = None
+
+    # NotificationListener handler | None (i.e. (re)connected, may have missed NOTIFY's) -> reload
+    def onNotification(self, payload):
+        if payload is None:
+            with self._lock:
+                self._version = None
+                self._pending.clear()
+            self.scheduleReload()
+            return
+
+        message = json.loads(payload)
+        with self._lock:
+            self._pending[message["version"]] = message
+            self._drainPending()
+            needs_reload = self._reload_requested or (self._version is not None and len(self._pending) > self.max_pending)
+            if len(self._pending) > self.max_pending:
+                self._version = None
+                self._pending.clear()
+
+        if needs_reload or not self._orders and self._version is not None:
+            self.scheduleReload()
+
+    # ---- Write-through (after this process' own COMMIT) ----
+
+    # Inside the writing transaction, right after its 1 statement on books (+ before COMMIT): the books-version THAT
+    # statement bumped to (its data_versions row stays locked until COMMIT -> nobody else's bump can come in between)
+    # | None -> not loaded (nothing to write through)
+    def writtenVersion(self, cursor):
+        if self._version is None:
+            return None
+        cursor.execute(CATALOG_VERSION_QUERY)
+        return cursor.fetchone()[0]
+
+    # Queued as that version's message (-> applied in order, w/ the version) | its NOTIFY: dropped (/ replaces it if
+    # it arrives while a gap is still pending)
+    def _writeThrough(self, version, message):
+        if version is None:
+            return
+        with self._lock:
+            if self._version is None or version <= self._version or version in self._pending:
+                return
+            self._pending[version] = dict(message, version=version)
+            self._drainPending()
+            needs_reload = self._reload_requested or (self._version is not None and len(self._orders) < len(SORT_KEYS))
+
+        if needs_reload:
+            self.scheduleReload()
+
+    # Circulation changes ONLY available_count -> applied on top of the previous version's row
+    def writeAvailability(self, results, version):
+        availability = [(result["book_isbn_id"], result["available_count"]) for result in results if result.get("available_count") is not None]
+        if availability:
+            self._writeThrough(version, {"rows": [], "deleted": [], "availability": availability})
+
+    # rows: tuples in BOOK_COLUMNS-order === every row the statement changed, as it left them
+    def writeRows(self, rows, version, deleted=()):
+        if rows or deleted:
+            self._writeThrough(version, {"rows": list(rows), "deleted": list(deleted)})
+
+    # ---- Reads ----
+
+    # 'version' === the database's books-version right now | not at it for 'stuck_after' seconds -> reload
+    def isCurrent(self, version):
+        current = self._version
+        if current == version:
+            return True
+
+        if current is not None and version > current:
+            now = time.monotonic()
+            with self._lock:
+                if self._behind is None:
+                    self._behind = (version, now) # (Cleared once the cache reaches it, see _drainPending)
+                stuck = self._behind[1] + self.stuck_after < now
+                if stuck:
+                    self._behind = None
+            if stuck:
+                self.scheduleReload()
+        return False
+
+    # -> the listing's rows (selectedColumns-order, up to limit + 1 -> the encoder's look-ahead) | None -> ask the database
+    # -> rows of exactly 'version' (a page: built under the lock | the whole catalog: from a copy taken under it) ->
+    #    a change applied while the response streams never shows up in it
+    def listingRows(self, listing, version):
+        author = listing["author"]
+        if (author is not None and not author.isascii()) or not self.isCurrent(version):
+            CATALOG_CACHE_READS.inc(result="miss")
+            return None
+
+        with self._lock:
+            order = self._orders.get(listing["sort"])
+            position = -1
+            if order is not None and listing["after"] is not None:
+                position = order.positions.get(tuple(listing["after"])) # (None: a cursor from before a retitle/rename, or not one of ours)
+
+            if self._version != version or order is None or position is None:
+                rows = books = None
+            elif listing["limit"] is not None:
+                rows, books = list(self._iterRows(self._books, order.isbns[position + 1:], listing)), None
+            else:
+                rows, books = None, dict(self._books)
+
+        if rows is None and books is None: # -> the database's keyset scan
+            CATALOG_CACHE_READS.inc(result="miss")
+            return None
+
+        CATALOG_CACHE_READS.inc(result="hit")
+        return rows if rows is not None else self._iterRows(books, order.isbns[position + 1:], listing)
+
+    def _iterRows(self, books, isbns, listing):
+        columns = attrgetter(*selectedColumns(listing["fields"], listing["sort"]))
+        author_key = listing["author"].lower() if listing["author"] is not None else None
+        min_year, max_year = listing["min_year"], listing["max_year"]
+        wanted = listing["limit"] + 1 if listing["limit"] is not None else None
+
+        for book_isbn_id in isbns:
+            book = books.get(book_isbn_id)
+            if book is None:
+                continue
+            if author_key is not None and book.author_key != author_key:
+                continue
+            if min_year is not None and book.published_year < min_year:
+                continue
+            if max_year is not None and book.published_year > max_year:
+                continue
+            if listing["available_only"] and book.available_count <= 0:
+                continue
+
+            row = columns(book)
+            yield row if isinstance(row, tuple) else (row,) # (attrgetter w/ 1 name -> the bare value)
+
+            if wanted is not None:
+                wanted -= 1
+                if wanted == 0:
+                    return
+
+    def stats(self):
+        return {"ready": self.ready(), "books": len(self._books), "version": self._version or 0, "pending": len(self._pending)}
+
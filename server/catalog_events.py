@@ -0,0 +1,207 @@
+# Live catalog deltas (GET /api/books/events, Server-Sent Events)
+# -> Triggers on 'books' NOTIFY 'catalog_changes' once per STATEMENT w/ the rows whose availability changed
+#    (so every write path counts: borrow/return batches, PATCH, imports, even manual SQL)
+# -> ONE listener connection per process (pg_listener) hands every notification to the CatalogEventBroker,
+#    which fans it out to all connected SSE clients + keeps a ring-buffer of recent events for resuming
+#    (the browser's EventSource re-sends the last 'id:' it saw as the 'Last-Event-ID' header on reconnect)
+# -> Bytes sent are proportional to the CHANGES, not the catalog size | clients only refetch on a 'resync' event
+#
+# Event stream:
+#   id: <seq>  event: availability  data: {"seq": 42, "changes": [{"book_isbn_id", "available_count", "total_book_count"} | {"book_isbn_id", "deleted": true}, ...]}
+#   event: resync  data: {"reason": ...}  -> the client missed (or can't be sure it got) some changes -> refetch /api/books
+#
+# NOTE: Each connected client holds a worker thread for as long as it's connected -> size threads accordingly
+#       (i.e. gunicorn --threads), or cap w/ CATALOG_EVENTS_MAX_SUBSCRIBERS
+
+import collections
+import json
+import queue
+import threading
+import time
+
+CATALOG_CHANGES_CHANNEL = "catalog_changes"
+MAX_CHANGES_PER_NOTIFICATION = 100 # NOTIFY payloads are capped at 8000 bytes -> bigger statements (i.e. imports) send 'resync' instead
+
+CREATE_CATALOG_CHANGE_SEQUENCE = "CREATE SEQUENCE IF NOT EXISTS catalog_change_seq;"
+
+# 1 NOTIFY per statement | only rows whose available_count/total_book_count changed (or that were added/removed)
+CREATE_NOTIFY_CATALOG_CHANGES_FUNCTION = (
+    f"""
+        CREATE OR REPLACE FUNCTION notify_catalog_changes() RETURNS TRIGGER AS $$
+        DECLARE
+            change_count INT;
+            changes JSONB;
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                SELECT count(*), jsonb_agg(change) INTO change_count, changes FROM (
+                    SELECT jsonb_build_object('book_isbn_id', book_isbn_id, 'available_count', available_count, 'total_book_count', total_book_count) AS change
+                    FROM new_rows
+                    LIMIT {MAX_CHANGES_PER_NOTIFICATION + 1}
+                ) AS changed;
+
+            ELSIF TG_OP = 'UPDATE' THEN
+                SELECT count(*), jsonb_agg(change) INTO change_count, changes FROM (
+                    SELECT jsonb_build_object('book_isbn_id', n.book_isbn_id, 'available_count', n.available_count, 'total_book_count', n.total_book_count) AS change
+                    FROM new_rows n LEFT JOIN old_rows o ON o.book_isbn_id = n.book_isbn_id
+                    WHERE o.book_isbn_id IS NULL -- (ISBN changed -> 'new' book)
+                       OR o.available_count IS DISTINCT FROM n.available_count
+                       OR o.total_book_count IS DISTINCT FROM n.total_book_count
+                    UNION ALL
+                    SELECT jsonb_build_object('book_isbn_id', o.book_isbn_id, 'deleted', TRUE)
+                    FROM old_rows o
+                    WHERE NOT EXISTS (SELECT 1 FROM new_rows n WHERE n.book_isbn_id = o.book_isbn_id)
+                    LIMIT {MAX_CHANGES_PER_NOTIFICATION + 1}
+                ) AS changed;
+
+            ELSIF TG_OP = 'DELETE' THEN
+                SELECT count(*), jsonb_agg(change) INTO change_count, changes FROM (
+                    SELECT jsonb_build_object('book_isbn_id', book_isbn_id, 'deleted', TRUE) AS change
+                    FROM old_rows
+                    LIMIT {MAX_CHANGES_PER_NOTIFICATION + 1}
+                ) AS changed;
+
+            ELSE -- TRUNCATE
+                change_count := {MAX_CHANGES_PER_NOTIFICATION + 1};
+            END IF;
+
+            IF change_count = 0 THEN
+                RETURN NULL;
+            END IF;
+
+            IF change_count > {MAX_CHANGES_PER_NOTIFICATION} THEN
+                PERFORM pg_notify('{CATALOG_CHANGES_CHANNEL}', jsonb_build_object('seq', nextval('catalog_change_seq'), 'resync', TRUE)::TEXT);
+            ELSE
+                PERFORM pg_notify('{CATALOG_CHANGES_CHANNEL}', jsonb_build_object('seq', nextval('catalog_change_seq'), 'changes', changes)::TEXT);
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+)
+
+def createCatalogChangeNotifications(cursor):
+    cursor.execute(CREATE_CATALOG_CHANGE_SEQUENCE)
+    cursor.execute(CREATE_NOTIFY_CATALOG_CHANGES_FUNCTION)
+
+    # Transition tables -> 1 trigger per event (UPDATE gets both OLD + NEW, to only report what changed)
+    for event, referencing in (("INSERT", "NEW TABLE AS new_rows"), ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"), ("DELETE", "OLD TABLE AS old_rows")):
+        trigger_name = f"books_catalog_changes_{event.lower()}_trigger"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON books;")
+        cursor.execute(
+            f"""
+                CREATE TRIGGER {trigger_name}
+                AFTER {event} ON books
+                REFERENCING {referencing}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_changes();
+            """
+        )
+
+    cursor.execute("DROP TRIGGER IF EXISTS books_catalog_changes_truncate_trigger ON books;")
+    cursor.execute(
+        """
+            CREATE TRIGGER books_catalog_changes_truncate_trigger
+            AFTER TRUNCATE ON books
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_catalog_changes();
+        """
+    )
+
+
+def formatEvent(event_type, data, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class CatalogEventBroker:
+
+    def __init__(self, buffer_size=1000, max_subscribers=1000, subscriber_queue_size=1000, heartbeat_interval=15.0):
+        self.max_subscribers = max_subscribers
+        self.subscriber_queue_size = subscriber_queue_size
+        self.heartbeat_interval = heartbeat_interval
+
+        self._recent = collections.deque(maxlen=buffer_size) # [(event_id, formatted_event), ...] in delivery (=== commit) order
+        self._subscribers = set() # queue.Queue's
+        self._lock = threading.Lock()
+
+    def subscriberCount(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    # Called from the listener thread | payload === None -> the listener (re)connected, so notifications may have been lost
+    def onNotification(self, payload):
+        if payload is None:
+            with self._lock:
+                self._recent.clear() # Can't vouch for continuity anymore -> resuming from before this point === resync
+                subscribers = list(self._subscribers)
+            self._publish(subscribers, formatEvent("resync", json.dumps({"reason": "listener reconnected"})))
+            return
+
+        message = json.loads(payload)
+        event_id = str(message["seq"])
+
+        if message.get("resync"):
+            event = formatEvent("resync", json.dumps({"reason": "bulk change"}), event_id)
+        else:
+            event = formatEvent("availability", payload, event_id)
+
+        # Buffered + the live subscribers snapshotted under 1 lock (=== subscribe()'s) -> a subscriber gets each event
+        # exactly once: in its backlog (subscribed after this) or live (before)
+        with self._lock:
+            self._recent.append((event_id, event))
+            subscribers = list(self._subscribers)
+        self._publish(subscribers, event)
+
+    def _publish(self, subscribers, event):
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full: # Slow client -> drop it (its EventSource reconnects + resumes / resyncs)
+                self._unsubscribe(subscriber)
+                subscriber.overflowed = True
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    # Registers a subscriber + returns the events it missed since 'last_event_id' (or a resync if those aren't buffered anymore)
+    def subscribe(self, last_event_id=None):
+        subscriber = queue.Queue(maxsize=self.subscriber_queue_size)
+        subscriber.overflowed = False
+
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers()
+
+            backlog = []
+            if last_event_id:
+                ids = [event_id for event_id, _ in self._recent]
+                if last_event_id in ids:
+                    backlog = [event for _, event in list(self._recent)[ids.index(last_event_id) + 1:]]
+                else:
+                    backlog = [formatEvent("resync", json.dumps({"reason": "resume point no longer buffered"}))]
+
+            # Registered under the same lock as the backlog snapshot -> no event falls in between
+            self._subscribers.add(subscriber)
+
+        return subscriber, backlog
+
+    def stream(self, subscriber, backlog):
+        try:
+            yield "retry: 3000\n\n" # EventSource reconnect-delay (ms)
+            for event in backlog:
+                yield event
+
+            while not subscriber.overflowed:
+                try:
+                    yield subscriber.get(timeout=self.heartbeat_interval)
+                except queue.Empty:
+                    yield f": keep-alive {int(time.time())}\n\n" # Comment-line | keeps proxies from closing an idle stream
+
+        finally:
+            self._unsubscribe(subscriber) # Client disconnected (generator closed) or overflowed
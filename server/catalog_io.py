@@ -0,0 +1,220 @@
+# Bulk catalog import/export
+# -> Import: CSV or NDJSON rows are validated one-by-one (bad rows are reported w/ their line number, not fatal),
+#    the valid ones are streamed into a TEMP staging table through Postgres 'COPY ... FROM STDIN',
+#    then merged into 'books' with a single INSERT ... ON CONFLICT (upsert).
+#    => 3 statements total, no matter if it's 10 or 10^6 rows (vs. 1 INSERT round-trip per book).
+# -> Export: the catalog streamed back out (CSV or NDJSON) from a server-side cursor.
+
+import csv
+import io
+import json
+import uuid
+
+from catalog_listing import BOOK_COLUMNS, BOOK_LAYOUT
+
+IMPORT_FORMATS = ("csv", "ndjson")
+MAX_REPORTED_ERRORS = 1000 # Per-row errors past this are only counted (keeps the response bounded)
+EXPORT_ROWS_PER_CHUNK = 1000
+
+CREATE_IMPORT_STAGING_TABLE = (
+    """
+        CREATE TEMP TABLE IF NOT EXISTS books_import_staging (
+            line_number INT NOT NULL, -- last occurrence of an ISBN in the file wins
+            book_isbn_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            published_year INT NOT NULL,
+            total_book_count INT NOT NULL,
+            available_count INT NOT NULL
+        ) ON COMMIT DELETE ROWS; -- pooled connections are reused -> never leak staged rows into the next import
+    """
+)
+
+# Upsert from staging
+# -> NEW books take the file's available_count as-is
+# -> EXISTING books: title/author/year/total come from the file, but copies currently checked-out stay checked-out
+#    (available = new total - copies out), so a re-import never 'frees' borrowed copies
+MERGE_STAGED_BOOKS_QUERY = (
+    """
+        WITH merged AS (
+            INSERT INTO books (book_isbn_id, title, author, published_year, total_book_count, available_count)
+            SELECT DISTINCT ON (book_isbn_id)
+                book_isbn_id, title, author, published_year, total_book_count, available_count
+            FROM books_import_staging
+            ORDER BY book_isbn_id, line_number DESC
+            ON CONFLICT (book_isbn_id) DO UPDATE SET
+                title = EXCLUDED.title,
+                author = EXCLUDED.author,
+                published_year = EXCLUDED.published_year,
+                total_book_count = EXCLUDED.total_book_count,
+                available_count = GREATEST(EXCLUDED.total_book_count - (books.total_book_count - books.available_count), 0)
+            RETURNING (xmax = 0) AS inserted -- xmax == 0 -> freshly inserted row (else: updated)
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged;
+    """
+)
+
+
+class InvalidBookRecord(Exception):
+    pass
+
+
+def _requireInt(record, field):
+    value = record.get(field)
+    if isinstance(value, bool) or value is None or value == "":
+        raise InvalidBookRecord(f"'{field}' is required")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise InvalidBookRecord(f"'{field}' must be an integer")
+
+def _requireText(record, field):
+    value = record.get(field)
+    if value is None or not str(value).strip():
+        raise InvalidBookRecord(f"'{field}' is required")
+    return str(value).strip()
+
+# Shared w/ POST /api/books | returns the row as a tuple in BOOK_COLUMNS-order
+def validateBookRecord(record):
+    if not isinstance(record, dict):
+        raise InvalidBookRecord("Row must be an object")
+
+    book_isbn_id = _requireText(record, "book_isbn_id")
+    title = _requireText(record, "title")
+    author = _requireText(record, "author")
+    published_year = _requireInt(record, "published_year")
+    total_book_count = _requireInt(record, "total_book_count")
+    available_count = _requireInt(record, "available_count")
+
+    if total_book_count < 0:
+        raise InvalidBookRecord("'total_book_count' can't be negative")
+
+    if not 0 <= available_count <= total_book_count:
+        raise InvalidBookRecord("'available_count' must be between 0 and 'total_book_count'")
+
+    return (book_isbn_id, title, author, published_year, total_book_count, available_count)
+
+# Both parsers take an iterable of text lines, and yield (line_number, record | InvalidBookRecord)
+def parseCsvRecords(lines):
+    reader = csv.DictReader(lines)
+    missing_columns = set(BOOK_COLUMNS) - set(reader.fieldnames or [])
+    if missing_columns:
+        raise InvalidBookRecord(f"CSV header is missing column(s): {sorted(missing_columns)}")
+
+    return ((reader.line_num, record) for record in reader) # (Not a generator-function -> a bad header fails up-front)
+
+def parseNdjsonRecords(lines):
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, InvalidBookRecord(f"Invalid JSON: {e}")
+
+def parseRecords(lines, import_format):
+    if import_format == "csv":
+        return parseCsvRecords(lines)
+    if import_format == "ndjson":
+        return parseNdjsonRecords(lines)
+    raise InvalidBookRecord(f"'format' must be one of {list(IMPORT_FORMATS)}")
+
+
+# File-like (read()-able) view over a generator of bytes-chunks | lets COPY pull rows as we validate them,
+# instead of building the whole file in memory first
+class _IteratorReader(io.RawIOBase):
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+
+        size = min(len(target), len(self._buffer))
+        target[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def importBookRecords(conn, records):
+    report = {"received": 0, "valid": 0, "inserted": 0, "updated": 0, "failed": 0, "errors": []}
+
+    def stagedCsvChunks():
+        out = io.StringIO()
+        writer = csv.writer(out)
+
+        for line_number, record in records:
+            report["received"] += 1
+            try:
+                if isinstance(record, InvalidBookRecord):
+                    raise record
+                writer.writerow((line_number,) + validateBookRecord(record))
+                report["valid"] += 1
+            except InvalidBookRecord as e:
+                report["failed"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"line": line_number, "error": str(e)})
+
+            if out.tell() >= 64 * 1024:
+                yield out.getvalue().encode("utf-8")
+                out.seek(0)
+                out.truncate()
+
+        if out.tell():
+            yield out.getvalue().encode("utf-8")
+
+    cursor = conn.cursor()
+    cursor.execute(CREATE_IMPORT_STAGING_TABLE)
+    cursor.copy_expert(
+        f"COPY books_import_staging (line_number, {', '.join(BOOK_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+        _IteratorReader(stagedCsvChunks()),
+    )
+
+    if report["valid"]:
+        cursor.execute(MERGE_STAGED_BOOKS_QUERY)
+        report["inserted"], report["updated"] = cursor.fetchone()
+
+    return report # Caller commits (or rolls back) the whole import as 1 transaction
+
+def streamBookExport(conn, export_format):
+    # Named (server-side) cursor -> rows pulled EXPORT_ROWS_PER_CHUNK at a time
+    cursor = conn.cursor(name=f"books_export_{uuid.uuid4().hex}")
+    cursor.itersize = EXPORT_ROWS_PER_CHUNK
+    cursor.execute(f"SELECT {', '.join(BOOK_COLUMNS)} FROM books ORDER BY book_isbn_id;") # Eagerly (errors before the response starts)
+
+    return _encodeBookExport(cursor, export_format)
+
+def _encodeBookExport(cursor, export_format):
+    try:
+        out = io.StringIO()
+        writer = csv.writer(out) if export_format == "csv" else None
+        if writer:
+            writer.writerow(BOOK_COLUMNS)
+
+        while True:
+            rows = cursor.fetchmany(EXPORT_ROWS_PER_CHUNK)
+            if not rows:
+                break
+
+            if writer:
+                writer.writerows(rows)
+            else:
+                out.write(BOOK_LAYOUT.encodeNdjson(rows))
+
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+
+        if out.tell():
+            yield out.getvalue() # (Header-only export of an empty catalog)
+
+    finally:
+        cursor.close()
@@ -0,0 +1,212 @@
+# Keyset-paginated, filterable listing of the 'books' catalog, streamed out as JSON
+# -> Rows come from a SERVER-SIDE (named) cursor in 'itersize' batches, and are encoded + flushed in chunks,
+#    so neither the database driver nor Flask ever holds the full catalog in memory.
+# -> Pages (?limit= / ?cursor=) are small + bounded -> 1 prepared statement per query-shape instead (1 round-trip,
+#    vs. DECLARE + FETCH + CLOSE for a server-side cursor)
+#
+# Query params (GET /api/books):
+#   sort         'book_isbn_id' (default) | 'title'
+#   limit        page size (capped at MAX_PAGE_SIZE) | omitted -> the whole (filtered) catalog is streamed
+#   cursor       opaque 'next_cursor' token from the previous page
+#   author       case-insensitive exact match
+#   min_year / max_year   published_year range (inclusive)
+#   available    'true' -> only books with available_count > 0
+#   fields       comma-separated subset of BOOK_COLUMNS (i.e. 'book_isbn_id,title,available_count') | only those are SELECTed + sent
+
+import base64
+import binascii
+import functools
+import json
+import uuid
+
+from queries import Query, runQuery
+from serialization import RowLayout, parseFields, rowLayout
+
+BOOK_COLUMNS = ("book_isbn_id", "title", "author", "published_year", "total_book_count", "available_count")
+BOOK_LAYOUT = RowLayout(BOOK_COLUMNS) # For every 'SELECT <BOOK_COLUMNS> FROM books'
+
+# sort-param : keyset columns (always ends w/ the primary key, so the ordering is total -> no skipped/duplicated rows b/w pages)
+SORT_KEYS = {
+    "book_isbn_id": ("book_isbn_id",),
+    "title": ("title", "book_isbn_id"),
+}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+ROWS_PER_CHUNK = 200 # Rows JSON-encoded per yielded chunk of the streamed response
+
+
+class InvalidListingRequest(Exception):
+    pass
+
+
+def encodeCursor(sort, last_row_key):
+    payload = json.dumps([sort, list(last_row_key)], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+def decodeCursor(token, sort):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        cursor_sort, last_row_key = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, binascii.Error):
+        raise InvalidListingRequest("Invalid 'cursor'")
+
+    if cursor_sort != sort or not isinstance(last_row_key, list) or len(last_row_key) != len(SORT_KEYS[sort]):
+        raise InvalidListingRequest("'cursor' doesn't belong to this 'sort'")
+
+    return last_row_key
+
+def _parseInt(args, name):
+    value = args.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidListingRequest(f"'{name}' must be an integer")
+
+def parseListingArgs(args):
+    sort = args.get("sort", "book_isbn_id")
+    if sort not in SORT_KEYS:
+        raise InvalidListingRequest(f"'sort' must be one of {sorted(SORT_KEYS)}")
+
+    limit = _parseInt(args, "limit")
+    if limit is not None:
+        if limit < 1:
+            raise InvalidListingRequest("'limit' must be >= 1")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    cursor_token = args.get("cursor")
+    after = decodeCursor(cursor_token, sort) if cursor_token else None
+    if after is not None and limit is None:
+        limit = DEFAULT_PAGE_SIZE # Following a cursor === paginating
+
+    return {
+        "sort": sort,
+        "limit": limit,
+        "after": after,
+        "author": args.get("author") or None,
+        "min_year": _parseInt(args, "min_year"),
+        "max_year": _parseInt(args, "max_year"),
+        "available_only": args.get("available", "").lower() in ("true", "1", "yes"),
+        "fields": _parseFieldsArg(args),
+    }
+
+def _parseFieldsArg(args):
+    try:
+        return parseFields(args.get("fields"), BOOK_COLUMNS)
+    except ValueError as e:
+        raise InvalidListingRequest(str(e))
+
+# The projected fields + any sort-key column they left out (the next_cursor is built from those) | the extras come LAST,
+# so RowLayout(fields) simply doesn't emit them (zip stops at the shorter side)
+def selectedColumns(fields, sort):
+    return fields + tuple(column for column in SORT_KEYS[sort] if column not in fields)
+
+# 1 Query per shape (sort + which filters are present), built + registered once | the values are bound per request
+@functools.lru_cache(maxsize=None)
+def _listingQuery(sort, has_author, has_min_year, has_max_year, available_only, has_after, has_limit, fields=BOOK_COLUMNS):
+    sort_columns = SORT_KEYS[sort]
+    conditions = []
+    param_types = {}
+
+    if has_author:
+        conditions.append("lower(author) = lower(%(author)s)")
+        param_types["author"] = "TEXT"
+
+    if has_min_year:
+        conditions.append("published_year >= %(min_year)s")
+        param_types["min_year"] = "INT"
+
+    if has_max_year:
+        conditions.append("published_year <= %(max_year)s")
+        param_types["max_year"] = "INT"
+
+    if available_only:
+        conditions.append("available_count > 0")
+
+    # Keyset: (title, book_isbn_id) > (last_title, last_isbn) -> an index range-scan, no OFFSET
+    if has_after:
+        conditions.append(f"({', '.join(sort_columns)}) > ({', '.join(f'%(after_{i})s' for i in range(len(sort_columns)))})")
+        param_types.update((f"after_{i}", "TEXT") for i in range(len(sort_columns)))
+
+    query = f"SELECT {', '.join(selectedColumns(fields, sort))} FROM books"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {', '.join(sort_columns)}"
+
+    # Fetch 1 extra row -> tells us whether there's a next page (w/o a COUNT(*))
+    if has_limit:
+        query += " LIMIT %(limit)s"
+        param_types["limit"] = "INT"
+
+    shape = "".join("1" if flag else "0" for flag in (has_author, has_min_year, has_max_year, available_only, has_after, has_limit))
+    if fields != BOOK_COLUMNS:
+        shape += "_f" + "".join("1" if column in fields else "0" for column in BOOK_COLUMNS) # (1 statement per projection)
+    return Query(f"books_listing_{sort}_{shape}", query, param_types)
+
+def buildListingQuery(listing):
+    query = _listingQuery(listing["sort"], listing["author"] is not None, listing["min_year"] is not None, listing["max_year"] is not None,
+                          listing["available_only"], listing["after"] is not None, listing["limit"] is not None, listing["fields"])
+
+    params = {name: listing[name] for name in ("author", "min_year", "max_year") if listing[name] is not None}
+    if listing["after"] is not None:
+        params.update((f"after_{i}", value) for i, value in enumerate(listing["after"]))
+    if listing["limit"] is not None:
+        params["limit"] = listing["limit"] + 1
+
+    return query, params
+
+def streamBookListing(conn, listing, itersize=ROWS_PER_CHUNK):
+    query, params = buildListingQuery(listing)
+
+    # Executed eagerly (NOT inside the generator) -> a failing query surfaces as a normal error-response,
+    # before the streamed 200-response has started
+    if listing["limit"] is not None:
+        cursor = runQuery(conn.cursor(), query, params) # <= MAX_PAGE_SIZE + 1 rows -> client-side is fine
+    else:
+        # Named cursor === server-side cursor | rows are pulled 'itersize' at a time
+        cursor = conn.cursor(name=f"books_listing_{uuid.uuid4().hex}")
+        cursor.itersize = itersize
+        cursor.execute(query.sql, params)
+
+    return encodeBookListing(cursor, listing)
+
+# rows: a cursor (closed when done) or any iterable of rows in selectedColumns-order (i.e. from the catalog cache)
+def encodeBookListing(rows, listing):
+    selected = selectedColumns(listing["fields"], listing["sort"])
+    sort_indexes = [selected.index(column) for column in SORT_KEYS[listing["sort"]]]
+    layout = rowLayout(listing["fields"])
+    limit = listing["limit"]
+
+    try:
+        yield '{"books": ['
+
+        chunk = []
+        rows_sent = 0
+        last_row = None
+        has_more = False
+
+        for row in rows:
+            if limit is not None and rows_sent == limit:
+                has_more = True # The look-ahead row -> not sent
+                break
+
+            chunk.append(row)
+            last_row = row
+            rows_sent += 1
+
+            if len(chunk) == ROWS_PER_CHUNK:
+                yield ("," if rows_sent > ROWS_PER_CHUNK else "") + layout.encodeRows(chunk) # 1 encoder call per chunk
+                chunk = []
+
+        if chunk:
+            yield ("," if rows_sent > len(chunk) else "") + layout.encodeRows(chunk)
+
+        next_cursor = encodeCursor(listing["sort"], [last_row[i] for i in sort_indexes]) if has_more else None
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + "}"
+
+    finally:
+        close = getattr(rows, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,147 @@
+# Ranked search over title + author (GET /api/books/search?q=) | instead of shipping the whole catalog to every browser
+# -> books.search_vector: GENERATED tsvector (title weighted 'A', author 'B') w/ a GIN index | every word of 'q' must
+#    match, the LAST one as a prefix ('harry pot' -> 'harry' & 'pot':*) -> search-as-you-type
+#    ('simple' config: no stemming / stop-words -> works for author names + titles in any language | prefixes cover plurals)
+# -> pg_trgm GIN indexes on lower(title) / lower(author): typo-tolerant matches ('hary poter') via word-similarity (<%),
+#    for queries of >= MIN_TRIGRAM_QUERY_LENGTH characters (shorter ones have too few trigrams to mean anything)
+# -> Ranking: ts_rank_cd (weighted -> title hits beat author hits) + trigram word-similarity (-> closer spellings first)
+#    | ties -> book_isbn_id (stable pages)
+# -> Pages: ?limit= (<= MAX_SEARCH_PAGE_SIZE) + the opaque 'next_cursor' | at most MAX_SEARCH_RESULTS deep (ranked results
+#    that far down aren't worth reading -> refine the query instead)
+#
+# Query params: q (required), limit, cursor, fields (same as GET /api/books)
+
+import base64
+import binascii
+import functools
+import json
+import re
+
+from catalog_listing import BOOK_COLUMNS
+from queries import Query
+from serialization import parseFields
+
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+MAX_SEARCH_RESULTS = 1000
+MAX_QUERY_LENGTH = 200
+MAX_QUERY_TERMS = 8
+MIN_TRIGRAM_QUERY_LENGTH = 3
+
+_TERM_PATTERN = re.compile(r"\w+")
+
+CREATE_CATALOG_SEARCH = (
+    """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+        ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('simple'::regconfig, coalesce(author, '')), 'B')
+        ) STORED;
+
+        CREATE INDEX IF NOT EXISTS books_search_vector_idx ON books USING GIN (search_vector);
+        CREATE INDEX IF NOT EXISTS books_lower_title_trgm_idx ON books USING GIN (lower(title) gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS books_lower_author_trgm_idx ON books USING GIN (lower(author) gin_trgm_ops);
+    """
+)
+
+def createCatalogSearch(cursor):
+    cursor.execute(CREATE_CATALOG_SEARCH)
+
+
+class InvalidSearchRequest(Exception):
+    pass
+
+
+def _encodeSearchCursor(offset):
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode("utf-8")).decode("ascii").rstrip("=")
+
+def _decodeSearchCursor(token):
+    try:
+        offset = json.loads(base64.urlsafe_b64decode((token + "=" * (-len(token) % 4)).encode("ascii")))["offset"]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise InvalidSearchRequest("Invalid 'cursor'")
+    if not isinstance(offset, int) or not 0 <= offset < MAX_SEARCH_RESULTS:
+        raise InvalidSearchRequest("Invalid 'cursor'")
+    return offset
+
+# 'Harry  Pot' -> "harry & pot:*" | only \w-runs make it into the tsquery (-> no tsquery-syntax injection / syntax errors)
+def buildTsQuery(q):
+    terms = _TERM_PATTERN.findall(q.lower())[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return " & ".join(terms[:-1] + [terms[-1] + ":*"])
+
+def parseSearchArgs(args):
+    q = (args.get("q") or "").strip()
+    if not q:
+        raise InvalidSearchRequest("'q' is required")
+    if len(q) > MAX_QUERY_LENGTH:
+        raise InvalidSearchRequest(f"'q' must be at most {MAX_QUERY_LENGTH} characters")
+
+    tsquery = buildTsQuery(q)
+    if tsquery is None:
+        raise InvalidSearchRequest("'q' must contain at least 1 letter or digit")
+
+    try:
+        limit = int(args.get("limit") or DEFAULT_SEARCH_PAGE_SIZE)
+    except ValueError:
+        raise InvalidSearchRequest("'limit' must be an integer")
+    if limit < 1:
+        raise InvalidSearchRequest("'limit' must be >= 1")
+
+    cursor_token = args.get("cursor")
+    offset = _decodeSearchCursor(cursor_token) if cursor_token else 0
+
+    try:
+        fields = parseFields(args.get("fields"), BOOK_COLUMNS)
+    except ValueError as e:
+        raise InvalidSearchRequest(str(e))
+
+    return {
+        "q": " ".join(q.lower().split()),
+        "tsquery": tsquery,
+        "limit": min(limit, MAX_SEARCH_PAGE_SIZE, MAX_SEARCH_RESULTS - offset),
+        "offset": offset,
+        "fields": fields,
+    }
+
+# 1 Query per (projection, w/ or w/o the trigram matching) | '%%' === a literal '%' (the pg_trgm operator) for psycopg2
+@functools.lru_cache(maxsize=None)
+def _searchQuery(fields, typo_tolerant):
+    if typo_tolerant:
+        condition = "search_vector @@ to_tsquery('simple', %(tsquery)s) OR %(q)s <%% lower(title) OR %(q)s <%% lower(author)"
+        score = ("ts_rank_cd(search_vector, to_tsquery('simple', %(tsquery)s))"
+                 " + greatest(word_similarity(%(q)s, lower(title)), 0.5 * word_similarity(%(q)s, lower(author)))")
+        param_types = {"tsquery": "TEXT", "q": "TEXT", "limit": "INT", "offset": "INT"}
+    else:
+        condition = "search_vector @@ to_tsquery('simple', %(tsquery)s)"
+        score = "ts_rank_cd(search_vector, to_tsquery('simple', %(tsquery)s))"
+        param_types = {"tsquery": "TEXT", "limit": "INT", "offset": "INT"}
+
+    query = f"""
+        SELECT {', '.join(fields)}
+        FROM books
+        WHERE {condition}
+        ORDER BY {score} DESC, book_isbn_id
+        LIMIT %(limit)s OFFSET %(offset)s;
+    """
+
+    name = "books_search" + ("" if typo_tolerant else "_prefix")
+    if fields != BOOK_COLUMNS:
+        name += "_f" + "".join("1" if column in fields else "0" for column in BOOK_COLUMNS)
+    return Query(name, query, param_types)
+
+# -> (Query, params) | 1 extra row is fetched -> tells whether there's a next page
+def buildSearchQuery(search):
+    typo_tolerant = len(search["q"]) >= MIN_TRIGRAM_QUERY_LENGTH
+    params = {"tsquery": search["tsquery"], "limit": search["limit"] + 1, "offset": search["offset"]}
+    if typo_tolerant:
+        params["q"] = search["q"]
+    return _searchQuery(search["fields"], typo_tolerant), params
+
+def nextSearchCursor(search, rows_fetched):
+    next_offset = search["offset"] + search["limit"]
+    if rows_fetched <= search["limit"] or next_offset >= MAX_SEARCH_RESULTS:
+        return None
+    return _encodeSearchCursor(next_offset)
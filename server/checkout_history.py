@@ -0,0 +1,272 @@
+# Circulation history + rollups
+# -> Returns MOVE the loan from 'user_book_checkouts' (hot, current loans only -> stays small) into 'checkout_history',
+#    in the same statement as the return itself (see circulation.RETURN_BOOKS_QUERY)
+# -> 'checkout_history' is RANGE-partitioned by month on returned_at | queries filtering on returned_at only touch the
+#    matching months (partition pruning), + retention === DROP TABLE of whole old months (no bulk DELETE / vacuum debt)
+# -> Rollups are maintained incrementally, never recomputed from raw history:
+#      circulation_daily      loans / returns / overdue returns per (day, book) | upserted by the borrow/return statements
+#      circulation_snapshots  active loans / active borrowers / overdue loans per day | upserted by the maintenance thread
+#    GET /api/analytics/circulation only ever reads these 2 tables
+#
+# Maintenance (1 process at a time, advisory lock): every CHECKOUT_HISTORY_MAINTENANCE_INTERVAL seconds
+#   -> partitions for the current + next HISTORY_PARTITIONS_AHEAD months exist (a DEFAULT partition catches anything else)
+#      | rows the DEFAULT partition already holds for a new month are moved into it (else it couldn't be created)
+#      + every other month found in the DEFAULT partition (i.e. maintenance was down across a month boundary) gets its
+#      partition too -> its rows are dropped w/ it once they expire
+#   -> months older than CHECKOUT_HISTORY_RETENTION_MONTHS are dropped
+#   -> today's snapshot is refreshed
+
+import datetime
+import re
+import threading
+
+from instrumentation import timed
+from overdue_engine import OVERDUE_PERIOD
+from queries import Query
+
+HISTORY_PARTITIONS_AHEAD = 3
+HISTORY_MAINTENANCE_LOCK_KEY = 720_302
+MAX_ANALYTICS_DAYS = 366
+
+HISTORY_PARTITION_NAME_PATTERN = re.compile(r"^checkout_history_y(\d{4})m(\d{2})$")
+
+CREATE_CHECKOUT_HISTORY_TABLE = (
+    """
+        CREATE TABLE IF NOT EXISTS checkout_history (
+            user_id TEXT NOT NULL,
+            book_isbn_id TEXT NOT NULL,
+            checkout_time TIMESTAMP NOT NULL,
+            returned_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            was_overdue BOOLEAN NOT NULL
+        ) PARTITION BY RANGE (returned_at);
+
+        CREATE TABLE IF NOT EXISTS checkout_history_default PARTITION OF checkout_history DEFAULT;
+
+        CREATE INDEX IF NOT EXISTS checkout_history_book_idx ON checkout_history (book_isbn_id, returned_at);
+        CREATE INDEX IF NOT EXISTS checkout_history_user_idx ON checkout_history (user_id, returned_at);
+    """
+)
+
+CREATE_CIRCULATION_ROLLUP_TABLES = (
+    """
+        CREATE TABLE IF NOT EXISTS circulation_daily (
+            day DATE NOT NULL,
+            book_isbn_id TEXT NOT NULL, -- (no FK: a removed book's history stays)
+            loans INT NOT NULL DEFAULT 0,
+            returns INT NOT NULL DEFAULT 0,
+            overdue_returns INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, book_isbn_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS circulation_snapshots (
+            day DATE PRIMARY KEY,
+            active_loans INT NOT NULL,
+            active_borrowers INT NOT NULL,
+            overdue_loans INT NOT NULL,
+            taken_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+)
+
+# Only the loans still open survived the old DELETE-on-return -> their checkout-days are all the history there is
+BACKFILL_CIRCULATION_DAILY_QUERY = (
+    """
+        INSERT INTO circulation_daily (day, book_isbn_id, loans)
+        SELECT checkout_time::DATE, book_isbn_id, count(*)
+        FROM user_book_checkouts
+        GROUP BY 1, 2
+        ON CONFLICT (day, book_isbn_id) DO NOTHING;
+    """
+)
+
+# 'Now' state of the (small) live table | the last refresh of a day wins
+UPSERT_TODAYS_SNAPSHOT_QUERY = (
+    f"""
+        INSERT INTO circulation_snapshots (day, active_loans, active_borrowers, overdue_loans, taken_at)
+        SELECT
+            CURRENT_DATE,
+            count(*),
+            count(DISTINCT user_id),
+            count(*) FILTER (WHERE checkout_time < NOW() - INTERVAL '{OVERDUE_PERIOD}'),
+            NOW()
+        FROM user_book_checkouts
+        ON CONFLICT (day) DO UPDATE SET
+            active_loans = EXCLUDED.active_loans,
+            active_borrowers = EXCLUDED.active_borrowers,
+            overdue_loans = EXCLUDED.overdue_loans,
+            taken_at = EXCLUDED.taken_at;
+    """
+)
+
+HISTORY_PARTITIONS_QUERY = (
+    """
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'checkout_history';
+    """
+)
+
+# Rows the DEFAULT partition caught for a month that has no partition (yet)
+STRAY_HISTORY_ROWS_QUERY = "SELECT EXISTS (SELECT 1 FROM checkout_history_default WHERE returned_at >= %s AND returned_at < %s);"
+DEFAULT_HISTORY_MONTHS_QUERY = "SELECT DISTINCT date_trunc('month', returned_at)::DATE FROM checkout_history_default;" # (normally empty)
+
+# Per-day rollups + snapshots for [from, to] | overdue_rate === overdue returns / returns
+CIRCULATION_DAILY = Query("circulation_daily",
+    """
+        WITH daily AS (
+            SELECT day, sum(loans) AS loans, sum(returns) AS returns, sum(overdue_returns) AS overdue_returns
+            FROM circulation_daily
+            WHERE day BETWEEN %(from_day)s AND %(to_day)s
+            GROUP BY day
+        )
+        SELECT
+            COALESCE(daily.day, snapshots.day) AS day,
+            COALESCE(daily.loans, 0),
+            COALESCE(daily.returns, 0),
+            COALESCE(daily.overdue_returns, 0),
+            snapshots.active_loans,
+            snapshots.active_borrowers,
+            snapshots.overdue_loans
+        FROM daily
+        FULL JOIN (SELECT * FROM circulation_snapshots WHERE day BETWEEN %(from_day)s AND %(to_day)s) AS snapshots USING (day)
+        ORDER BY 1;
+    """,
+    {"from_day": "DATE", "to_day": "DATE"},
+)
+
+CIRCULATION_TOP_BOOKS = Query("circulation_top_books",
+    """
+        SELECT totals.book_isbn_id, books.title, totals.loans
+        FROM (
+            SELECT book_isbn_id, sum(loans) AS loans
+            FROM circulation_daily
+            WHERE day BETWEEN %(from_day)s AND %(to_day)s
+            GROUP BY book_isbn_id
+            HAVING sum(loans) > 0
+            ORDER BY sum(loans) DESC, book_isbn_id
+            LIMIT %(top)s
+        ) AS totals
+        LEFT JOIN books USING (book_isbn_id)
+        ORDER BY totals.loans DESC, totals.book_isbn_id;
+    """,
+    {"from_day": "DATE", "to_day": "DATE", "top": "INT"},
+)
+
+
+def createCheckoutHistory(cursor, today=None):
+    cursor.execute(CREATE_CHECKOUT_HISTORY_TABLE)
+    cursor.execute(CREATE_CIRCULATION_ROLLUP_TABLES)
+    ensureHistoryPartitions(cursor, today)
+    cursor.execute(BACKFILL_CIRCULATION_DAILY_QUERY)
+
+
+def _monthStart(day, months_offset=0):
+    month_index = day.year * 12 + day.month - 1 + months_offset
+    return datetime.date(month_index // 12, month_index % 12 + 1, 1)
+
+def historyPartitionName(month_start):
+    return f"checkout_history_y{month_start.year:04d}m{month_start.month:02d}"
+
+def ensureHistoryPartitions(cursor, today=None, months_ahead=HISTORY_PARTITIONS_AHEAD):
+    today = today or datetime.date.today()
+    months = {_monthStart(today, offset) for offset in range(months_ahead + 1)}
+
+    cursor.execute(DEFAULT_HISTORY_MONTHS_QUERY)
+    months.update(month_start for (month_start,) in cursor.fetchall())
+
+    for month_start in sorted(months):
+        _createHistoryPartition(cursor, month_start)
+
+def _createHistoryPartition(cursor, month_start):
+    month_end = _monthStart(month_start, 1)
+    partition_name = historyPartitionName(month_start)
+    bounds = f"FROM ('{month_start.isoformat()}') TO ('{month_end.isoformat()}')"
+
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (partition_name,))
+    if cursor.fetchone()[0]:
+        return
+
+    # Writers to the DEFAULT partition wait (EXCLUSIVE) -> none of the month's rows can land there before the ATTACH
+    cursor.execute("LOCK TABLE checkout_history_default IN EXCLUSIVE MODE;")
+    cursor.execute(STRAY_HISTORY_ROWS_QUERY, (month_start, month_end,))
+    if not cursor.fetchone()[0]:
+        cursor.execute(f"CREATE TABLE {partition_name} PARTITION OF checkout_history FOR VALUES {bounds};")
+        return
+
+    # The DEFAULT partition holds rows of this month (i.e. it had no partition yet) -> move them into the new one first
+    cursor.execute(f"CREATE TABLE {partition_name} (LIKE checkout_history INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+    cursor.execute(
+        f"""
+            WITH moved AS (
+                DELETE FROM checkout_history_default WHERE returned_at >= %s AND returned_at < %s RETURNING *
+            )
+            INSERT INTO {partition_name} SELECT * FROM moved;
+        """,
+        (month_start, month_end,)
+    )
+    moved_count = cursor.rowcount
+    cursor.execute(f"ALTER TABLE checkout_history ATTACH PARTITION {partition_name} FOR VALUES {bounds};")
+    print(f"Moved {moved_count} checkout-history rows from the DEFAULT partition into {partition_name}")
+
+# -> names of the dropped partitions | only whole months entirely older than the retention window
+def dropExpiredHistoryPartitions(cursor, retention_months, today=None):
+    cutoff = _monthStart(today or datetime.date.today(), -retention_months)
+
+    cursor.execute(HISTORY_PARTITIONS_QUERY)
+    dropped = []
+    for (partition_name,) in cursor.fetchall():
+        match = HISTORY_PARTITION_NAME_PATTERN.match(partition_name)
+        if match and datetime.date(int(match.group(1)), int(match.group(2)), 1) < cutoff:
+            cursor.execute(f"DROP TABLE IF EXISTS {partition_name};")
+            dropped.append(partition_name)
+    return dropped
+
+# Returns False if another process holds the lock
+def runHistoryMaintenance(conn, retention_months):
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s);", (HISTORY_MAINTENANCE_LOCK_KEY,))
+    if not cursor.fetchone()[0]:
+        conn.rollback()
+        return False
+
+    # A failure here (-> logged) must not also cost the retention + today's snapshot
+    cursor.execute("SAVEPOINT history_partitions;")
+    try:
+        ensureHistoryPartitions(cursor)
+    except Exception as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT history_partitions;")
+        print(f"Creating checkout-history partitions failed: {e}")
+
+    if retention_months > 0:
+        for partition_name in dropExpiredHistoryPartitions(cursor, retention_months):
+            print(f"Dropped expired checkout-history partition {partition_name}")
+    cursor.execute(UPSERT_TODAYS_SNAPSHOT_QUERY)
+
+    conn.commit()
+    return True
+
+
+class HistoryMaintenanceScheduler(threading.Thread):
+
+    def __init__(self, db_pool, interval=3600.0, retention_months=24):
+        super().__init__(name="history-maintenance", daemon=True)
+        self.db_pool = db_pool
+        self.interval = interval
+        self.retention_months = retention_months
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                with timed("history_maintenance"), self.db_pool.connection() as conn:
+                    runHistoryMaintenance(conn, self.retention_months)
+            except Exception as e: # Keep going (i.e. database briefly unreachable)
+                print(f"Checkout-history maintenance failed: {e}")
+
+            self._stop_event.wait(self.interval)
@@ -0,0 +1,170 @@
+# Atomic (batched) borrow/return
+# -> ONE statement per batch: availability is changed by a conditional 'UPDATE ... WHERE available_count > 0 RETURNING',
+#    which re-checks the row AFTER taking its lock -> concurrent borrowers can never oversell the last copy
+#    (vs. the old 'SELECT available_count' -> INSERT -> UPDATE sequence, which raced between the check and the decrement).
+# -> Book rows are locked in book_isbn_id-order (ORDER BY ... FOR UPDATE), so two overlapping batches can't deadlock.
+# -> Results are reported per ISBN.
+# -> The same statement keeps the circulation rollups current + moves returned loans into checkout_history
+#    (see checkout_history.py) | rollup rows are upserted in book_isbn_id-order too
+
+from overdue_engine import OVERDUE_PERIOD
+from queries import Query, runQuery
+
+MAX_BATCH_SIZE = 50
+
+BORROW_BOOKS_QUERY = (
+    """
+        WITH requested AS (
+            SELECT DISTINCT unnest(%(book_isbn_ids)s::TEXT[]) AS book_isbn_id
+        ), already_borrowed AS (
+            SELECT ubc.book_isbn_id
+            FROM user_book_checkouts ubc JOIN requested USING (book_isbn_id)
+            WHERE ubc.user_id = %(user_id)s
+        ), locked AS (
+            SELECT books.book_isbn_id
+            FROM books JOIN requested USING (book_isbn_id)
+            WHERE books.available_count > 0
+              AND books.book_isbn_id NOT IN (SELECT book_isbn_id FROM already_borrowed)
+            ORDER BY books.book_isbn_id
+            FOR UPDATE OF books
+        ), decremented AS (
+            UPDATE books
+            SET available_count = books.available_count - 1
+            FROM locked
+            WHERE books.book_isbn_id = locked.book_isbn_id AND books.available_count > 0
+            RETURNING books.book_isbn_id, books.available_count
+        ), checked_out AS (
+            INSERT INTO user_book_checkouts (user_id, book_isbn_id, checkout_time)
+            SELECT %(user_id)s, book_isbn_id, NOW() FROM decremented
+            RETURNING book_isbn_id
+        ), loans_counted AS (
+            INSERT INTO circulation_daily (day, book_isbn_id, loans)
+            SELECT CURRENT_DATE, book_isbn_id, 1 FROM checked_out ORDER BY book_isbn_id
+            ON CONFLICT (day, book_isbn_id) DO UPDATE SET loans = circulation_daily.loans + EXCLUDED.loans
+        )
+        SELECT
+            requested.book_isbn_id,
+            decremented.available_count, -- NULL -> not borrowed
+            books.book_isbn_id IS NOT NULL AS book_exists,
+            requested.book_isbn_id IN (SELECT book_isbn_id FROM already_borrowed) AS is_already_borrowed
+        FROM requested
+        LEFT JOIN decremented USING (book_isbn_id)
+        LEFT JOIN books USING (book_isbn_id)
+        ORDER BY requested.book_isbn_id;
+    """
+)
+
+RETURN_BOOKS_QUERY = (
+    f"""
+        WITH requested AS (
+            SELECT DISTINCT unnest(%(book_isbn_ids)s::TEXT[]) AS book_isbn_id
+        ), returned AS (
+            DELETE FROM user_book_checkouts ubc
+            USING requested
+            WHERE ubc.user_id = %(user_id)s AND ubc.book_isbn_id = requested.book_isbn_id
+            RETURNING ubc.user_id, ubc.book_isbn_id, ubc.checkout_time, COALESCE(ubc.checkout_time < NOW() - INTERVAL '{OVERDUE_PERIOD}', FALSE) AS was_overdue
+        ), archived AS (
+            INSERT INTO checkout_history (user_id, book_isbn_id, checkout_time, returned_at, was_overdue)
+            SELECT user_id, book_isbn_id, COALESCE(checkout_time, NOW()), NOW(), was_overdue FROM returned
+        ), returns_counted AS (
+            INSERT INTO circulation_daily (day, book_isbn_id, returns, overdue_returns)
+            SELECT CURRENT_DATE, book_isbn_id, 1, CASE WHEN was_overdue THEN 1 ELSE 0 END FROM returned ORDER BY book_isbn_id
+            ON CONFLICT (day, book_isbn_id) DO UPDATE SET
+                returns = circulation_daily.returns + EXCLUDED.returns,
+                overdue_returns = circulation_daily.overdue_returns + EXCLUDED.overdue_returns
+        ), locked AS (
+            SELECT books.book_isbn_id
+            FROM books JOIN returned USING (book_isbn_id)
+            ORDER BY books.book_isbn_id
+            FOR UPDATE OF books
+        ), incremented AS (
+            UPDATE books
+            SET available_count = books.available_count + 1
+            FROM locked
+            WHERE books.book_isbn_id = locked.book_isbn_id
+            RETURNING books.book_isbn_id, books.available_count
+        ), overdue_cleared AS (
+            -- Returned books are no longer overdue (keeps the rest of books_overdue in order)
+            UPDATE users
+            SET books_overdue = ARRAY(
+                SELECT overdue.isbn
+                FROM unnest(users.books_overdue) WITH ORDINALITY AS overdue(isbn, position)
+                WHERE overdue.isbn NOT IN (SELECT book_isbn_id FROM returned)
+                ORDER BY overdue.position
+            )
+            WHERE users.user_id = %(user_id)s AND users.books_overdue && ARRAY(SELECT book_isbn_id FROM returned)
+        )
+        SELECT
+            requested.book_isbn_id,
+            incremented.available_count, -- NULL -> not returned
+            books.book_isbn_id IS NOT NULL AS book_exists
+        FROM requested
+        LEFT JOIN incremented USING (book_isbn_id)
+        LEFT JOIN books USING (book_isbn_id)
+        ORDER BY requested.book_isbn_id;
+    """
+)
+
+
+# Prepared once per connection (see queries.py)
+BORROW_BOOKS = Query("borrow_books", BORROW_BOOKS_QUERY, {"book_isbn_ids": "TEXT[]", "user_id": "TEXT"})
+RETURN_BOOKS = Query("return_books", RETURN_BOOKS_QUERY, {"book_isbn_ids": "TEXT[]", "user_id": "TEXT"})
+BOOK_CHECKED_OUT = Query("book_checked_out", "SELECT EXISTS (SELECT 1 FROM user_book_checkouts WHERE book_isbn_id = %(book_isbn_id)s);",
+                         {"book_isbn_id": "TEXT"}) # (user_book_checkouts_book_isbn_idx)
+
+
+class InvalidBatchRequest(Exception):
+    pass
+
+
+def parseBookIsbnIds(value):
+    if not isinstance(value, list) or not value:
+        raise InvalidBatchRequest("'book_isbn_ids' must be a non-empty list")
+
+    if len(value) > MAX_BATCH_SIZE:
+        raise InvalidBatchRequest(f"At most {MAX_BATCH_SIZE} books per request")
+
+    if not all(isinstance(book_isbn_id, str) and book_isbn_id for book_isbn_id in value):
+        raise InvalidBatchRequest("Every ISBN must be a non-empty string")
+
+    return value
+
+# Both return [{"book_isbn_id", "status", "available_count"}, ...] | caller commits/rolls back
+def borrowBooks(cursor, user_id, book_isbn_ids):
+    runQuery(cursor, BORROW_BOOKS, {"user_id": user_id, "book_isbn_ids": book_isbn_ids})
+
+    results = []
+    for book_isbn_id, available_count, book_exists, is_already_borrowed in cursor.fetchall():
+        if available_count is not None:
+            status = "borrowed"
+        elif not book_exists:
+            status = "not_found"
+        elif is_already_borrowed:
+            status = "already_borrowed"
+        else:
+            status = "unavailable"
+
+        results.append({"book_isbn_id": book_isbn_id, "status": status, "available_count": available_count})
+
+    return results
+
+def returnBooks(cursor, user_id, book_isbn_ids):
+    runQuery(cursor, RETURN_BOOKS, {"user_id": user_id, "book_isbn_ids": book_isbn_ids})
+
+    results = []
+    for book_isbn_id, available_count, book_exists in cursor.fetchall():
+        if available_count is not None:
+            status = "returned"
+        elif not book_exists:
+            status = "not_found"
+        else:
+            status = "not_borrowed"
+
+        results.append({"book_isbn_id": book_isbn_id, "status": status, "available_count": available_count})
+
+    return results
+
+# Any copy of this book still borrowed? (i.e. before deleting it)
+def isBookCheckedOut(cursor, book_isbn_id):
+    runQuery(cursor, BOOK_CHECKED_OUT, {"book_isbn_id": book_isbn_id})
+    return cursor.fetchone()[0]
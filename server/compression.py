@@ -0,0 +1,222 @@
+# Negotiated response compression (brotli > gzip > none, per the Accept-Encoding header) for the JSON / NDJSON / CSV responses
+# -> Bodies under COMPRESSION_MIN_BYTES go out as-is (the framing + CPU would outweigh the savings)
+# -> Streamed bodies (the full-catalog listing, exports) are compressed chunk-by-chunk + flushed after every chunk ->
+#    the client still gets rows while the database is streaming them
+# -> Precompressed cache: compressed 200-responses w/ an ETag (=== table-versions + the exact url, see data_versions) are
+#    kept, LRU, up to COMPRESSION_CACHE_BYTES per process | the SAME request while the tables are unchanged is answered
+#    from it (see cachedResponse) -> no query, no JSON-encoding, no compression
+# -> brotli only if installed ('pip install brotli'), like orjson | gzip (stdlib) otherwise
+#
+# NOTE: A compressed body gets a WEAK ETag (W/"...") -> it still matches If-None-Match (weak comparison) for 304's,
+#       but caches won't treat it as byte-identical to the uncompressed one
+
+import collections
+import os
+import threading
+import zlib
+
+from flask import Response, request
+
+from instrumentation import Counter, Gauge, METRICS
+
+try:
+    import brotli
+except ImportError: # Optional dependency
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"} # (NOT text/event-stream)
+
+COMPRESSED_BYTES = Counter("response_compression_bytes_total", "Response body bytes before ('raw') and after ('sent') compression, by encoding.")
+RESPONSE_CACHE_LOOKUPS = Counter("response_cache_lookups_total", "Precompressed-response cache lookups, by result.")
+
+
+class _GzipStream:
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # 31 -> gzip header/trailer
+
+    def compress(self, data):
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliStream:
+
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ResponseCompressor:
+
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=5, cache_bytes=32 * 1024 * 1024):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_bytes = cache_bytes # 0 -> no precompressed cache
+        self.max_entry_bytes = cache_bytes // 8 # (1 huge export can't flush everything else out)
+
+        self._lock = threading.Lock()
+        self._cache = collections.OrderedDict() # (etag, encoding) : (mimetype, body)
+        self._cached_bytes = 0
+
+    # -> 'br' | 'gzip' | None, for the current request
+    def negotiate(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted.quality("br") > 0:
+            return "br"
+        if accepted.quality("gzip") > 0:
+            return "gzip"
+        return None
+
+    def _stream(self, encoding):
+        return _BrotliStream(self.brotli_quality) if encoding == "br" else _GzipStream(self.gzip_level)
+
+    # ---- Precompressed cache ----
+
+    # The stored (compressed) copy of the response for 'etag', if the client accepts its encoding | None -> build it
+    def cachedResponse(self, etag):
+        if not self.cache_bytes:
+            return None
+        encoding = self.negotiate()
+        if encoding is None:
+            return None
+
+        key = (etag, encoding)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+
+        RESPONSE_CACHE_LOOKUPS.inc(result="hit" if entry is not None else "miss")
+        if entry is None:
+            return None
+
+        mimetype, body = entry
+        response = Response(body, status=200, mimetype=mimetype)
+        response.headers["Content-Encoding"] = encoding
+        response.vary.add("Accept-Encoding")
+        return response
+
+    def _store(self, etag, encoding, mimetype, body):
+        if not self.cache_bytes or len(body) > self.max_entry_bytes:
+            return
+
+        key = (etag, encoding)
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cached_bytes -= len(previous[1])
+            self._cache[key] = (mimetype, body)
+            self._cached_bytes += len(body)
+
+            while self._cached_bytes > self.cache_bytes:
+                _, (_, evicted_body) = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted_body)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._cache), "bytes": self._cached_bytes}
+
+    # ---- after_request ----
+
+    def compress(self, response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES or response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        response.vary.add("Accept-Encoding")
+
+        # Already encoded (i.e. served from the precompressed cache) | files sent w/ send_file() -> as-is
+        if "Content-Encoding" in response.headers or response.direct_passthrough:
+            self._weakenEtag(response)
+            return response
+
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        etag, _ = response.get_etag()
+        cache_etag = etag if response.status_code == 200 else None
+
+        if response.is_streamed:
+            response.response = self._compressChunks(response.response, encoding, cache_etag, response.mimetype)
+            response.headers.pop("Content-Length", None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_bytes:
+                return response
+
+            stream = self._stream(encoding)
+            compressed = stream.compress(body) + stream.finish()
+            COMPRESSED_BYTES.inc(len(body), encoding=encoding, stage="raw")
+            COMPRESSED_BYTES.inc(len(compressed), encoding=encoding, stage="sent")
+            response.set_data(compressed)
+            if cache_etag:
+                self._store(cache_etag, encoding, response.mimetype, compressed)
+
+        response.headers["Content-Encoding"] = encoding
+        self._weakenEtag(response)
+        return response
+
+    # Compressed chunk per chunk | a stream that ran to the end (+ fits) is stored for the next identical request
+    def _compressChunks(self, chunks, encoding, cache_etag, mimetype):
+        stream = self._stream(encoding)
+        kept = [] if cache_etag and self.cache_bytes else None
+        kept_size = raw_size = sent_size = 0
+
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                data = stream.compress(chunk)
+                raw_size += len(chunk)
+                sent_size += len(data)
+
+                if kept is not None:
+                    kept.append(data)
+                    kept_size += len(data)
+                    if kept_size > self.max_entry_bytes:
+                        kept = None
+                if data:
+                    yield data
+
+            data = stream.finish()
+            sent_size += len(data)
+            if kept is not None: # (Stored BEFORE the last yield -> the client hanging up right after it can't skip this)
+                kept.append(data)
+                self._store(cache_etag, encoding, mimetype, b"".join(kept))
+            yield data
+        finally:
+            COMPRESSED_BYTES.inc(raw_size, encoding=encoding, stage="raw")
+            COMPRESSED_BYTES.inc(sent_size, encoding=encoding, stage="sent")
+            close = getattr(chunks, "close", None) # (i.e. the client went away -> the db-streaming generator is closed too)
+            if close is not None:
+                close()
+
+    def _weakenEtag(self, response):
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+
+def createCompressorFromEnv():
+    return ResponseCompressor(
+        min_bytes=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")),
+        gzip_level=int(os.getenv("COMPRESSION_GZIP_LEVEL", "6")),
+        brotli_quality=int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5")),
+        cache_bytes=int(os.getenv("COMPRESSION_CACHE_BYTES", str(32 * 1024 * 1024))),
+    )
+
+def installCompression(app, compressor):
+    METRICS.extend([COMPRESSED_BYTES, RESPONSE_CACHE_LOOKUPS])
+    METRICS.append(Gauge("response_cache_bytes", "Bytes held by the precompressed-response cache.", lambda: [({}, compressor.stats()["bytes"])]))
+
+    @app.after_request
+    def compressResponse(response):
+        return compressor.compress(response)
@@ -0,0 +1,121 @@
+# Monotonically increasing version counters per table (1 row per table in 'data_versions')
+# -> A ROW (not a SEQUENCE): the bump is part of the writing transaction -> a reader sees version N only together w/
+#    the rows that made it N (a sequence's nextval() is visible at once + read 1 both before AND after its 1st call)
+#    | costs: writers to the SAME table queue on its row from their bump (end of the statement) until COMMIT
+# -> Bumped by triggers (so EVERY write path counts, incl. ones that bypass the API) + NOTIFY'd to every
+#    process as '<table_name>:<new_version>' on the 'data_version_changed' channel.
+#    NOTE: NOTIFY is only delivered on COMMIT (rolled-back writes never reach the listeners)
+# -> Used for: in-memory cache invalidation (i.e. the permission index) + ETags on read endpoints
+#    (books: bumped by catalog_cache's trigger instead, which NOTIFY's the changed rows together w/ the new version)
+
+import functools
+import hashlib
+
+from queries import Query, runQuery
+
+DATA_VERSION_CHANNEL = "data_version_changed"
+
+CREATE_DATA_VERSIONS_TABLE = (
+    """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        );
+    """
+)
+
+# +1 on the table's row (created on its 1st bump) | the row stays locked until the writing transaction ends
+CREATE_NEXT_DATA_VERSION_FUNCTION = (
+    """
+        CREATE OR REPLACE FUNCTION next_data_version(versioned_table TEXT) RETURNS BIGINT AS $$
+            INSERT INTO data_versions (table_name, version) VALUES (versioned_table, 1)
+            ON CONFLICT (table_name) DO UPDATE SET version = data_versions.version + 1
+            RETURNING version;
+        $$ LANGUAGE sql;
+    """
+)
+
+# Unconditional bump (for statement-level triggers w/o transition tables, i.e. TRUNCATE)
+CREATE_DATA_VERSION_FUNCTION = (
+    """
+        CREATE OR REPLACE FUNCTION bump_data_version() RETURNS TRIGGER AS $$
+        DECLARE
+            new_version BIGINT;
+        BEGIN
+            new_version := next_data_version(TG_TABLE_NAME);
+            PERFORM pg_notify('data_version_changed', TG_TABLE_NAME || ':' || new_version);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+)
+
+# Only bump when the statement actually touched rows (an UPDATE matching 0 rows still fires a statement-trigger)
+# -> Every trigger using this names its transition table 'changed_rows'
+CREATE_DATA_VERSION_IF_CHANGED_FUNCTION = (
+    """
+        CREATE OR REPLACE FUNCTION bump_data_version_if_changed() RETURNS TRIGGER AS $$
+        DECLARE
+            new_version BIGINT;
+        BEGIN
+            IF EXISTS (SELECT 1 FROM changed_rows) THEN
+                new_version := next_data_version(TG_TABLE_NAME);
+                PERFORM pg_notify('data_version_changed', TG_TABLE_NAME || ':' || new_version);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+)
+
+# The table + the bump functions every version-trigger (+ catalog_cache's) calls
+def createDataVersions(cursor):
+    cursor.execute(CREATE_DATA_VERSIONS_TABLE)
+    cursor.execute(CREATE_NEXT_DATA_VERSION_FUNCTION)
+    cursor.execute(CREATE_DATA_VERSION_FUNCTION)
+    cursor.execute(CREATE_DATA_VERSION_IF_CHANGED_FUNCTION)
+
+def createVersionTracking(cursor, table_name):
+    cursor.execute("INSERT INTO data_versions (table_name) VALUES (%s) ON CONFLICT (table_name) DO NOTHING;", (table_name,))
+
+    # Postgres only allows transition tables on single-event triggers -> 1 trigger per event
+
+    for event, transition in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")):
+        trigger_name = f"{table_name}_version_{event.lower()}_trigger"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON {table_name};")
+        cursor.execute(
+            f"""
+                CREATE TRIGGER {trigger_name}
+                AFTER {event} ON {table_name}
+                REFERENCING {transition} TABLE AS changed_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version_if_changed();
+            """
+        )
+
+    cursor.execute(f"DROP TRIGGER IF EXISTS {table_name}_version_truncate_trigger ON {table_name};")
+    cursor.execute(
+        f"""
+            CREATE TRIGGER {table_name}_version_truncate_trigger
+            AFTER TRUNCATE ON {table_name}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_data_version();
+        """
+    )
+
+# 1 named Query per combination of tables (built once, not per request) | a table w/o a row yet -> 0
+@functools.lru_cache(maxsize=None)
+def _dataVersionsQuery(table_names):
+    return Query("data_versions_" + "_".join(table_names), "SELECT " + ", ".join(f"COALESCE((SELECT version FROM data_versions WHERE table_name = '{table_name}'), 0)" for table_name in table_names) + ";")
+
+# 1 round-trip, no row data touched | {table_name: version}
+# NOTE: Read the version(s) BEFORE the rows they cover: under READ COMMITTED the rows' later snapshot can only be newer
+#       (-> at worst 1 redundant refresh later, never stale rows under a new version)
+def getDataVersions(cursor, *table_names):
+    runQuery(cursor, _dataVersionsQuery(table_names))
+    return dict(zip(table_names, cursor.fetchone()))
+
+# ETag for a read endpoint's response: the table version(s) it depends on + the exact request variant
+# (query-string, i.e. ?status= / ?cursor= / filters) -> equal tags === byte-identical payloads
+def makeEtag(versions, variant=""):
+    version_part = "-".join(f"{table_name}{version}" for table_name, version in sorted(versions.items()))
+    variant_part = hashlib.sha1(variant.encode("utf-8")).hexdigest()[:12]
+    return f"{version_part}-{variant_part}"
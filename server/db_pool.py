@@ -0,0 +1,280 @@
+# Thread-safe Postgres connection pool
+# -> Each request BORROWS its own connection (instead of every request sharing one module-level conn/cursor),
+#    so threaded workers (i.e. gunicorn --threads) can safely serve concurrent requests,
+#    and a failed transaction on one request can never poison the next one.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+
+
+def buildConnectionString():
+    return f"""gssencmode=disable user={os.getenv("SUPABASE_USER")} password={os.getenv("SUPABASE_PASSWORD")}
+               host={os.getenv("SUPABASE_HOST")} port={os.getenv("SUPABASE_PORT")}
+               dbname={os.getenv("SUPABASE_DB_NAME")}"""
+
+
+class DeadlineExceeded(Exception):
+    # Raised instead of sending a statement once the borrowing request's deadline has passed (see setDeadline)
+    pass
+
+
+# Connection/cursor that count + time the statements they run (per checkout -> statements/db-time per request)
+# -> 'statement_observer(query, seconds)' (if set) sees every statement, i.e. the slow-query log
+# -> setDeadline(monotonic-deadline): every transaction's first statement is prefixed w/ 'SET LOCAL statement_timeout = <ms left>;'
+#    (same round-trip) | Postgres cancels it (QueryCanceled) instead of running long past the point the request gave up
+class InstrumentedConnection(psycopg2.extensions.connection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statement_count = 0
+        self.statement_time = 0.0 # seconds
+        self.acquire_wait = 0.0 # seconds the borrower waited on the pool for this connection
+        self.statement_observer = None
+        self.cursor_factory = InstrumentedCursor
+        self.prepared_statements = set() # Names PREPAREd on this session (see queries.runQuery)
+        self.prepared_statements_stale = False
+        self.deadline = None
+        self.statement_timeout_pending = False # -> the next statement opens a transaction that has no timeout yet
+
+    def resetStats(self):
+        self.statement_count = 0
+        self.statement_time = 0.0
+        self.acquire_wait = 0.0
+
+    def setDeadline(self, deadline):
+        self.deadline = deadline
+        self.statement_timeout_pending = deadline is not None
+
+    # SET LOCAL only lasts until the end of the transaction -> re-armed for the next one
+    def commit(self):
+        super().commit()
+        self.statement_timeout_pending = self.deadline is not None
+
+    def rollback(self):
+        super().rollback()
+        self.statement_timeout_pending = self.deadline is not None
+
+    # -> 'SET LOCAL statement_timeout = ...;' if the current transaction still needs one, else ''
+    def statementTimeoutSql(self):
+        if not self.statement_timeout_pending or self.autocommit:
+            return ""
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("The request's deadline passed before its next statement")
+        self.statement_timeout_pending = False
+        return f"SET LOCAL statement_timeout = {max(1, int(remaining * 1000))};" # (0 would mean 'no timeout')
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+
+    def _timed(self, query, run):
+        started = time.perf_counter()
+        try:
+            return run()
+        finally:
+            elapsed = time.perf_counter() - started
+            self.connection.statement_count += 1
+            self.connection.statement_time += elapsed
+            if self.connection.statement_observer is not None:
+                self.connection.statement_observer(query, elapsed)
+
+    # The statement-timeout rides along w/ a plain-text statement | named (server-side) cursors, composed SQL, COPY +
+    # executemany get it as a statement of its own
+    def _applyStatementTimeout(self, query):
+        timeout_sql = self.connection.statementTimeoutSql()
+        if not timeout_sql:
+            return query
+        if self.name is None and isinstance(query, str):
+            return timeout_sql + " " + query
+        with self.connection.cursor() as cursor:
+            cursor.execute(timeout_sql)
+        return query
+
+    def execute(self, query, vars=None):
+        query = self._applyStatementTimeout(query)
+        return self._timed(query, lambda: super(InstrumentedCursor, self).execute(query, vars))
+
+    def executemany(self, query, vars_list):
+        self._applyStatementTimeout(None)
+        return self._timed(query, lambda: super(InstrumentedCursor, self).executemany(query, vars_list))
+
+    def copy_expert(self, sql, file, size=8192):
+        self._applyStatementTimeout(None)
+        return self._timed(sql, lambda: super(InstrumentedCursor, self).copy_expert(sql, file, size))
+
+
+class PoolTimeoutError(Exception):
+    # Raised when no connection frees up within 'acquire_timeout' seconds (pool exhausted)
+    pass
+
+
+class ConnectionPool:
+
+    def __init__(self, connection_string, min_size=1, max_size=10, acquire_timeout=5.0, health_check_after=30.0, statement_observer=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size (min_size={min_size}, max_size={max_size})")
+
+        self.connection_string = connection_string
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_after = health_check_after # Only 'SELECT 1' connections that sat idle at least this long (seconds)
+        self.statement_observer = statement_observer # Handed to every connection (see InstrumentedConnection)
+
+        self._idle = [] # [(conn, returned_at), ...] | LIFO -> the most-recently-used (i.e. 'warmest') connection goes out first
+        self._size = 0 # Idle + checked-out connections
+        self._waiting = 0
+        self._condition = threading.Condition()
+        self._closed = False
+
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        conn = psycopg2.connect(self.connection_string, connection_factory=InstrumentedConnection)
+        conn.statement_observer = self.statement_observer
+        return conn
+
+    def _isHealthy(self, conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1;")
+            conn.rollback() # Don't leave the health-check's implicit transaction open
+            return True
+        except psycopg2.Error:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _discard(self, conn):
+        self._close(conn)
+
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def getconn(self, timeout=None):
+        started = time.perf_counter()
+        conn = self._checkout(timeout)
+        conn.resetStats() # Health-check statements don't count towards the borrower's
+        conn.acquire_wait = time.perf_counter() - started
+        return conn
+
+    def _checkout(self, timeout):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+
+                # Room to grow -> reserve the slot now, open the connection OUTSIDE the lock
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, returned_at = None, None
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(f"Timed out after {timeout}s waiting for a database connection")
+
+                self._waiting += 1
+                try:
+                    self._condition.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        # Health-check on checkout (only for connections that sat idle long enough for the server/network to drop them)
+        # -> a dead one is closed but keeps its slot: the replacement below reuses it (no moment where a waiter could
+        #    take it too + push the pool past max_size)
+        if conn is not None and (conn.closed or (time.monotonic() - returned_at >= self.health_check_after and not self._isHealthy(conn))):
+            self._close(conn)
+            conn = None
+
+        if conn is None:
+            try:
+                return self._connect()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+
+        return conn
+
+    def putconn(self, conn, discard=False):
+        if not conn.closed:
+            conn.setDeadline(None) # (The borrower's deadline doesn't carry over to the next one)
+
+        if discard or conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        # Automatic rollback: whatever the request left behind (failed OR uncommitted transaction) is undone
+        # before anyone else can see this connection
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    # with pool.connection() as conn: ... -> COMMIT on success, ROLLBACK on exception, always returned to the pool
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._condition:
+            return {"size": self._size, "idle": len(self._idle), "in_use": self._size - len(self._idle), "waiting": self._waiting, "max_size": self.max_size}
+
+    def closeall(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+def createPoolFromEnv(connection_string, statement_observer=None):
+    return ConnectionPool(
+        connection_string,
+        min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+        max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+        acquire_timeout=float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "5")),
+        health_check_after=float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", "30")),
+        statement_observer=statement_observer,
+    )
@@ -0,0 +1,187 @@
+# Read/write routing: read-only routes on streaming replicas, everything else on the primary
+# -> DB_REPLICA_DSNS: ';'-separated libpq connection strings / postgresql:// URLs (unset -> primary only, no behaviour change)
+#    | each replica gets its own ConnectionPool (same DB_POOL_* sizes)
+# -> A monitor-thread checks every replica every DB_REPLICA_LAG_CHECK_INTERVAL seconds (replay-LSN + lag) | replicas that
+#    are down, not streaming, or more than DB_REPLICA_MAX_LAG seconds behind get no reads -> the primary serves them instead
+#    | lag: 0 only once the replica has replayed the primary's WAL-position (read right before) -> a replica that lost its
+#    WAL-receiver can't look 'caught up' just because it has replayed everything it RECEIVED
+#    NOTE: pg_stat_wal_receiver's status needs pg_read_all_stats (GRANT it to the app's role on the replicas) | w/o it
+#          only the lag-check applies
+# -> Read-your-writes: after a user's own write (i.e. borrow/return) the primary's WAL-position is remembered for that user,
+#    and their reads only go to a replica that has replayed PAST it (else -> primary) | kept until evicted (LRU)
+#    NOTE: Remembered per server-process | a read landing on ANOTHER worker is at most DB_REPLICA_MAX_LAG seconds stale
+#
+# Local setup (2 instances in streaming replication):
+#   pg_basebackup -h localhost -p 5432 -U <replication-user> -D ./replica -R -X stream   (-R writes standby.signal + primary_conninfo)
+#   pg_ctl -D ./replica -o "-p 5433" start
+#   DB_REPLICA_DSNS="host=localhost port=5433 dbname=... user=... password=..." EXPOSE_DB_TARGET=True flask run
+#   python -m bench.check_read_routing --base-url http://127.0.0.1:5000 ...
+
+import collections
+import itertools
+import os
+import threading
+
+import psycopg2
+
+from db_pool import createPoolFromEnv
+
+PRIMARY = "primary"
+
+# (replay-position, seconds since the last replayed commit, streaming?) | NULL status === not allowed to see it
+REPLICA_STATUS_QUERY = (
+    """
+        SELECT
+            CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::TEXT,
+            CASE WHEN pg_is_in_recovery() THEN extract(epoch FROM now() - pg_last_xact_replay_timestamp()) ELSE 0 END,
+            NOT pg_is_in_recovery() OR EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming');
+    """
+)
+CURRENT_WAL_POSITION_QUERY = "SELECT pg_current_wal_lsn()::TEXT;"
+
+
+# '16/B374D848' -> int (comparable)
+def parseLsn(lsn):
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) | int(low, 16)
+
+
+class Replica:
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.healthy = False # Until the first successful check
+        self.lag = None # seconds
+        self.replay_lsn = 0
+
+    # primary_position: the primary's WAL-position right before this check (None -> unknown: the lag can't be 0)
+    def check(self, primary_position):
+        try:
+            with self.pool.connection(timeout=1.0) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(REPLICA_STATUS_QUERY)
+                    replay_lsn, replay_age, streaming = cursor.fetchone()
+        except Exception:
+            self.healthy = False
+            return
+
+        self.replay_lsn = parseLsn(replay_lsn) if replay_lsn else 0
+        if primary_position is not None and self.replay_lsn >= primary_position:
+            self.lag = 0.0 # Caught up (an idle primary isn't 'lag')
+        else:
+            self.lag = float(replay_age) if replay_age is not None else None # (None: nothing replayed yet -> no reads)
+        self.healthy = streaming
+
+
+class ReadRouter:
+
+    def __init__(self, primary_pool, replicas=(), max_lag=5.0, check_interval=1.0, sticky_users=100_000):
+        self.primary_pool = primary_pool
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_users = sticky_users
+
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+        self._last_writes = collections.OrderedDict() # user_id : primary WAL-position after their write
+        self._stop = threading.Event()
+        self._thread = None
+
+    def hasReplicas(self):
+        return bool(self.replicas)
+
+    def start(self):
+        if not self.replicas or self._thread is not None:
+            return
+        self._checkReplicas() # First status before any read is routed
+        self._thread = threading.Thread(target=self._monitor, name="replica-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _monitor(self):
+        while not self._stop.wait(self.check_interval):
+            self._checkReplicas()
+
+    def _checkReplicas(self):
+        try:
+            with self.primary_pool.connection(timeout=1.0) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(CURRENT_WAL_POSITION_QUERY)
+                    primary_position = parseLsn(cursor.fetchone()[0])
+        except Exception:
+            primary_position = None
+
+        for replica in self.replicas:
+            replica.check(primary_position)
+
+    # After the caller's own write (on the primary) -> their next reads need a replica that has replayed past it
+    def rememberWrite(self, user_id, primary_conn):
+        if not self.replicas or user_id is None:
+            return
+
+        with primary_conn.cursor() as cursor:
+            cursor.execute(CURRENT_WAL_POSITION_QUERY)
+            wal_position = parseLsn(cursor.fetchone()[0])
+        primary_conn.rollback() # (Ends the read's transaction)
+
+        with self._lock:
+            self._last_writes[user_id] = wal_position
+            self._last_writes.move_to_end(user_id)
+            if len(self._last_writes) > self.sticky_users:
+                self._last_writes.popitem(last=False)
+
+    def _requiredPosition(self, user_id):
+        if user_id is None:
+            return 0
+
+        # (No time-based expiry: 'lag <= max_lag' doesn't mean a replica has replayed THIS position yet)
+        with self._lock:
+            return self._last_writes.get(user_id, 0)
+
+    def _eligibleReplicas(self, user_id):
+        required_position = self._requiredPosition(user_id)
+        return [replica for replica in self.replicas
+                if replica.healthy and replica.lag is not None and replica.lag <= self.max_lag and replica.replay_lsn >= required_position]
+
+    # -> (target name, pool) | read_only=False (or no eligible replica) -> the primary
+    def choosePool(self, read_only, user_id=None):
+        if read_only and self.replicas:
+            eligible = self._eligibleReplicas(user_id)
+            if eligible:
+                replica = eligible[next(self._round_robin) % len(eligible)]
+                return replica.name, replica.pool
+        return PRIMARY, self.primary_pool
+
+    def stats(self):
+        return [(replica.name, replica.pool.stats(), replica.healthy, replica.lag) for replica in self.replicas]
+
+    def closeall(self):
+        self.stop()
+        for replica in self.replicas:
+            replica.pool.closeall()
+
+
+def replicaConnectionStrings():
+    return [dsn.strip() for dsn in os.getenv("DB_REPLICA_DSNS", "").split(";") if dsn.strip()]
+
+def createRouterFromEnv(primary_pool, statement_observer=None):
+    replicas = []
+    for index, dsn in enumerate(replicaConnectionStrings()):
+        try:
+            pool = createPoolFromEnv(dsn, statement_observer=statement_observer)
+        except psycopg2.OperationalError as e:
+            # A replica being down at startup shouldn't take the app down (min_size connections fail) -> primary-only
+            print(f"Replica {index} unavailable at startup ({e}) -> skipped")
+            continue
+        replicas.append(Replica(f"replica-{index}", pool))
+
+    return ReadRouter(
+        primary_pool,
+        replicas,
+        max_lag=float(os.getenv("DB_REPLICA_MAX_LAG", "5")),
+        check_interval=float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "1")),
+    )
@@ -0,0 +1,236 @@
+# Request- + query-level instrumentation (instead of ad-hoc print()'s)
+# -> Per-route latency histograms, db-time + SQL statements per request, pool-wait time, timed code sections (i.e. bcrypt),
+#    all rendered in the Prometheus text format on GET /metrics
+# -> Slow-query log: every statement slower than SLOW_QUERY_LOG_MS is logged w/ its NORMALIZED sql (literals -> '?'),
+#    so the same query w/ different parameters groups together
+#
+# NOTE: Metrics are per-process (i.e. each gunicorn worker exposes its own) -> scrape every worker, or sum in Prometheus
+
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+# Seconds | Prometheus-style cumulative buckets (+Inf is implicit)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 13, 21, 34, 55, 100)
+
+SLOW_QUERY_LOG_MS = float(os.getenv("SLOW_QUERY_LOG_MS", "250")) # <= 0 -> disabled
+SLOW_QUERY_LOG_FILE = os.getenv("SLOW_QUERY_LOG_FILE") # Unset -> stderr
+MAX_LOGGED_SQL_LENGTH = 2000
+
+slow_query_logger = logging.getLogger("slow_queries")
+
+
+def _labelKey(labels):
+    return tuple(sorted(labels.items()))
+
+def _escapeLabelValue(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _formatLabels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escapeLabelValue(value)}"' for name, value in pairs) + "}"
+
+def _formatNumber(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {} # label_key : value
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _labelKey(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_formatLabels(key)} {_formatNumber(value)}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {} # label_key : [bucket_counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _labelKey(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+
+            # Non-cumulative per bucket here | made cumulative on render
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(series)) for key, series in sorted(self._series.items())]
+
+        for key, series in snapshot:
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_formatLabels(key, [('le', _formatNumber(upper_bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_formatLabels(key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_formatLabels(key)} {_formatNumber(series[-2])}")
+            lines.append(f"{self.name}_count{_formatLabels(key)} {series[-1]}")
+        return lines
+
+
+class Gauge:
+    # Read at scrape-time from a callback -> {labels-dict: value} | (i.e. connection-pool stats)
+
+    def __init__(self, name, documentation, collect):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_formatLabels(_labelKey(labels))} {_formatNumber(value)}")
+        return lines
+
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Time from request start to the last byte of the response (incl. streamed bodies).")
+REQUEST_DB_TIME = Histogram("http_request_db_seconds", "Time spent executing SQL statements per request.")
+REQUEST_STATEMENTS = Histogram("http_request_sql_statements", "SQL statements executed per request.", buckets=STATEMENT_BUCKETS)
+POOL_WAIT = Histogram("db_pool_acquire_wait_seconds", "Time a request waited for a pooled database connection.")
+POOL_TIMEOUTS = Counter("db_pool_acquire_timeouts_total", "Requests that gave up waiting for a pooled database connection.")
+SQL_STATEMENT_DURATION = Histogram("db_statement_duration_seconds", "Duration of every SQL statement (requests + background work).")
+SLOW_QUERIES = Counter("db_slow_queries_total", "SQL statements slower than SLOW_QUERY_LOG_MS.")
+SECTION_DURATION = Histogram("app_section_duration_seconds", "Duration of explicitly timed code sections (i.e. bcrypt, overdue refresh).")
+LOGIN_REJECTIONS = Counter("login_rejections_total", "Log-in/sign-up requests turned away by admission control, by reason.")
+ADMISSION_REJECTIONS = Counter("admission_rejections_total", "Requests answered w/ a 503 by admission control / their deadline, by route class + reason.")
+
+METRICS = [REQUEST_DURATION, REQUEST_DB_TIME, REQUEST_STATEMENTS, POOL_WAIT, POOL_TIMEOUTS, SQL_STATEMENT_DURATION, SLOW_QUERIES, SECTION_DURATION, LOGIN_REJECTIONS, ADMISSION_REJECTIONS]
+
+
+# with timed("bcrypt_verify"): ... -> app_section_duration_seconds{section="bcrypt_verify"}
+@contextmanager
+def timed(section):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SECTION_DURATION.observe(time.perf_counter() - started, section=section)
+
+
+# ---- Slow-query log ----
+
+_COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_PLACEHOLDER_PATTERN = re.compile(r"%\(\w+\)s|%s")
+_NUMBER_PATTERN = re.compile(r"(?<![\w$.])\d+(?:\.\d+)?\b")
+_IN_LIST_PATTERN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# 'SELECT * FROM users WHERE user_id = %s' / "... WHERE book_isbn_id=0060597720" -> '... = ?'
+def normalizeSql(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query) # i.e. psycopg2.sql.Composed
+
+    query = _COMMENT_PATTERN.sub(" ", query)
+    query = _STRING_LITERAL_PATTERN.sub("?", query)
+    query = _PLACEHOLDER_PATTERN.sub("?", query)
+    query = _NUMBER_PATTERN.sub("?", query)
+    query = _IN_LIST_PATTERN.sub("(?, ...)", query)
+    query = _WHITESPACE_PATTERN.sub(" ", query).strip()
+
+    if len(query) > MAX_LOGGED_SQL_LENGTH:
+        query = query[:MAX_LOGGED_SQL_LENGTH] + " ..."
+    return query
+
+def observeStatement(query, seconds):
+    SQL_STATEMENT_DURATION.observe(seconds)
+
+    if SLOW_QUERY_LOG_MS > 0 and seconds * 1000 >= SLOW_QUERY_LOG_MS:
+        SLOW_QUERIES.inc()
+        route = _routeLabel() if has_request_context() else "(background)" # i.e. the overdue engine's tick
+        slow_query_logger.warning("slow query (%.1f ms) [%s]: %s", seconds * 1000, route, normalizeSql(query))
+
+def configureSlowQueryLog():
+    if slow_query_logger.handlers:
+        return
+    handler = logging.FileHandler(SLOW_QUERY_LOG_FILE) if SLOW_QUERY_LOG_FILE else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    slow_query_logger.addHandler(handler)
+    slow_query_logger.setLevel(logging.WARNING)
+    slow_query_logger.propagate = False
+
+
+# ---- Flask wiring ----
+
+def renderMetrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def _routeLabel():
+    return request.url_rule.rule if request.url_rule else "(unmatched)"
+
+def instrumentApp(app, db_pool, expose_metrics=True):
+    configureSlowQueryLog()
+
+    METRICS.append(Gauge("db_pool_connections", "Connections in the pool, by state.",
+                         lambda: [({"state": state}, value) for state, value in db_pool.stats().items() if state != "max_size"]))
+
+    @app.before_request
+    def startRequestTimer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def recordRequestMetrics(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+
+        route = _routeLabel()
+        method = request.method
+        status = str(response.status_code)
+
+        # DB-stats are read NOW (streamed routes already ran their query), the duration when the LAST byte is sent
+        conn = g.get("db_conn")
+        if conn is not None:
+            REQUEST_DB_TIME.observe(conn.statement_time, route=route)
+            REQUEST_STATEMENTS.observe(conn.statement_count, route=route)
+            POOL_WAIT.observe(conn.acquire_wait)
+        else:
+            REQUEST_STATEMENTS.observe(0, route=route)
+
+        response.call_on_close(lambda: REQUEST_DURATION.observe(time.perf_counter() - started, route=route, method=method, status=status))
+        return response
+
+    if expose_metrics:
+        @app.get("/metrics")
+        def metrics():
+            return Response(renderMetrics(), mimetype="text/plain; version=0.0.4")
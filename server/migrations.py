@@ -0,0 +1,350 @@
+# Versioned schema migrations (instead of every worker running DDL + seeding at import-time)
+# -> 'schema_version' records every applied migration | a session-level advisory lock makes sure only ONE process
+#    migrates at a time (the rest wait, then see there's nothing left to do)
+# -> Each migration (DDL + its seed data) runs in a SINGLE transaction, w/ batched inserts
+# -> App startup only VERIFIES the version (1 query) | migrate w/: 'python migrations.py' (or AUTO_MIGRATE=True)
+#
+# NOTE: Never edit a migration that has shipped -> add a new one to the end of MIGRATIONS instead
+#       | Until the first release, migrations are written in their final form + call the modules' own helpers (i.e.
+#       createVersionTracking, ensureHistoryPartitions) | at release, the helpers shipped migrations call are frozen:
+#       copy a helper's SQL into its migration here BEFORE changing the helper
+
+import json
+import os
+import sys
+
+import psycopg2
+import psycopg2.extras
+from dotenv import load_dotenv
+
+from auth_tokens import CREATE_REVOKED_USER_TOKENS_TABLE
+from catalog_events import createCatalogChangeNotifications
+from catalog_cache import createCatalogRowNotifications
+from catalog_io import importBookRecords
+from catalog_search import createCatalogSearch
+from checkout_history import createCheckoutHistory
+from data_versions import createDataVersions, createVersionTracking
+from username_filter import createUserNameIndex, createUserNameNotifications
+
+MIGRATION_LOCK_KEY = 720_300 # pg_advisory_lock key (shared by every process migrating this database)
+
+CREATE_SCHEMA_VERSION_TABLE = (
+    """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+)
+
+CREATE_ROLES_TABLE = (
+    "CREATE TABLE IF NOT EXISTS roles (role_id SERIAL PRIMARY KEY, role_name VARCHAR(50) NOT NULL);"
+)
+# ! Extract the user’s role_id (either from their JWT TOKEN, session, or request headers).
+
+CREATE_PERMISSIONS_TABLE = (
+    """ 
+        CREATE TABLE IF NOT EXISTS permissions (
+            role_id INT REFERENCES roles(role_id) NOT NULL, -- foreign key that RELATIONALLY Links the permissions_table to the roles_table
+            table_name TEXT NOT NULL, 
+            action TEXT NOT NULL, -- 'SELECT', 'INSERT', 'UPDATE', 'DELETE'
+            column_field TEXT NOT NULL, -- the specific column the user can perform this action on | '*' === access to entire table of row-entries for this action (i.e. Librarian-Admin)
+            PRIMARY KEY (role_id, table_name, action, column_field) -- ensure all permission-combinations are unique
+        ); 
+    """
+)
+
+# Users: Unique-StudentID (Primary Key; 9 digits; input validation when logging in via Regex) | is_activated_account | books_checked_out | books_overdue |
+CREATE_USERS_TABLE = (
+    """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY, -- Unique user identifier for the table (hence SERIAL | unrelated to input)
+            role_id INT REFERENCES roles(role_id) NOT NULL, -- Foreign key to roles table | To RELATIONALLY link each user to their role
+            user_id TEXT NOT NULL UNIQUE, -- ID specific to the role (StudentID or LibrarianID)
+            user_name TEXT NOT NULL, -- username
+            password_hash BYTEA NOT NULL, -- password for the user (hashed for security) [bytea-format]
+            is_active_account BOOLEAN NOT NULL DEFAULT FALSE, -- account is approved / is allowed to check-out books (i.e. <=3 books overdue) [not deactivated / DE-PROVISIONED by the librarian-admin]
+            books_overdue TEXT[],   -- DEFAULT ARRAY[]::TEXT[] (book_isbn_id == Text)
+                                    -- array/list of all books (book_id's for uniqueness) the user has overdue (i.e. not returned in >=1 month)
+                                    -- * if the user exceeds 3 books simultaneously overdue,
+                                    -- * all librarian-admin-role-users will be notified,
+                                    -- * and they can DE-PROVISION (i.e. set 'is_active_account:False')
+                                    -- * this user, to prevent them from being able to borrow-books again.
+                                    -- * for the user, they will still be able to view books, but when it comes
+                                    -- to borrowing books (i.e., checking them out), the 'borrow book' button
+                                    -- in the frontend will be grayed out, and the user will be displayed
+                                    -- an error that 'Your account has been deactivated. You many not check out 
+                                    -- any books, until you return your overdue books.' error-message.
+                                    -- NOTE: We are storing the books themselves in 'books_overdue' (as the book_ids for uniqueness),
+                                    -- not just the count, since, when the user returns a book, we want to be able to check if 
+                                    -- that book was overdue (i.e. in the 'books_overdue' list) — that way, we can remove
+                                    -- it from the books_overdue list as well [else, with a simple count, we wouldn't
+                                    -- know which books exactly were overdue, and would have to recompute that for 
+                                    -- every book to decide [INEFFICIENT]].
+            string_password_hash TEXT NOT NULL -- string representation of hashed password cipher-text
+        );                        
+    """
+)
+
+CREATE_BOOKS_TABLE = (
+    """ 
+        CREATE TABLE IF NOT EXISTS books (
+            book_isbn_id TEXT NOT NULL PRIMARY KEY, 
+            title TEXT NOT NULL, 
+            author TEXT NOT NULL, 
+            published_year INT NOT NULL,
+            total_book_count INT NOT NULL, 
+            available_count INT NOT NULL
+        ); 
+    """
+)
+
+# MANY-TO-MANY RELATIONSHIPS (i.e. 1 table references the other [foreign-key]...)
+CREATE_USER_BOOK_CHECKOUTS_TABLE = (
+
+    """
+        CREATE TABLE IF NOT EXISTS user_book_checkouts (
+            user_id TEXT REFERENCES users(user_id),
+            book_isbn_id TEXT REFERENCES books(book_isbn_id),
+            checkout_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, book_isbn_id) -- to ensure unique combinations of (lib_id, book_id) [i.e. no repeats of this exact combination]
+        );
+    """  
+)
+
+CREATE_OVERDUE_ENGINE_STATE_TABLE = (
+    """
+        CREATE TABLE IF NOT EXISTS overdue_engine_state (
+            id INT PRIMARY KEY CHECK (id = 1), -- single-row table
+            last_run TIMESTAMP NOT NULL -- everything with checkout_time < last_run - 1 month is already reflected in users.books_overdue
+        );
+    """
+)
+
+# Supporting indexes for GET /api/books' keyset ORDER BYs + author filter
+CREATE_BOOK_LISTING_INDEXES = (
+    """
+        CREATE INDEX IF NOT EXISTS books_title_isbn_idx ON books (title, book_isbn_id);
+        CREATE INDEX IF NOT EXISTS books_lower_author_idx ON books (lower(author));
+    """
+)
+
+# user_book_checkouts' PRIMARY KEY leads w/ user_id -> lookups by book / by checkout_time couldn't use it:
+# -> book_isbn_id: removeBook's 'still borrowed?' check + the FK check behind every DELETE FROM books
+# -> checkout_time (covering): the overdue engine's tick (the checkouts that crossed the 1-month line since its last run)
+#    is an index-only range-scan
+CREATE_CHECKOUT_INDEXES = (
+    """
+        CREATE INDEX IF NOT EXISTS user_book_checkouts_book_isbn_idx ON user_book_checkouts (book_isbn_id);
+        CREATE INDEX IF NOT EXISTS user_book_checkouts_checkout_time_idx ON user_book_checkouts (checkout_time) INCLUDE (user_id, book_isbn_id);
+    """
+)
+
+# (Only ever runs against an empty 'books' -> a plain INSERT of booklist.json's rows)
+# Seed data | (table_name, action, column_field) per role
+LIBRARIAN_PERMISSIONS = [('users', 'DELETE', "N/A"), ('users', 'UPDATE', 'is_active_account'), ('users', 'SELECT', '*'), ('books', 'SELECT', '*'), ('books', 'INSERT',  "N/A"), ('books', 'DELETE',  "N/A"), ('books', 'UPDATE', "book_isbn_id"), ('books', 'UPDATE', "title"), ('books', 'UPDATE', "author"), ('books', 'UPDATE', "published_year"), ('books', 'UPDATE', "total_book_count"), ('books', 'UPDATE', "available_count"), ('permissions', 'SELECT', '*'), ('permissions', 'INSERT', "N/A"), ('permissions', 'DELETE', "N/A")]
+STUDENT_PERMISSIONS =  [('books', 'SELECT', '*'), ('books', 'UPDATE', 'available_count'), ('user_book_checkouts', 'INSERT',  "N/A"), ('user_book_checkouts', 'DELETE',  "N/A")]
+
+BOOKLIST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "booklist.json")
+
+
+MIGRATIONS = [] # [(version, description, apply(cursor)), ...] in order
+
+def migration(version, description):
+    def register(apply):
+        MIGRATIONS.append((version, description, apply))
+        return apply
+    return register
+
+
+# 1: Everything the server used to create at import-time (IF NOT EXISTS / ON CONFLICT everywhere,
+# so this is a no-op on databases that were set up by the old startup code)
+@migration(1, "Baseline: roles, permissions, users, books, user_book_checkouts, version tracking, overdue-engine state, listing indexes")
+def baselineSchema(cursor):
+    createDataVersions(cursor)
+
+    cursor.execute(CREATE_ROLES_TABLE)
+    cursor.execute(CREATE_PERMISSIONS_TABLE)
+    cursor.execute(CREATE_USERS_TABLE)
+    cursor.execute(CREATE_BOOKS_TABLE)
+    cursor.execute(CREATE_USER_BOOK_CHECKOUTS_TABLE)
+    cursor.execute(CREATE_OVERDUE_ENGINE_STATE_TABLE)
+    cursor.execute(CREATE_BOOK_LISTING_INDEXES)
+
+    for table_name in ("permissions", "users", "books"):
+        createVersionTracking(cursor, table_name)
+
+    # Roles: Librarian (1), Student (2) | only into an empty table
+    cursor.execute("INSERT INTO roles (role_name) SELECT role_name FROM (VALUES ('librarian'), ('student')) AS seed(role_name) WHERE NOT EXISTS (SELECT 1 FROM roles);")
+
+    # All permissions in 1 statement (instead of 1 INSERT + COMMIT per row)
+    seed_permissions = [(1,) + permission for permission in LIBRARIAN_PERMISSIONS] + [(2,) + permission for permission in STUDENT_PERMISSIONS]
+    psycopg2.extras.execute_values(cursor, "INSERT INTO permissions (role_id, table_name, action, column_field) VALUES %s ON CONFLICT DO NOTHING;", seed_permissions)
+
+    # Initial catalog via COPY | only into an empty table
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM books);")
+    if not cursor.fetchone()[0]:
+        with open(BOOKLIST_PATH, 'r') as books_list:
+            books_list = json.load(books_list)
+        importBookRecords(cursor.connection, enumerate(books_list, start=1))
+
+
+# Dashboard filters as indexed data (instead of 'array_length(books_overdue, 1) > 3' etc., which no index can serve)
+# -> STORED generated columns: Postgres keeps them in sync on every write of books_overdue/is_active_account,
+#    so no app-code (overdue engine, returns, update-active-status, ...) has to maintain them
+# NOTE: Adding a STORED column rewrites 'users' once (under an ACCESS EXCLUSIVE lock) -> run this off-peak on big tables
+ADD_USER_ACCOUNT_STATUS_COLUMNS = (
+    """
+        ALTER TABLE users
+            ADD COLUMN IF NOT EXISTS overdue_count INT GENERATED ALWAYS AS (COALESCE(cardinality(books_overdue), 0)) STORED,
+            ADD COLUMN IF NOT EXISTS account_status TEXT GENERATED ALWAYS AS (
+                CASE
+                    WHEN COALESCE(cardinality(books_overdue), 0) > 3 THEN 'excessive-overdue' -- (whether or not they're still active)
+                    WHEN NOT is_active_account THEN 'needs-approval'
+                    ELSE 'active'
+                END
+            ) STORED;
+    """
+)
+
+# -> Partial + covering (INCLUDE every column GET /api/users returns): the 2 dashboard tabs are index-only scans over
+#    ONLY the (few) matching users
+# -> users_account_status_idx: GET /api/users/summary's GROUP BY is an index-only scan (no heap rows fetched)
+CREATE_USER_ACCOUNT_STATUS_INDEXES = (
+    """
+        CREATE INDEX IF NOT EXISTS users_needs_approval_idx ON users (user_id)
+            INCLUDE (role_id, user_name, is_active_account, books_overdue) WHERE account_status = 'needs-approval';
+        CREATE INDEX IF NOT EXISTS users_excessive_overdue_idx ON users (user_id)
+            INCLUDE (role_id, user_name, is_active_account, books_overdue) WHERE account_status = 'excessive-overdue';
+        CREATE INDEX IF NOT EXISTS users_account_status_idx ON users (account_status);
+    """
+)
+
+@migration(2, "users.overdue_count + users.account_status (generated), w/ indexes for the librarian dashboard")
+def userAccountStatus(cursor):
+    cursor.execute(ADD_USER_ACCOUNT_STATUS_COLUMNS)
+    cursor.execute(CREATE_USER_ACCOUNT_STATUS_INDEXES)
+    cursor.execute("ANALYZE users;") # Planner needs the new columns' statistics to pick the partial indexes
+
+
+@migration(3, "NOTIFY 'catalog_changes' from triggers on books (live availability over SSE)")
+def catalogChangeNotifications(cursor):
+    createCatalogChangeNotifications(cursor)
+
+
+@migration(4, "revoked_user_tokens (deactivated users' session tokens), w/ version tracking")
+def revokedUserTokens(cursor):
+    cursor.execute(CREATE_REVOKED_USER_TOKENS_TABLE)
+    createVersionTracking(cursor, "revoked_user_tokens")
+
+
+@migration(5, "checkout_history (partitioned by month) + circulation rollups, w/ the librarians' analytics permission")
+def checkoutHistory(cursor):
+    createCheckoutHistory(cursor)
+    cursor.execute("INSERT INTO permissions (role_id, table_name, action, column_field) VALUES (1, 'circulation_analytics', 'SELECT', '*') ON CONFLICT DO NOTHING;")
+
+
+# Existing case-insensitive duplicates -> fails, listing them (see createUserNameIndex) | nothing is applied until resolved
+@migration(6, "UNIQUE lower(user_name) + NOTIFY 'user_names' for the per-process username filters")
+def uniqueUserNames(cursor):
+    createUserNameIndex(cursor)
+    createUserNameNotifications(cursor)
+
+
+# NOTE: Adding the STORED generated column rewrites 'books' once (1 pass over the catalog, under an exclusive lock)
+@migration(7, "books.search_vector (generated tsvector) + GIN index, pg_trgm indexes on lower(title)/lower(author) for GET /api/books/search")
+def catalogSearch(cursor):
+    createCatalogSearch(cursor)
+
+
+# Books' version-triggers are replaced (its data_versions row is kept -> versions/ETags keep counting from where they are)
+@migration(8, "NOTIFY 'catalog_rows' (changed books + their version) for the per-process catalog cache")
+def catalogCacheNotifications(cursor):
+    createCatalogRowNotifications(cursor)
+
+
+# NOTE: Plain CREATE INDEX (a migration is 1 transaction -> no CONCURRENTLY): writes to user_book_checkouts wait while
+#       they build -> run this off-peak on big tables | users.user_name already has users_user_name_lower_key (6)
+@migration(9, "user_book_checkouts indexes on book_isbn_id + checkout_time (removeBook, FK checks, overdue tick)")
+def checkoutIndexes(cursor):
+    cursor.execute(CREATE_CHECKOUT_INDEXES)
+
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+class SchemaOutOfDateError(Exception):
+    pass
+
+
+def getSchemaVersion(cursor):
+    cursor.execute("SELECT to_regclass('schema_version') IS NOT NULL;")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;")
+    return cursor.fetchone()[0]
+
+# App startup: 1 query, no DDL
+def verifySchemaVersion(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version;")
+        current_version = cursor.fetchone()[0] or 0
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        current_version = 0
+
+    if current_version < LATEST_SCHEMA_VERSION:
+        raise SchemaOutOfDateError(f"Database schema is at version {current_version}, but this server needs {LATEST_SCHEMA_VERSION}. Run 'python migrations.py' (or set AUTO_MIGRATE=True).")
+
+    return current_version
+
+def migrate(conn):
+    cursor = conn.cursor()
+
+    # Session-level lock: concurrent migrators (i.e. workers booting w/ AUTO_MIGRATE) queue up here
+    cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_KEY,))
+    conn.commit()
+
+    applied = []
+    try:
+        cursor.execute(CREATE_SCHEMA_VERSION_TABLE)
+        conn.commit()
+
+        current_version = getSchemaVersion(cursor) # Re-read AFTER getting the lock (someone may have just migrated)
+        conn.commit()
+
+        for version, description, apply in MIGRATIONS:
+            if version <= current_version:
+                continue
+
+            try:
+                apply(cursor)
+                cursor.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s);", (version, description,))
+                conn.commit() # 1 transaction per migration (DDL + seed data together)
+            except Exception:
+                conn.rollback()
+                raise
+
+            applied.append(version)
+            print(f"Applied migration {version}: {description}")
+
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+    return applied
+
+
+# 'python migrations.py' -> migrate the database from .dbenv | 'python migrations.py "<dsn>"' -> any other (i.e. a local test) database
+if __name__ == "__main__":
+    from db_pool import buildConnectionString
+
+    load_dotenv(dotenv_path=".dbenv")
+    conn = psycopg2.connect(sys.argv[1] if len(sys.argv) > 1 else buildConnectionString())
+    try:
+        applied = migrate(conn)
+        print(f"Schema is at version {LATEST_SCHEMA_VERSION}" + ("" if applied else " (nothing to apply)"))
+    finally:
+        conn.close()
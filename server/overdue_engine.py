@@ -0,0 +1,147 @@
+# Incremental overdue-books engine
+# -> Instead of re-aggregating ALL of user_book_checkouts + rewriting users on every request,
+#    a background thread periodically picks up ONLY the checkouts whose checkout_time crossed
+#    the 1-month boundary since its last run (a 'watermark' persisted in overdue_engine_state),
+#    and appends those books to their user's 'books_overdue'.
+# -> Returns remove the book from 'books_overdue' directly (see circulation.RETURN_BOOKS_QUERY),
+#    and a single user's list can be recomputed on demand (see refreshOverdueBooksForUser).
+
+import threading
+
+from instrumentation import timed
+from queries import Query, runQuery
+
+OVERDUE_PERIOD = "1 month" # checkout_time older than this === overdue
+
+# Key for pg_try_advisory_xact_lock | only ONE process (of all workers) runs a given tick
+OVERDUE_ENGINE_LOCK_KEY = 720_301
+
+# Full rebuild (used once, to initialise the watermark)
+# NOTE: LEFT JOIN from users, so users with NO overdue books get reset to [] as well
+# (the old per-request version only updated users that appeared in overdue_books -> returned books never 'un-overdued')
+RECONCILE_ALL_OVERDUE_BOOKS_QUERY = (
+    f"""
+        WITH overdue_books AS (
+            SELECT
+                ubc.user_id,
+                array_agg(ubc.book_isbn_id ORDER BY ubc.checkout_time) AS overdue_books
+            FROM
+                user_book_checkouts ubc
+            WHERE
+                ubc.checkout_time < NOW() - INTERVAL '{OVERDUE_PERIOD}'
+            GROUP BY
+                ubc.user_id
+        )
+        UPDATE users
+        SET books_overdue = COALESCE(overdue_books.overdue_books, ARRAY[]::TEXT[])
+        FROM users u LEFT JOIN overdue_books ON overdue_books.user_id = u.user_id
+        WHERE users.id = u.id
+          AND users.books_overdue IS DISTINCT FROM COALESCE(overdue_books.overdue_books, ARRAY[]::TEXT[]); -- skip rows that wouldn't change
+    """
+)
+
+# Incremental tick: only checkouts with (last_run - 1 month) <= checkout_time < (NOW() - 1 month),
+# i.e. the ones that BECAME overdue since the last tick
+# -> Cost scales w/ the number of newly-overdue checkouts, not the total number of checkouts
+MARK_NEWLY_OVERDUE_BOOKS_QUERY = (
+    f"""
+        WITH newly_overdue AS (
+            SELECT
+                ubc.user_id,
+                array_agg(ubc.book_isbn_id ORDER BY ubc.checkout_time) AS overdue_books
+            FROM
+                user_book_checkouts ubc, overdue_engine_state state
+            WHERE
+                state.id = 1
+                AND ubc.checkout_time >= state.last_run - INTERVAL '{OVERDUE_PERIOD}'
+                AND ubc.checkout_time < NOW() - INTERVAL '{OVERDUE_PERIOD}'
+            GROUP BY
+                ubc.user_id
+        )
+        UPDATE users
+        SET books_overdue = COALESCE(users.books_overdue, ARRAY[]::TEXT[]) || ARRAY(
+            SELECT isbn FROM unnest(newly_overdue.overdue_books) AS isbn
+            WHERE NOT (isbn = ANY(COALESCE(users.books_overdue, ARRAY[]::TEXT[]))) -- idempotent (never add the same book twice)
+        )
+        FROM newly_overdue
+        WHERE users.user_id = newly_overdue.user_id;
+    """
+)
+
+ADVANCE_WATERMARK_QUERY = (
+    """
+        INSERT INTO overdue_engine_state (id, last_run) VALUES (1, NOW())
+        ON CONFLICT (id) DO UPDATE SET last_run = EXCLUDED.last_run;
+    """
+)
+
+# On-demand recompute for ONE user (i.e. right before they borrow) | returns their fresh books_overdue + active-status
+# -> Only writes the row when the list actually changed (no needless row-lock / 'users' version-bump per borrow)
+REFRESH_OVERDUE_BOOKS_FOR_USER_QUERY = (
+    f"""
+        WITH fresh AS (
+            SELECT COALESCE(array_agg(ubc.book_isbn_id ORDER BY ubc.checkout_time), ARRAY[]::TEXT[]) AS books_overdue
+            FROM user_book_checkouts ubc
+            WHERE ubc.user_id = %(user_id)s AND ubc.checkout_time < NOW() - INTERVAL '{OVERDUE_PERIOD}'
+        ), updated AS (
+            UPDATE users
+            SET books_overdue = fresh.books_overdue
+            FROM fresh
+            WHERE users.user_id = %(user_id)s AND users.books_overdue IS DISTINCT FROM fresh.books_overdue
+        )
+        SELECT fresh.books_overdue, users.is_active_account
+        FROM users, fresh
+        WHERE users.user_id = %(user_id)s;
+    """
+)
+
+REFRESH_OVERDUE_BOOKS_FOR_USER = Query("refresh_overdue_books_for_user", REFRESH_OVERDUE_BOOKS_FOR_USER_QUERY, {"user_id": "TEXT"})
+
+def reconcileAllOverdueBooks(cursor):
+    cursor.execute(RECONCILE_ALL_OVERDUE_BOOKS_QUERY)
+    cursor.execute(ADVANCE_WATERMARK_QUERY)
+
+def refreshOverdueBooksForUser(cursor, user_id):
+    runQuery(cursor, REFRESH_OVERDUE_BOOKS_FOR_USER, {"user_id": user_id})
+    return cursor.fetchone() # (books_overdue, is_active_account) | None -> no such user
+
+# Returns False if another process holds the lock (i.e. is running this same tick right now)
+def runOverdueTick(conn):
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT pg_try_advisory_xact_lock(%s);", (OVERDUE_ENGINE_LOCK_KEY,))
+    if not cursor.fetchone()[0]:
+        conn.rollback()
+        return False
+
+    cursor.execute("SELECT 1 FROM overdue_engine_state WHERE id = 1;")
+    if cursor.fetchone() is None:
+        reconcileAllOverdueBooks(cursor) # First run ever -> no watermark yet
+    else:
+        cursor.execute(MARK_NEWLY_OVERDUE_BOOKS_QUERY)
+        cursor.execute(ADVANCE_WATERMARK_QUERY)
+
+    conn.commit() # Releases the advisory (xact) lock too
+    return True
+
+
+class OverdueScheduler(threading.Thread):
+
+    def __init__(self, db_pool, interval=60.0):
+        super().__init__(name="overdue-scheduler", daemon=True)
+        self.db_pool = db_pool
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                with timed("overdue_tick"), self.db_pool.connection() as conn:
+                    runOverdueTick(conn)
+            except Exception as e: # Keep ticking (i.e. database briefly unreachable)
+                print(f"Overdue-books tick failed: {e}")
+
+            self._stop_event.wait(self.interval)
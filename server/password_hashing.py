@@ -0,0 +1,184 @@
+# bcrypt off the request threads + admission control for POST /api/users (log-in / sign-up)
+# -> Hashing/verifying runs in a bounded PROCESS pool (100s of ms of CPU per call, which used to run on the request
+#    thread) | BCRYPT_WORKERS processes, default: half the cores, so the other half keeps serving the catalog/dashboard
+#    during a login storm
+# -> At most BCRYPT_WORKERS + BCRYPT_MAX_QUEUE_DEPTH hashes in flight per server-process | beyond that -> fast 503 +
+#    Retry-After (instead of an ever-growing queue where every login times out)
+# -> Token buckets per user_id + per client-IP (LOGIN_*_RATE_PER_MINUTE / LOGIN_*_BURST, 0 === off) -> 429 + Retry-After
+#    BEFORE any db/bcrypt work | (i.e. password-guessing + 1 client hammering the login can't eat the hashing-pool)
+# -> BCRYPT_ROUNDS === the work factor for new hashes | a successful log-in w/ a hash of a different cost is transparently
+#    re-hashed (in the SAME worker call as the verification)
+
+import collections
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import threading
+import time
+
+import bcrypt
+
+DEFAULT_BCRYPT_ROUNDS = 12
+
+
+class LoginRateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Too many log-in attempts. Please try again shortly.")
+        self.retry_after = retry_after
+
+
+class HashingPoolSaturated(Exception):
+    def __init__(self, retry_after):
+        super().__init__("The server is busy. Please try again shortly.")
+        self.retry_after = retry_after
+
+
+# ---- Worker-process functions (module-level -> picklable) ----
+
+def _hashPassword(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+# -> (matches, new_hash | None) | new_hash only if the stored hash's cost !== 'rounds'
+def _verifyPassword(password, stored_hash, rounds):
+    if not bcrypt.checkpw(password, stored_hash): # Constant-time compare (unlike '==' on 2 hashpw()-results)
+        return False, None
+    if hashCost(stored_hash) != rounds:
+        return True, _hashPassword(password, rounds)
+    return True, None
+
+
+# '$2b$12$<salt+hash>' -> 12
+def hashCost(password_hash):
+    try:
+        return int(password_hash.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+
+    def __init__(self, rounds=DEFAULT_BCRYPT_ROUNDS, max_workers=1, max_queue_depth=32):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue_depth
+
+        self._lock = threading.Lock()
+        self._executor = None # Created on first use (i.e. after gunicorn forked its workers)
+        self._pending = 0
+        self._average_seconds = 0.25 # EWMA of 1 hash (for Retry-After estimates)
+
+    def pending(self):
+        return self._pending
+
+    def _getExecutor(self):
+        with self._lock:
+            if self._executor is None:
+                # 'spawn' -> the workers don't inherit this process' threads/locks/db-connections (fork + threads is unsafe)
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def retryAfter(self):
+        # Time until the current backlog would've drained
+        return max(1, math.ceil(self._pending / self.max_workers * self._average_seconds))
+
+    def _run(self, function, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashingPoolSaturated(self.retryAfter())
+            self._pending += 1
+
+        started = time.perf_counter()
+        try:
+            result = self._getExecutor().submit(function, *args).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            # A worker died (i.e. OOM-killed) -> fresh pool for the next call, this one is retried by the client
+            with self._lock:
+                self._executor = None
+            raise HashingPoolSaturated(1)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        self._average_seconds = 0.9 * self._average_seconds + 0.1 * (time.perf_counter() - started)
+        return result
+
+    def hash(self, password):
+        return self._run(_hashPassword, password.encode("utf-8"), self.rounds)
+
+    # -> (matches, new_hash | None)
+    def verify(self, password, stored_hash):
+        return self._run(_verifyPassword, password.encode("utf-8"), bytes(stored_hash), self.rounds)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class TokenBucketLimiter:
+    # 1 bucket per key (user_id / IP) | 'burst' tokens, refilled at 'rate_per_minute' | LRU-bounded to 'max_keys' buckets
+
+    def __init__(self, rate_per_minute, burst, max_keys=100_000):
+        self.rate = rate_per_minute / 60.0 # tokens/second
+        self.burst = burst
+        self.max_keys = max_keys
+
+        self._lock = threading.Lock()
+        self._buckets = collections.OrderedDict() # key : [tokens, last_refill]
+
+    def enabled(self):
+        return self.rate > 0 and self.burst > 0
+
+    # -> 0 if allowed (1 token taken), else seconds until the next token
+    def acquire(self, key, now=None):
+        if not self.enabled():
+            return 0
+
+        now = now if now is not None else time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False) # Least-recently used (=== a full bucket by now, most likely)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            return (1 - bucket[0]) / self.rate
+
+
+class LoginAdmission:
+
+    def __init__(self, per_user, per_ip):
+        self.per_user = per_user
+        self.per_ip = per_ip
+
+    # Raises LoginRateLimited | the IP-bucket is checked first (so 1 client cycling through user_ids is still capped)
+    def admit(self, user_id, client_ip):
+        wait = self.per_ip.acquire(client_ip) or self.per_user.acquire(user_id)
+        if wait:
+            raise LoginRateLimited(max(1, math.ceil(wait)))
+
+
+def _envInt(name, default):
+    return int(os.getenv(name, str(default)))
+
+def createPasswordHasherFromEnv():
+    return PasswordHasher(
+        rounds=_envInt("BCRYPT_ROUNDS", DEFAULT_BCRYPT_ROUNDS),
+        max_workers=_envInt("BCRYPT_WORKERS", max(1, (os.cpu_count() or 2) // 2)),
+        max_queue_depth=_envInt("BCRYPT_MAX_QUEUE_DEPTH", 32),
+    )
+
+def createLoginAdmissionFromEnv():
+    return LoginAdmission(
+        per_user=TokenBucketLimiter(float(os.getenv("LOGIN_USER_RATE_PER_MINUTE", "5")), _envInt("LOGIN_USER_BURST", 5)),
+        per_ip=TokenBucketLimiter(float(os.getenv("LOGIN_IP_RATE_PER_MINUTE", "60")), _envInt("LOGIN_IP_BURST", 30)),
+    )
@@ -0,0 +1,121 @@
+# In-memory index of the (tiny, rarely-changing) 'permissions' table
+# -> hasPermissions() becomes a set-lookup instead of a 'SELECT * FROM permissions WHERE ...' round-trip per request.
+#
+# Keeping it fresh:
+#   1. Every write to 'permissions' bumps its 'data_versions' row + NOTIFY's 'data_version_changed'
+#      (statement-level trigger), so the listener-thread marks the index stale right away.
+#   2. As a fallback (i.e. listener down / missed NOTIFY), we re-check that version
+#      at most once every 'refresh_interval' seconds.
+
+import threading
+import time
+
+WILDCARD_COLUMN = "*" # '*' === access to ALL columns of the table for this action
+
+PERMISSIONS_VERSION_QUERY = "SELECT COALESCE((SELECT version FROM data_versions WHERE table_name = 'permissions'), 0);"
+ALL_PERMISSIONS_QUERY = "SELECT role_id, table_name, action, column_field FROM permissions;"
+
+
+class PermissionIndex:
+
+    def __init__(self, refresh_interval=30.0):
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._permissions = frozenset() # {(role_id, table_name, action, column_field), ...}
+        self._version = None
+        self._stale = True
+        self._last_checked = 0.0
+
+    @staticmethod
+    def _key(role_id, table_name, action, column_field):
+        try:
+            role_id = int(role_id) # role_id comes in as a string from url-query-params (i.e. GET /api/books)
+        except (TypeError, ValueError):
+            return None
+        return (role_id, table_name, action, column_field)
+
+    def load(self, cursor):
+        self._stale = False # Cleared BEFORE reading -> a NOTIFY arriving mid-load marks us stale again (no lost update)
+
+        try:
+            cursor.execute(PERMISSIONS_VERSION_QUERY)
+            version = cursor.fetchone()[0]
+            cursor.execute(ALL_PERMISSIONS_QUERY)
+            permissions = frozenset((role_id, table_name, action, column_field) for role_id, table_name, action, column_field in cursor.fetchall())
+        except Exception:
+            self._stale = True
+            raise
+
+        with self._lock:
+            self._permissions = permissions
+            self._version = version
+            self._last_checked = time.monotonic()
+
+    def needsRefresh(self):
+        return self._stale or time.monotonic() - self._last_checked >= self.refresh_interval
+
+    # Called before every lookup | Only touches the database when we KNOW (NOTIFY) or SUSPECT (interval elapsed) a change
+    def ensureFresh(self, cursor):
+        if self._stale:
+            self.load(cursor)
+            return
+
+        if time.monotonic() - self._last_checked < self.refresh_interval:
+            return
+
+        cursor.execute(PERMISSIONS_VERSION_QUERY)
+        if cursor.fetchone()[0] != self._version:
+            self.load(cursor)
+        else:
+            self._last_checked = time.monotonic()
+
+    def markStale(self, payload=None):
+        self._stale = True
+
+    # Listener-handler for the 'data_version_changed' channel (payload: '<table_name>:<version>' | None on reconnect)
+    def onDataVersionChanged(self, payload):
+        if payload is None or payload.split(":", 1)[0] == "permissions":
+            self.markStale()
+
+    def isAllowed(self, role_id, table_name, action, column_field):
+        key = self._key(role_id, table_name, action, column_field)
+        if key is None:
+            return False
+
+        permissions = self._permissions # Single attribute read -> consistent snapshot w/o taking the lock
+        if key in permissions:
+            return True
+
+        # A '*'-grant covers every specific column (i.e. ('books', 'SELECT', '*') allows SELECT on 'title')
+        return column_field != WILDCARD_COLUMN and (key[0], table_name, action, WILDCARD_COLUMN) in permissions
+
+    # Write-through (after OUR commit) so this process sees the change immediately,
+    # w/o waiting for its own NOTIFY to come back around
+    # -> + stale: '_version' no longer names what the index holds (-> reloaded at the next check), and tokens issued
+    #    at that version stop being trusted for their embedded permission-set (see server.isAuthorized)
+    def grant(self, role_id, table_name, action, column_field):
+        key = self._key(role_id, table_name, action, column_field)
+        with self._lock:
+            self._permissions = self._permissions | {key}
+            self._stale = True
+
+    def revoke(self, role_id, table_name, action, column_field):
+        key = self._key(role_id, table_name, action, column_field)
+        with self._lock:
+            self._permissions = self._permissions - {key}
+            self._stale = True
+
+    def listPermissions(self):
+        return sorted(self._permissions)
+
+    # [(table_name, action, column_field), ...] granted to 1 role (i.e. to embed in its session tokens)
+    def permissionsFor(self, role_id):
+        key = self._key(role_id, None, None, None)
+        if key is None:
+            return []
+        return sorted((table_name, action, column_field) for grant_role_id, table_name, action, column_field in self._permissions if grant_role_id == key[0])
+
+    @property
+    def version(self):
+        return self._version
@@ -0,0 +1,96 @@
+# Postgres LISTEN/NOTIFY listener (one dedicated connection + background thread per process)
+# -> Lets our in-memory caches (i.e. the permission index) hear about changes made by OTHER
+# processes/workers, without polling the database on every request :)
+
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+
+class NotificationListener(threading.Thread):
+
+    def __init__(self, connection_string, poll_timeout=5.0, reconnect_delay=2.0):
+        super().__init__(name="pg-notification-listener", daemon=True) # daemon -> dies with the Flask process
+        self.connection_string = connection_string
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+
+        self._handlers = {} # channel : [handler(payload), ...]
+        self._handlers_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._conn = None
+
+    # handler(payload) is called from the listener thread with the NOTIFY payload-string,
+    # OR with None after a (re)connect (i.e. we may have missed notifications -> caches should resync)
+    def subscribe(self, channel, handler):
+        with self._handlers_lock:
+            self._handlers.setdefault(channel, []).append(handler)
+
+        # Already listening -> LISTEN on the new channel right away (else it's done on connect)
+        if self._conn is not None:
+            try:
+                with self._conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {channel};")
+            except psycopg2.Error:
+                pass # The run-loop will reconnect (and re-LISTEN on every channel)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _dispatch(self, channel, payload):
+        with self._handlers_lock:
+            handlers = list(self._handlers.get(channel, []))
+
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception as e: # A broken handler must never kill the listener-thread
+                print(f"Notification handler for '{channel}' failed: {e}")
+
+    def _connect(self):
+        conn = psycopg2.connect(self.connection_string)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT) # LISTEN needs autocommit (no open transaction)
+
+        with self._handlers_lock:
+            channels = list(self._handlers.keys())
+
+        with conn.cursor() as cursor:
+            for channel in channels:
+                cursor.execute(f"LISTEN {channel};")
+
+        self._conn = conn
+
+        # Resync: anything NOTIFY'd while we were disconnected is lost
+        for channel in channels:
+            self._dispatch(channel, None)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                if self._conn is None:
+                    self._connect()
+
+                # Block until the connection's socket is readable (or we time out and re-check 'stop')
+                if select.select([self._conn], [], [], self.poll_timeout) == ([], [], []):
+                    continue
+
+                self._conn.poll()
+                while self._conn.notifies:
+                    notification = self._conn.notifies.pop(0)
+                    self._dispatch(notification.channel, notification.payload)
+
+            except psycopg2.Error as e:
+                print(f"Notification listener lost its connection: {e}")
+                try:
+                    if self._conn is not None:
+                        self._conn.close()
+                except psycopg2.Error:
+                    pass
+                self._conn = None
+                time.sleep(self.reconnect_delay)
+
+        if self._conn is not None:
+            self._conn.close()
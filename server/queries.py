@@ -0,0 +1,91 @@
+# Registry of the hot SQL statements, each prepared server-side ONCE per connection
+# -> Query("login_lookup", sql, {"user_id": "TEXT"}) names a statement + its parameter types | every Query lands in QUERIES
+#    (1 place to see what the hot paths run)
+# -> runQuery(cursor, query, params): the first use on a connection sends 'PREPARE ...; EXECUTE ...' in ONE round-trip,
+#    every later use only 'EXECUTE name (...)' -> no re-parsing/re-planning of the same SQL on every request
+# -> DB_PREPARED_STATEMENTS=False sends the plain SQL instead (i.e. behind pgbouncer/Supabase's pooler in TRANSACTION mode
+#    (port 6543), where a session's prepared statements don't follow it from 1 transaction to the next)
+#
+# NOTE: Round-trips per request === the 'X-SQL-Statements' header (EXPOSE_SQL_STATEMENT_COUNT=True) | 'sql_statements' in the
+#       load-test report (bench/run_benchmark.py)
+
+import os
+import re
+
+PREPARED_STATEMENTS_ENABLED = os.getenv("DB_PREPARED_STATEMENTS", "True").lower() in ("true", "1", "yes")
+
+UNDEFINED_PREPARED_STATEMENT = "26000" # SQLSTATE: 'prepared statement "..." does not exist'
+
+PREPARED_STATEMENT_NAMES_QUERY = "SELECT name FROM pg_prepared_statements;"
+
+_NAMED_PLACEHOLDER_PATTERN = re.compile(r"%\((\w+)\)s")
+
+QUERIES = {} # name : Query
+
+
+class Query:
+
+    __slots__ = ("name", "sql", "param_types", "prepare_sql", "execute_sql")
+
+    # sql uses named placeholders (%(user_id)s) | param_types: {param_name: sql_type}, in the PREPARE's parameter-order
+    def __init__(self, name, sql, param_types=None):
+        param_types = dict(param_types or {})
+
+        placeholders = set(_NAMED_PLACEHOLDER_PATTERN.findall(sql))
+        if placeholders != set(param_types):
+            raise ValueError(f"Query '{name}': placeholders {sorted(placeholders)} don't match param_types {sorted(param_types)}")
+
+        existing = QUERIES.get(name)
+        if existing is not None and existing.sql != sql:
+            raise ValueError(f"Query '{name}' is already registered w/ different SQL")
+
+        self.name = name
+        self.sql = sql
+        self.param_types = param_types
+
+        positions = {param_name: index for index, param_name in enumerate(param_types, start=1)}
+        body = _NAMED_PLACEHOLDER_PATTERN.sub(lambda match: f"${positions[match.group(1)]}", sql).strip().rstrip(";")
+        type_list = f" ({', '.join(param_types.values())})" if param_types else ""
+        arguments = f" ({', '.join(f'%({param_name})s' for param_name in param_types)})" if param_types else ""
+
+        self.prepare_sql = f"PREPARE {name}{type_list} AS {body};"
+        self.execute_sql = f"EXECUTE {name}{arguments};"
+
+        QUERIES[name] = self
+
+
+def _preparedNames(conn):
+    # InstrumentedConnection's per-connection bookkeeping | any other connection (i.e. the migrations' one) -> plain SQL
+    prepared = getattr(conn, "prepared_statements", None)
+    if prepared is None:
+        return None
+
+    # After a failure we can't tell whether the PREPARE went through -> ask the server (1 extra round-trip, rare)
+    if conn.prepared_statements_stale:
+        with conn.cursor() as cursor:
+            cursor.execute(PREPARED_STATEMENT_NAMES_QUERY)
+            prepared.clear()
+            prepared.update(name for (name,) in cursor.fetchall())
+        conn.prepared_statements_stale = False
+
+    return prepared
+
+def runQuery(cursor, query, params=None):
+    conn = cursor.connection
+    prepared = _preparedNames(conn) if PREPARED_STATEMENTS_ENABLED else None
+
+    if prepared is None:
+        cursor.execute(query.sql, params)
+        return cursor
+
+    first_use = query.name not in prepared
+    try:
+        cursor.execute(query.prepare_sql + " " + query.execute_sql if first_use else query.execute_sql, params)
+    except Exception as e:
+        conn.prepared_statements_stale = True
+        if getattr(e, "pgcode", None) == UNDEFINED_PREPARED_STATEMENT:
+            prepared.discard(query.name) # (i.e. someone ran DEALLOCATE/DISCARD ALL on this session)
+        raise
+
+    prepared.add(query.name)
+    return cursor
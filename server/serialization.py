@@ -0,0 +1,95 @@
+# Row -> JSON, shared by every endpoint
+# -> Routes SELECT exactly the columns they return (no 'SELECT *' + filtering columns out in Python), and map the
+#    resulting tuples through a RowLayout built ONCE per column-list (no per-row description lookups/string compares)
+# -> '?fields=' projections (parseFields) narrow that column-list further -> only the requested columns are read + sent
+# -> Whole lists/chunks are encoded in ONE encoder call (instead of 1 json.dumps per row)
+# -> orjson (if installed: 'pip install orjson') encodes ~5-10x faster than the stdlib -> plugged into Flask's
+#    JSON provider, so jsonify()/dict-returns use it too | falls back to the stdlib json module otherwise
+
+import functools
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError: # Optional dependency
+    orjson = None
+
+_compact_encoder = json.JSONEncoder(separators=(",", ":"), default=DefaultJSONProvider.default)
+
+
+# obj -> compact JSON str
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=DefaultJSONProvider.default).decode("utf-8")
+    return _compact_encoder.encode(obj)
+
+
+class RowLayout:
+    # Field-layout for the tuples of 1 query | columns === the SELECT-list, in order
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+
+    def toDict(self, row):
+        return dict(zip(self.columns, row))
+
+    def toDicts(self, rows):
+        columns = self.columns
+        return [dict(zip(columns, row)) for row in rows]
+
+    # Rows -> '{...},{...}' (JSON-array CONTENTS, no brackets) | 1 encoder call per batch (i.e. per streamed chunk)
+    def encodeRows(self, rows):
+        rows = self.toDicts(rows)
+        if not rows:
+            return ""
+        return dumps(rows)[1:-1]
+
+    # Rows -> '{...}\n{...}\n' (NDJSON)
+    def encodeNdjson(self, rows):
+        return "".join(dumps(row) + "\n" for row in self.toDicts(rows))
+
+
+# 1 RowLayout per projected column-list (i.e. per distinct '?fields=')
+@functools.lru_cache(maxsize=256)
+def rowLayout(columns):
+    return RowLayout(columns)
+
+# '?fields=title,author' -> ('title', 'author'), in 'columns'-order (1 SQL shape per SET of fields) | None/'' -> all 'columns'
+# -> raises ValueError for names that aren't in 'columns'
+def parseFields(value, columns):
+    if not value:
+        return tuple(columns)
+
+    requested = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = requested.difference(columns)
+    if unknown or not requested:
+        raise ValueError(f"'fields' must be a comma-separated subset of {list(columns)}")
+    return tuple(column for column in columns if column in requested)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Same behaviour as Flask's default provider (sort_keys, compact unless debugging), w/ orjson doing the encoding
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_NON_STR_KEYS # Flask's default allows i.e. int keys too
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def installJsonProvider(app):
+    app.json = FastJSONProvider(app)
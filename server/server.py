@@ -7,310 +7,596 @@ import requests # To match fetch-requests to some API with Python :)
 import random # Module to generate random values
 
 # Import Flask Class/Module/Library
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, g, Response, stream_with_context
+import click # (Ships w/ Flask) | for the 'flask import-books' / 'flask export-books' CLI commands
 
 # For Environment Variables:
 import os 
+import datetime
+import functools
 from dotenv import load_dotenv 
 
 load_dotenv(dotenv_path=".dbenv")
 
 # Import 'psycopg2' Module to Connect Database to our Flask-Python Backend
 import psycopg2
+import psycopg2.errors
+from db_pool import buildConnectionString, createPoolFromEnv, DeadlineExceeded, PoolTimeoutError
+from db_routing import PRIMARY, createRouterFromEnv
 
-# Module for hashing passwords
-import bcrypt
+# bcrypt in a bounded process-pool + per-user/per-IP log-in rate limits
+# Per-route-class concurrency caps + request deadlines -> fast 503's under overload
+from admission_control import ADMIN, CATALOG_READ, CIRCULATION, LOGIN, RequestRejected, createAdmissionControllerFromEnv, routeClass
+
+from password_hashing import HashingPoolSaturated, LoginRateLimited, createLoginAdmissionFromEnv, createPasswordHasherFromEnv
 
 # So my frontend can make API-calls to my backend
 from flask_cors import CORS
 
-from collections import OrderedDict
-
-# Create Flask App (i.e. 'backend server/router')
-app = Flask(__name__)
-CORS(app)
-
-connection_string = f"""gssencmode=disable user={os.getenv("SUPABASE_USER")} password={os.getenv("SUPABASE_PASSWORD")} 
-                        host={os.getenv("SUPABASE_HOST")} port={os.getenv("SUPABASE_PORT")} 
-                        dbname={os.getenv("SUPABASE_DB_NAME")}"""
+# In-memory permission index + LISTEN/NOTIFY listener that keeps it fresh across processes
+from permissions_cache import PermissionIndex
 
-conn = psycopg2.connect(connection_string)
-cursor = conn.cursor()
+# Signed (HMAC) session tokens issued at login + the revocation-list for deactivated accounts
+from auth_tokens import InvalidToken, RevocationList, createAuthenticatorFromEnv, isAllowedByClaims, tokenPermissions
+from pg_listener import NotificationListener
 
-CREATE_ROLES_TABLE = (
-    "CREATE TABLE IF NOT EXISTS roles (role_id SERIAL PRIMARY KEY, role_name VARCHAR(50) NOT NULL);"
-)
-# ! Extract the user’s role_id (either from their JWT TOKEN, session, or request headers).
-
-CREATE_PERMISSIONS_TABLE = (
-    """ 
-        CREATE TABLE IF NOT EXISTS permissions (
-            role_id INT REFERENCES roles(role_id) NOT NULL, -- foreign key that RELATIONALLY Links the permissions_table to the roles_table
-            table_name TEXT NOT NULL, 
-            action TEXT NOT NULL, -- 'SELECT', 'INSERT', 'UPDATE', 'DELETE'
-            column_field TEXT NOT NULL, -- the specific column the user can perform this action on | '*' === access to entire table of row-entries for this action (i.e. Librarian-Admin)
-            PRIMARY KEY (role_id, table_name, action, column_field) -- ensure all permission-combinations are unique
-        ); 
-    """
-)
+# Background, incremental maintenance of users.books_overdue
+from overdue_engine import OverdueScheduler, refreshOverdueBooksForUser
 
-# Users: Unique-StudentID (Primary Key; 9 digits; input validation when logging in via Regex) | is_activated_account | books_checked_out | books_overdue |
-CREATE_USERS_TABLE = (
-    """
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY, -- Unique user identifier for the table (hence SERIAL | unrelated to input)
-            role_id INT REFERENCES roles(role_id) NOT NULL, -- Foreign key to roles table | To RELATIONALLY link each user to their role
-            user_id TEXT NOT NULL UNIQUE, -- ID specific to the role (StudentID or LibrarianID)
-            user_name TEXT NOT NULL, -- username
-            password_hash BYTEA NOT NULL, -- password for the user (hashed for security) [bytea-format]
-            is_active_account BOOLEAN NOT NULL DEFAULT FALSE, -- account is approved / is allowed to check-out books (i.e. <=3 books overdue) [not deactivated / DE-PROVISIONED by the librarian-admin]
-            books_overdue TEXT[],   -- DEFAULT ARRAY[]::TEXT[] (book_isbn_id == Text)
-                                    -- array/list of all books (book_id's for uniqueness) the user has overdue (i.e. not returned in >=1 month)
-                                    -- * if the user exceeds 3 books simultaneously overdue,
-                                    -- * all librarian-admin-role-users will be notified,
-                                    -- * and they can DE-PROVISION (i.e. set 'is_active_account:False')
-                                    -- * this user, to prevent them from being able to borrow-books again.
-                                    -- * for the user, they will still be able to view books, but when it comes
-                                    -- to borrowing books (i.e., checking them out), the 'borrow book' button
-                                    -- in the frontend will be grayed out, and the user will be displayed
-                                    -- an error that 'Your account has been deactivated. You many not check out 
-                                    -- any books, until you return your overdue books.' error-message.
-                                    -- NOTE: We are storing the books themselves in 'books_overdue' (as the book_ids for uniqueness),
-                                    -- not just the count, since, when the user returns a book, we want to be able to check if 
-                                    -- that book was overdue (i.e. in the 'books_overdue' list) — that way, we can remove
-                                    -- it from the books_overdue list as well [else, with a simple count, we wouldn't
-                                    -- know which books exactly were overdue, and would have to recompute that for 
-                                    -- every book to decide [INEFFICIENT]].
-            string_password_hash TEXT NOT NULL -- string representation of hashed password cipher-text
-        );                        
-    """
-)
+# Returned loans -> monthly-partitioned checkout_history + incrementally maintained circulation rollups
+from checkout_history import CIRCULATION_DAILY, CIRCULATION_TOP_BOOKS, MAX_ANALYTICS_DAYS, HistoryMaintenanceScheduler
 
-CREATE_BOOKS_TABLE = (
-    """ 
-        CREATE TABLE IF NOT EXISTS books (
-            book_isbn_id TEXT NOT NULL PRIMARY KEY, 
-            title TEXT NOT NULL, 
-            author TEXT NOT NULL, 
-            published_year INT NOT NULL,
-            total_book_count INT NOT NULL, 
-            available_count INT NOT NULL
-        ); 
-    """
-)
+# Atomic, batched borrow/return (conditional UPDATE ... RETURNING per batch)
+from circulation import InvalidBatchRequest, borrowBooks, isBookCheckedOut, parseBookIsbnIds, returnBooks
 
-# MANY-TO-MANY RELATIONSHIPS (i.e. 1 table references the other [foreign-key]...)
-CREATE_USER_BOOK_CHECKOUTS_TABLE = (
+# Bulk librarian administration (activate/deactivate many users, patch many books) in 1 statement each
+from bulk_admin import InvalidBulkRequest, parseActiveStatusRequest, parseBookPatches, patchBooks, setActiveStatus
 
-    """
-        CREATE TABLE IF NOT EXISTS user_book_checkouts (
-            user_id TEXT REFERENCES users(user_id),
-            book_isbn_id TEXT REFERENCES books(book_isbn_id),
-            checkout_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            PRIMARY KEY (user_id, book_isbn_id) -- to ensure unique combinations of (lib_id, book_id) [i.e. no repeats of this exact combination]
-        );
-    """  
-)
+# Per-table version counters (cache invalidation + ETags)
+from data_versions import getDataVersions, makeEtag
 
-# Create Initial Roles Table (Roles: Librarian (1), Student (2))
-def setStaticRolesTable():
-    cursor.execute(CREATE_ROLES_TABLE) 
-    cursor.execute("SELECT COUNT(*) FROM roles;")
+# Keyset-paginated, streamed catalog listing for GET /api/books
+from catalog_listing import BOOK_COLUMNS, BOOK_LAYOUT, InvalidListingRequest, encodeBookListing, parseListingArgs, streamBookListing
 
-    row_count = cursor.fetchone()[0]
+# Ranked full-text (tsvector) + typo-tolerant (pg_trgm) search over title/author
+from catalog_search import InvalidSearchRequest, buildSearchQuery, nextSearchCursor, parseSearchArgs
 
-    if row_count == 0:
-        cursor.execute("INSERT INTO roles (role_name) VALUES ('librarian');")
-        cursor.execute("INSERT INTO roles (role_name) VALUES ('student');")
-        conn.commit() # Commit this change to GIT in supabase
-        print("Initial Roles Table Created. Inserted Librarian-Admin + Student Roles, & Enabled Row-Level Security.") 
- 
+# Versioned schema migrations
+from migrations import SchemaOutOfDateError, migrate, verifySchemaVersion
 
-# Create Initial Permissions Table (Librarian-Admins, Students have different permissions)
-def setStaticPermissionsTable():
-    cursor.execute(CREATE_PERMISSIONS_TABLE) 
-    cursor.execute("SELECT COUNT(*) FROM permissions;")
+# Bulk catalog import (COPY -> staging -> upsert) / streamed export
+from catalog_io import IMPORT_FORMATS, InvalidBookRecord, importBookRecords, parseRecords, streamBookExport, validateBookRecord
 
-    row_count = cursor.fetchone()[0]
+# Row -> JSON layouts + the (orjson-backed, if installed) Flask JSON provider
+from serialization import RowLayout, installJsonProvider, parseFields, rowLayout
 
-    if row_count == 0:
-        librarian_permissions = [('users', 'DELETE', "N/A"), ('users', 'UPDATE', 'is_active_account'), ('users', 'SELECT', '*'), ('books', 'SELECT', '*'), ('books', 'INSERT',  "N/A"), ('books', 'DELETE',  "N/A"), ('books', 'UPDATE', "book_isbn_id"), ('books', 'UPDATE', "title"), ('books', 'UPDATE', "author"), ('books', 'UPDATE', "published_year"), ('books', 'UPDATE', "total_book_count"), ('books', 'UPDATE', "available_count")] # List of Librarian Permission_Tuples: (Table_Name, Action)
-        student_permissions =  [('books', 'SELECT', '*'), ('books', 'UPDATE', 'available_count'), ('user_book_checkouts', 'INSERT',  "N/A"), ('user_book_checkouts', 'DELETE',  "N/A")] # List of Student Permission_Tuples: (Table_Name, Action, Column_Field)
+# gzip/brotli (negotiated) + a precompressed copy of hot, unchanged responses (keyed by their ETag)
+from compression import createCompressorFromEnv, installCompression
 
-        # For "Books, Update, Null": Librarians can update WHATEVER field of the book they like (no column specified)
-        for lib_permission in librarian_permissions:
-            cursor.execute("INSERT INTO permissions (role_id, table_name, action, column_field) VALUES (%s, %s, %s, %s);", (1, lib_permission[0], lib_permission[1], lib_permission[2],))
-            conn.commit() # Commit this change to GIT in supabase
+# Prometheus metrics (GET /metrics) + slow-query log
+from instrumentation import ADMISSION_REJECTIONS, LOGIN_REJECTIONS, METRICS, POOL_TIMEOUTS, Gauge, instrumentApp, observeStatement, timed
 
-        for stud_permission in student_permissions:
-            cursor.execute("INSERT INTO permissions (role_id, table_name, action, column_field) VALUES (%s, %s, %s, %s);", (2, stud_permission[0], stud_permission[1], stud_permission[2],))
-            conn.commit() # Commit this change to GIT in supabase
-            
-        print("Initial Permissions Table Created.") 
+# Live availability deltas over Server-Sent Events (fed by NOTIFY 'catalog_changes')
+from catalog_events import CATALOG_CHANGES_CHANNEL, CatalogEventBroker, TooManySubscribers
 
-# Dynamic Tables (i.e. Information inside of it can be updated by the Librarian-Admin during runtime)
-# Initially an empty table
-def createUsersTable():
-    cursor.execute(CREATE_USERS_TABLE)
-    conn.commit() 
-    print("Initial Users Table Created") 
+# 'Is this username taken?' w/o a db round-trip for (most) free names | UNIQUE lower(user_name) for everything else
+from username_filter import USER_NAME_INDEX, USER_NAMES_CHANNEL, USERNAME_LOOKUPS, UsernameFilter
 
-def createBooksTable():
-    cursor.execute(CREATE_BOOKS_TABLE)
+# Per-process, write-through catalog (+ checkouts) cache | GET /api/books served from memory at the database's exact books-version
+from catalog_cache import CATALOG_CACHE_READS, CATALOG_ROWS_CHANNEL, CatalogCache
 
-    cursor.execute("SELECT COUNT(*) FROM books;")
-   
-    row_count = cursor.fetchone()[0]
-    if row_count == 0:
+# Named, per-connection prepared statements for the hot queries
+from queries import runQuery
+from user_accounts import (INSERT_USER, LOGIN_LOOKUP, MAX_USER_NAME_LENGTH, UPDATE_PASSWORD_HASH, USER_ACCOUNT_STATUSES, USER_LISTING_COLUMNS,
+                           USER_NAME_TAKEN, USERS_SUMMARY, usersListingQuery)
 
-        with open('booklist.json', 'r') as books_list:
-            books_list = json.load(books_list)
+# Create Flask App (i.e. 'backend server/router')
+app = Flask(__name__)
+CORS(app)
+installJsonProvider(app)
+
+connection_string = buildConnectionString()
+
+# Pool of connections that each request borrows from (and gives back on teardown)
+# -> Sizes/timeouts configurable via DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE, DB_POOL_ACQUIRE_TIMEOUT, DB_POOL_HEALTH_CHECK_AFTER
+# -> Every statement is timed (observeStatement -> db_statement_duration_seconds + the slow-query log)
+db_pool = createPoolFromEnv(connection_string, statement_observer=observeStatement)
+
+# Per-route latency / db-time / statement-count histograms | EXPOSE_METRICS=False hides GET /metrics (i.e. if it's not firewalled off)
+instrumentApp(app, db_pool, expose_metrics=os.getenv("EXPOSE_METRICS", "True").lower() in ("true", "1", "yes"))
+
+# COMPRESSION_MIN_BYTES, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY, COMPRESSION_CACHE_BYTES | RESPONSE_COMPRESSION=False
+# turns it off (i.e. when a reverse proxy already compresses)
+response_compressor = createCompressorFromEnv()
+if os.getenv("RESPONSE_COMPRESSION", "True").lower() in ("true", "1", "yes"):
+    installCompression(app, response_compressor)
+else:
+    response_compressor.cache_bytes = 0
+
+# Read replicas (DB_REPLICA_DSNS, optional): @readOnly routes read from a replica that's within DB_REPLICA_MAX_LAG seconds
+# (+ has replayed the caller's own last write) | everything else -> the primary
+db_router = createRouterFromEnv(db_pool, statement_observer=observeStatement)
+
+# Admission (ADMISSION_* env-vars, see admission_control.py) | 'db pressure' === requests queued on the primary's or a replica's pool
+admission_controller = createAdmissionControllerFromEnv(
+    db_waiting=lambda: db_pool.stats()["waiting"] + sum(stats["waiting"] for _, stats, _, _ in db_router.stats()))
+
+# Anything that means 'overloaded / out of time' -> the routes' catch-all 'except Exception' re-raises these (-> 503, not 500)
+OVERLOAD_ERRORS = (RequestRejected, DeadlineExceeded, PoolTimeoutError, psycopg2.errors.QueryCanceled)
+
+def readOnly(route):
+    @functools.wraps(route)
+    def readOnlyRoute(*args, **kwargs):
+        g.read_only = True
+        return route(*args, **kwargs)
+    return readOnlyRoute
+
+# Checkout that waits at most until the request's deadline, + carries it (-> statement_timeout) into every transaction
+def borrowConnection(pool):
+    ticket = g.get("admission")
+    conn = pool.getconn(timeout=admission_controller.connectionTimeout(ticket, pool.acquire_timeout))
+    admission_controller.observeDbWait(conn.acquire_wait)
+    if ticket is not None:
+        conn.setDeadline(ticket.deadline)
+    return conn
+
+# The connection borrowed for the current request (lazily, on first use -> routes that never touch the db never borrow one)
+def getDbConnection():
+    if "db_conn" not in g:
+        claims = g.get("auth_claims")
+        target, pool = db_router.choosePool(g.get("read_only", False), claims["sub"] if claims else None)
+        g.db_conn = borrowConnection(pool)
+        g.db_target, g.db_conn_pool = target, pool
+    return g.db_conn
+
+# Always the primary (i.e. permission-index / revocation-list refreshes -> never a lagging replica's view of them)
+def getPrimaryConnection():
+    if "db_conn" in g and g.db_target == PRIMARY:
+        return g.db_conn
+    if "primary_conn" not in g:
+        g.primary_conn = borrowConnection(db_pool)
+    return g.primary_conn
+
+# Gives the connection back early (i.e. before waiting on bcrypt) | a later getDbConnection() borrows a new one
+def releaseDbConnection():
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        conn.rollback()
+        g.pop("db_conn_pool").putconn(conn)
+
+# Routes w/ a @routeClass take a slot of their class (or are turned away w/ a 503) before anything else runs
+@app.before_request
+def admitRequest():
+    route_class = getattr(app.view_functions.get(request.endpoint), "route_class", None)
+    if route_class is not None and request.method != "OPTIONS": # (CORS pre-flights are answered w/o any work)
+        g.admission = admission_controller.admit(route_class)
+
+# (Streamed responses keep the request-context -> the slot is held until the last chunk is sent)
+@app.teardown_request
+def releaseAdmission(exception):
+    ticket = g.pop("admission", None)
+    if ticket is not None:
+        admission_controller.release(ticket)
+
+@app.teardown_appcontext
+def returnDbConnection(exception):
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        # Anything not explicitly committed by the route (i.e. an error-path w/o conn.rollback()) gets rolled back here
+        g.pop("db_conn_pool").putconn(conn)
+
+    primary_conn = g.pop("primary_conn", None)
+    if primary_conn is not None:
+        db_pool.putconn(primary_conn)
+
+# Read-your-writes: a successful write by a logged-in user -> their next reads skip replicas that haven't replayed it yet
+@app.after_request
+def rememberUserWrite(response):
+    if request.method in ("POST", "PUT", "PATCH", "DELETE") and response.status_code < 400 and "db_conn" in g and g.db_target == PRIMARY:
+        claims = g.get("auth_claims")
+        if claims is not None and db_router.hasReplicas():
+            db_router.rememberWrite(claims["sub"], g.db_conn)
+    return response
+
+# Benchmarking aid (EXPOSE_SQL_STATEMENT_COUNT=True): 'X-SQL-Statements' === statements this request has run so far
+# (streamed responses run their query before the headers go out, so they're counted too)
+EXPOSE_SQL_STATEMENT_COUNT = os.getenv("EXPOSE_SQL_STATEMENT_COUNT", "False").lower() in ("true", "1", "yes")
+
+# Same for 'X-DB-Target' (EXPOSE_DB_TARGET=True): 'primary' | 'replica-<n>' | 'none' -> where this request's queries ran
+EXPOSE_DB_TARGET = os.getenv("EXPOSE_DB_TARGET", "False").lower() in ("true", "1", "yes")
+
+@app.after_request
+def addSqlStatementCount(response):
+    if EXPOSE_SQL_STATEMENT_COUNT:
+        conn = g.get("db_conn")
+        response.headers["X-SQL-Statements"] = str(conn.statement_count if conn is not None else 0)
+    if EXPOSE_DB_TARGET:
+        response.headers["X-DB-Target"] = g.get("db_target", "none")
+    return response
+
+@app.errorhandler(PoolTimeoutError)
+def handlePoolTimeout(e):
+    POOL_TIMEOUTS.inc()
+    return jsonify({"error": "The server is busy. Please try again shortly."}), 503, {"Retry-After": "1"}
+
+@app.errorhandler(RequestRejected)
+def handleRequestRejected(e):
+    ADMISSION_REJECTIONS.inc(route_class=e.route_class, reason=e.reason)
+    return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
+# Out of time: before the next statement (DeadlineExceeded) | Postgres cancelled it (statement_timeout === the time that was left)
+@app.errorhandler(DeadlineExceeded)
+@app.errorhandler(psycopg2.errors.QueryCanceled)
+def handleDeadlineExceeded(e):
+    ticket = g.get("admission")
+    ADMISSION_REJECTIONS.inc(route_class=ticket.route_class if ticket else "(none)", reason="deadline" if isinstance(e, DeadlineExceeded) else "statement_timeout")
+    return jsonify({"error": "The server is busy. Please try again shortly."}), 503, {"Retry-After": "1"}
+
+@app.errorhandler(LoginRateLimited)
+def handleLoginRateLimited(e):
+    LOGIN_REJECTIONS.inc(reason="rate_limited")
+    return jsonify({"error": str(e)}), 429, {"Retry-After": str(e.retry_after)}
+
+@app.errorhandler(HashingPoolSaturated)
+def handleHashingPoolSaturated(e):
+    LOGIN_REJECTIONS.inc(reason="hashing_saturated")
+    return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
+# Schema is created/upgraded by versioned migrations (migrations.py) -> startup only checks the version (1 query)
+# -> AUTO_MIGRATE=True (i.e. local dev, see .flaskenv) migrates instead of refusing to start
+with db_pool.connection() as conn:
+    try:
+        verifySchemaVersion(conn)
+    except SchemaOutOfDateError:
+        if os.getenv("AUTO_MIGRATE", "False").lower() not in ("true", "1", "yes"):
+            raise
+        conn.rollback()
+        migrate(conn)
+
+# Loaded lazily on the first permission-check; afterwards only re-read when the 'permissions' table actually changes
+# (NOTIFY from the version-trigger, or the periodic version-check as a fallback)
+permission_index = PermissionIndex(refresh_interval=float(os.getenv("PERMISSIONS_REFRESH_SECONDS", "30")))
+
+# Session tokens (AUTH_TOKEN_SECRET must be set + the SAME for every worker/instance, see .flaskenv | AUTH_TOKEN_TTL_SECONDS, default 1h)
+token_authenticator = createAuthenticatorFromEnv()
+revocation_list = RevocationList(token_ttl=token_authenticator.ttl, refresh_interval=float(os.getenv("PERMISSIONS_REFRESH_SECONDS", "30")))
+
+notification_listener = NotificationListener(connection_string)
+notification_listener.subscribe("data_version_changed", permission_index.onDataVersionChanged)
+notification_listener.subscribe("data_version_changed", revocation_list.onDataVersionChanged)
+
+# 1 broker per process (on the SAME listener connection) fans every catalog change out to all SSE clients
+catalog_event_broker = CatalogEventBroker(max_subscribers=int(os.getenv("CATALOG_EVENTS_MAX_SUBSCRIBERS", "1000")))
+notification_listener.subscribe(CATALOG_CHANGES_CHANNEL, catalog_event_broker.onNotification)
+
+# Per-process Bloom filter of every username (USERNAME_FILTER_ERROR_RATE) | built (in the background) on the listener's
+# first connect, kept complete by NOTIFY 'user_names' from every process' sign-ups
+username_filter = UsernameFilter(db_pool, error_rate=float(os.getenv("USERNAME_FILTER_ERROR_RATE", "0.01")))
+notification_listener.subscribe(USER_NAMES_CHANNEL, username_filter.onNotification)
+METRICS.append(USERNAME_LOOKUPS)
+
+# Catalog cache: loaded (in the background) on the listener's first connect | CATALOG_CACHE=False -> never loaded, every
+# listing reads the database (as before)
+catalog_cache = CatalogCache(db_pool)
+if os.getenv("CATALOG_CACHE", "True").lower() in ("true", "1", "yes"):
+    notification_listener.subscribe(CATALOG_ROWS_CHANNEL, catalog_cache.onNotification)
+METRICS.append(CATALOG_CACHE_READS)
+METRICS.append(Gauge("catalog_cache_books", "Books held by this process' catalog cache.", lambda: [({}, catalog_cache.stats()["books"])]))
+# Log-in / sign-up: bcrypt off the request threads (BCRYPT_ROUNDS, BCRYPT_WORKERS, BCRYPT_MAX_QUEUE_DEPTH)
+# + token buckets (LOGIN_USER_RATE_PER_MINUTE/LOGIN_USER_BURST, LOGIN_IP_RATE_PER_MINUTE/LOGIN_IP_BURST)
+password_hasher = createPasswordHasherFromEnv()
+login_admission = createLoginAdmissionFromEnv()
+METRICS.append(Gauge("admission_in_flight", "Admitted requests currently running, by route class.",
+                     lambda: [({"route_class": name}, in_flight) for name, in_flight, _ in admission_controller.stats()]))
+METRICS.append(Gauge("admission_queued", "Requests waiting for a slot of their route class.",
+                     lambda: [({"route_class": name}, queued) for name, _, queued in admission_controller.stats()]))
+METRICS.append(Gauge("admission_db_wait_seconds", "Decayed average pool-checkout wait (catalog reads are shed above ADMISSION_DB_WAIT_SHED_MS).",
+                     lambda: [({}, admission_controller.dbWait())]))
+METRICS.append(Gauge("password_hashing_pending", "bcrypt hashes/verifications queued or running in this process.", lambda: [({}, password_hasher.pending())]))
+
+METRICS.append(Gauge("catalog_event_subscribers", "Connected GET /api/books/events clients.", lambda: [({}, catalog_event_broker.subscriberCount())]))
+
+notification_listener.start()
 
-        for book_info in books_list:
-            book_isbn_id, title, author, published_year, total_book_count, available_count = book_info.values() # Unpack JSON-object
-            cursor.execute("INSERT INTO books (book_isbn_id, title, author, published_year, total_book_count, available_count) VALUES(%s, %s, %s, %s, %s, %s);", (book_isbn_id, title, author, published_year, total_book_count, available_count,))
+def hasPermissions(role_id, table_name, action, column_field):
+    # No SQL round-trip (unless the index is stale) | (role_id, table_name, action, column_field) set-lookup,
+    # where a '*'-grant for the column covers any specific column
+    if permission_index.needsRefresh():
+        with getPrimaryConnection().cursor() as cursor:
+            permission_index.ensureFresh(cursor)
+    return permission_index.isAllowed(role_id, table_name, action, column_field)
+
+# 'Authorization: Bearer <token>' (or '?token=' on GET /api/books/events, since EventSource can't set headers)
+# -> (claims, None) | (None, error-message) | no SQL (unless the revocation-list is stale)
+def authenticateRequest():
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):].strip()
+    elif request.url_rule is not None and request.url_rule.rule == "/api/books/events":
+        token = request.args.get("token")
+    else:
+        token = None
 
-        conn.commit()
-        print("Initial Books Table Created") 
+    if not token:
+        return None, "Please log in first."
 
-def createUserBookCheckoutsTable():
-    cursor.execute(CREATE_USER_BOOK_CHECKOUTS_TABLE)
-    conn.commit() # Commit to Remote Supbase-Database repo, instead of just my local-db repo...
-    print("Initial, Many-To-Many User_To_Borrowed_Books_and_Checkout_Times Table Created; for faster querying && minimal complexity") 
+    try:
+        claims = token_authenticator.verify(token)
+    except InvalidToken as e:
+        return None, str(e)
+
+    if revocation_list.needsRefresh():
+        with getPrimaryConnection().cursor() as cursor:
+            revocation_list.ensureFresh(cursor)
+
+    if revocation_list.isRevoked(claims["sub"], claims["iat"]):
+        return None, "Your session has been revoked. Please log in again."
+
+    return claims, None
+
+# @requireLogin -> 401 w/o a valid token | the route then reads WHO is calling from g.auth_claims (never from the body)
+def requireLogin(route):
+    @functools.wraps(route)
+    def authenticatedRoute(*args, **kwargs):
+        claims, error = authenticateRequest()
+        if claims is None:
+            return jsonify({"error": error}), 401, {"WWW-Authenticate": "Bearer"}
+
+        g.auth_claims = claims
+        g.auth_permissions = tokenPermissions(claims)
+        return route(*args, **kwargs)
+    return authenticatedRoute
+
+def isAuthorized(table_name, action, column_field):
+    claims = g.auth_claims
+
+    # The token's own permission-set (pure in-memory check), as long as the permissions-table is still at the version
+    # the token was issued from | after a grant/revoke -> the (fresh) index for the token's role, so changes apply immediately
+    if claims.get("pv") is not None and claims["pv"] == permission_index.version and not permission_index.needsRefresh():
+        return isAllowedByClaims(g.auth_permissions, table_name, action, column_field)
+    return hasPermissions(claims["role"], table_name, action, column_field)
+
+# Students can only borrow/return as themselves
+def isCallerUser(user_id):
+    return g.auth_claims["sub"] == user_id
+
+def issueToken(user_id, role_id):
+    if permission_index.needsRefresh():
+        with getPrimaryConnection().cursor() as cursor:
+            permission_index.ensureFresh(cursor)
+    return token_authenticator.issue(user_id, role_id, permission_index.permissionsFor(role_id), permission_index.version)
+
+# Overdue-books are maintained incrementally in the background (NOT recomputed on every request anymore)
+# -> Every OVERDUE_ENGINE_INTERVAL seconds, only the checkouts that crossed the 1-month mark since the last tick are processed
+overdue_scheduler = OverdueScheduler(db_pool, interval=float(os.getenv("OVERDUE_ENGINE_INTERVAL", "60")))
+overdue_scheduler.start()
+
+# Partitions ahead of time, retention (CHECKOUT_HISTORY_RETENTION_MONTHS, 0 === keep everything), today's circulation snapshot
+history_maintenance_scheduler = HistoryMaintenanceScheduler(db_pool, interval=float(os.getenv("CHECKOUT_HISTORY_MAINTENANCE_INTERVAL", "900")),
+                                                            retention_months=int(os.getenv("CHECKOUT_HISTORY_RETENTION_MONTHS", "24")))
+history_maintenance_scheduler.start()
+
+db_router.start()
+METRICS.append(Gauge("db_replica_lag_seconds", "Replication lag per read replica (last check).",
+                     lambda: [({"replica": name}, lag) for name, _, _, lag in db_router.stats() if lag is not None]))
+METRICS.append(Gauge("db_replica_healthy", "1 if the replica is reachable + streaming (reads are routed to it while its lag <= DB_REPLICA_MAX_LAG).",
+                     lambda: [({"replica": name}, int(healthy)) for name, _, healthy, _ in db_router.stats()]))
+METRICS.append(Gauge("db_replica_pool_connections", "Connections in each replica's pool, by state.",
+                     lambda: [({"replica": name, "state": state}, value) for name, stats, _, _ in db_router.stats() for state, value in stats.items() if state != "max_size"]))
+
+# Conditional GETs: ETag === version(s) of the table(s) a response is built from + the exact url (path + query-string)
+# -> If the client already has this version, answer '304 Not Modified' w/o reading (or serializing) a single row
+# -> Same if THIS process already sent this exact version compressed: the stored copy goes out again (see compression.py)
+#    (weak comparison: compressed responses carry W/"<etag>")
+# -> 'cursor' === the one the route reads its rows w/ (@readOnly -> a replica): data_versions rows are replicated in the
+#    same commit as the rows they count -> a replica's version always names exactly the rows IT serves
+#    (a replica that is behind -> an older tag -> a full response, never a 304 for rows the client doesn't have)
+def checkNotModified(cursor, *table_names):
+    return checkVersionsNotModified(getDataVersions(cursor, *table_names))
+
+def checkVersionsNotModified(versions):
+    etag = makeEtag(versions, request.full_path)
+    if request.if_none_match.contains_weak(etag):
+        return etag, withEtag(Response(status=304), etag)
+
+    cached = response_compressor.cachedResponse(etag)
+    if cached is not None:
+        return etag, withEtag(cached, etag)
+    return etag, None
+
+def withEtag(response, etag):
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache" # Browser may cache, but must revalidate (If-None-Match) before every reuse
+    return response
+
+ROLE_LAYOUT = RowLayout(("role_id", "role_name"))
 
-setStaticRolesTable()
-setStaticPermissionsTable()
+@app.get("/api/roles")
+@routeClass(LOGIN)
+@readOnly
+def getRoles():
 
-createUsersTable()
-createBooksTable()
-createUserBookCheckoutsTable()
+    conn = getDbConnection()
+    cursor = conn.cursor()
 
-def hasPermissions(role_id, table_name, action, column_field):
-    validate_permission_query = """
-                                    SELECT *
-                                    FROM permissions
-                                    WHERE role_id = %s AND table_name = %s AND action = %s AND column_field = %s
-                                """
-
-    cursor.execute(validate_permission_query, (role_id, table_name, action, column_field,))
-    res = cursor.fetchone()
-
-    return res != None 
-
-def updateOverdueBooksPerUser(): # just update it for all users, when a single user borrows a book (to save on multi-user api-call costs [1000s of users...])
-    update_overdue_books_query = """ 
-
-        -- First: Link foreign key to the table (hence overdue_books.user_id)
-        -- 1. With(...)-statement: Select all overdue books (i.e. have a checkout_time >= 1 month from now)
-            -- from the user_book_checkouts table
-        -- 2. UPDATE users: Now, we align the 'books_overdue' column-field
-            -- of users to reflect the overdue-books for each user (foreign-key RELATIONALLY LINKED
-            -- by their user_id :) )
-        -- 3. SET books_overdue = COALESCE(overdue_books.overdue_books, ARRAY[]::TEXT[]):
-            -- If no overdue books are found for that user_id, return []
-            -- | i.e.: overdue_books.get(overdue_books, []) [
-            -- (i.e.: If this user has no overdue-books, then their 'books_overdue_column'
-            -- stays as an EMPTY-ARRAY text[])
-        -- 3a. SET books_overdue = means set the returned value to the column_field
-            -- 'books_overdue' value, FOR SAID 'user_id' row-entry in users (does so for
-            -- all users in the user-table, 1-by-1 via query :) )   
-
-        WITH overdue_books AS (
-            SELECT 
-                ubc.user_id,
-                array_agg(ubc.book_isbn_id) AS overdue_books
-            FROM 
-                user_book_checkouts ubc -- ubc == alias for 'user_book_checkouts'
-            WHERE 
-                checkout_time < NOW() - INTERVAL '1 month' -- < 1 month is fine | >= 1 month === overdue
-            GROUP BY 
-                ubc.user_id
-        )
-        UPDATE users
-        SET books_overdue = COALESCE(overdue_books.overdue_books, ARRAY[]::TEXT[])
-        FROM overdue_books
-        WHERE users.user_id = overdue_books.user_id;                
-    """
-    cursor.execute(update_overdue_books_query)
-    conn.commit()
+    cursor.execute(f"SELECT {', '.join(ROLE_LAYOUT.columns)} FROM roles")
+    return jsonify({"data": ROLE_LAYOUT.toDicts(cursor.fetchall())}), 200
 
-updateOverdueBooksPerUser()
+# Sign-up form: is this username still free? | (replaces downloading EVERY username + checking on the client)
+# -> {"user_name": "...", "available": true | false} | case-insensitive ('Alice' is taken if 'alice' exists)
+@app.get("/api/users/usernames/<user_name>/available")
+@routeClass(LOGIN)
+@readOnly
+def isUserNameAvailable(user_name : str):
 
-@app.get("/api/roles")
-def getRoles():
-    cursor.execute("SELECT * FROM roles")
-    return jsonify({"data": [{"role_id": role_id, "role_name": role_name} for role_id, role_name in cursor.fetchall()]}), 200
+    if not user_name or len(user_name) > MAX_USER_NAME_LENGTH:
+        return jsonify({"error": f"Usernames are 1-{MAX_USER_NAME_LENGTH} characters long"}), 400
 
-@app.get("/api/users/usernames")
-def getUserNames():
-    cursor.execute("SELECT user_name FROM users")
-    usernames_list = [user_name[0] for user_name in cursor.fetchall()]
-    return jsonify({"usernames_list": usernames_list}), 200
+    taken = isUserNameTaken(user_name)
+    return jsonify({"user_name": user_name, "available": not taken}), 200, {"Cache-Control": "no-store"}
 
 @app.get("/api/users")
+@routeClass(ADMIN)
+@readOnly
+@requireLogin
 def getUsers():
 
-    updateOverdueBooksPerUser()
+    # url: ...?fields=user_id,user_name (i.e. w/o the books_overdue arrays) | all USER_LISTING_COLUMNS by default
+    try:
+        fields = parseFields(request.args.get("fields"), USER_LISTING_COLUMNS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not all(isAuthorized("users", "SELECT", column) for column in fields):
+        return jsonify({"error": "You are not permitted to view this resource!"}), 403
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
 
     try:
 
+        etag, not_modified = checkNotModified(cursor, "users")
+        if not_modified:
+            return not_modified
+
         status = request.args.get("status") # From url-path query params (rq.args.get("...[?status=...]"))
-        query = "SELECT * FROM users"
 
-        # url: https://127.0.0.1:5000/api/users?status=excessive-overdue
-        if status == "excessive-overdue":
-            query += " WHERE array_length(books_overdue, 1) > 3" # 1 represents 1st-dimension of array (i.e. # rows | arrays are stored as ND by default)
-        
-        # url: https://127.0.0.1:5000/api/users?status=needs-approval
-        elif status == "needs-approval":
-            query += " WHERE is_active_account=FALSE AND (array_length(books_overdue, 1) IS NULL or array_length(books_overdue, 1) <= 3)"
-        
-        cursor.execute(query)
+        # url: https://127.0.0.1:5000/api/users?status=excessive-overdue | needs-approval
+        # -> 'account_status' is a generated column w/ a partial, covering index per dashboard-status (index-only scan)
+        # (Any other/no status -> all users)
+        if status in ("excessive-overdue", "needs-approval"):
+            runQuery(cursor, usersListingQuery(fields, True), {"status": status})
+        else:
+            runQuery(cursor, usersListingQuery(fields, False))
         conn.commit()
 
-        column_fields = [desc[0] for desc in cursor.description] # desc[1] = col-field-value for this row-entry 
-        filtered_users = cursor.fetchall()
-        users = [] # Array of user-json objects
-        for user in filtered_users:
-            user_details = {}
-            for col, user_detail in zip(column_fields, user):
-                if col != "password_hash" and col != "id" and col != "string_password_hash":
-                    user_details.update({col : user_detail})
-            users.append(user_details)
-
-            print(user_details)
+        # Only the projected (safe + requested) columns were SELECTed -> straight tuple-to-dict, no per-cell filtering
+        users = rowLayout(fields).toDicts(cursor.fetchall())
 
-        return jsonify({"users": users}), 200
+        return withEtag(jsonify({"users": users}), etag), 200
     
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Per-status user counts for the librarian dashboard (w/o fetching a single user-row)
+# -> {"summary": {"active": n, "needs-approval": n, "excessive-overdue": n}, "total": n}
+@app.get("/api/users/summary")
+@routeClass(ADMIN)
+@readOnly
+@requireLogin
+def getUsersSummary():
+
+    if not isAuthorized("users", "SELECT", "*"):
+        return jsonify({"error": "You are not permitted to view this resource!"}), 403
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
+    etag, not_modified = checkNotModified(cursor, "users")
+    if not_modified:
+        return not_modified
+
+    runQuery(cursor, USERS_SUMMARY)
+    summary = dict.fromkeys(USER_ACCOUNT_STATUSES, 0)
+    summary.update(cursor.fetchall())
+
+    return withEtag(jsonify({"summary": summary, "total": sum(summary.values())}), etag), 200
+
+# Librarian analytics, served from the rollups only (never from raw checkout_history)
+# url: /api/analytics/circulation?from=2025-01-01&to=2025-01-31&top=10 | default: the last 30 days, top 10 books
+@app.get("/api/analytics/circulation")
+@routeClass(ADMIN)
+@readOnly
+@requireLogin
+def getCirculationAnalytics():
+
+    if not isAuthorized("circulation_analytics", "SELECT", "*"):
+        return jsonify({"error": "You are not permitted to view this resource!"}), 403
+
+    try:
+        to_day = datetime.date.fromisoformat(request.args["to"]) if request.args.get("to") else datetime.date.today()
+        from_day = datetime.date.fromisoformat(request.args["from"]) if request.args.get("from") else to_day - datetime.timedelta(days=29)
+        top = int(request.args.get("top", "10"))
+    except ValueError:
+        return jsonify({"error": "'from'/'to' must be YYYY-MM-DD dates, 'top' an integer"}), 400
+
+    if from_day > to_day or (to_day - from_day).days >= MAX_ANALYTICS_DAYS or not 0 <= top <= 100:
+        return jsonify({"error": f"'from' must be <= 'to' (at most {MAX_ANALYTICS_DAYS} days apart), 'top' between 0 and 100"}), 400
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+    params = {"from_day": from_day, "to_day": to_day, "top": top}
+
+    runQuery(cursor, CIRCULATION_DAILY, params)
+    daily = []
+    for day, loans, returns, overdue_returns, active_loans, active_borrowers, overdue_loans in cursor.fetchall():
+        daily.append({"day": day.isoformat(), "loans": loans, "returns": returns, "overdue_returns": overdue_returns,
+                      "overdue_rate": round(overdue_returns / returns, 4) if returns else None,
+                      "active_loans": active_loans, "active_borrowers": active_borrowers, "overdue_loans": overdue_loans}) # (None -> no snapshot that day)
+
+    runQuery(cursor, CIRCULATION_TOP_BOOKS, params)
+    top_books = [{"book_isbn_id": book_isbn_id, "title": title, "loans": loans} for book_isbn_id, title, loans in cursor.fetchall()]
+
+    totals = {name: sum(entry[name] for entry in daily) for name in ("loans", "returns", "overdue_returns")}
+    totals["overdue_rate"] = round(totals["overdue_returns"] / totals["returns"], 4) if totals["returns"] else None
+
+    return jsonify({"from": from_day.isoformat(), "to": to_day.isoformat(), "daily": daily, "totals": totals, "top_books": top_books}), 200
+
+# Deactivating revokes every token the user already holds (in the same transaction)
+# -> data-modifying CTE: 1 statement for the UPDATE + the revocation
+DEACTIVATE_USER_QUERY = (
+    """
+        WITH updated AS (
+            UPDATE users SET is_active_account = FALSE WHERE user_id = %s RETURNING user_id
+        )
+        INSERT INTO revoked_user_tokens (user_id, revoked_at)
+        SELECT user_id, now() FROM updated
+        ON CONFLICT (user_id) DO UPDATE SET revoked_at = EXCLUDED.revoked_at
+        RETURNING extract(epoch FROM revoked_at);
+    """
+)
+
 @app.patch("/api/<user_id>/update-active-status") # user_id is pulled from the query-param-path, hence its in the function-arg directly
+@routeClass(ADMIN)
+@requireLogin
 def updateActiveStatus(user_id : str):
 
-    request_header_data = request.get_json()
+    conn = getDbConnection()
+    cursor = conn.cursor()
 
-    role_id = request_header_data.get("role_id")
-    table_name = request_header_data.get("table_name")
-    action = request_header_data.get("action")
-    column_field = request_header_data.get("column_field", "N/A")
+    request_header_data = request.get_json()
 
     activate_account =  request_header_data.get("new_active_status")
     # True = Activate Account
     # False = Deactivate Account
     
-    if hasPermissions(role_id, table_name, action, column_field):
+    if isAuthorized("users", "UPDATE", "is_active_account"):
 
         # True or False (activate/deactivate)
         if activate_account != None:
         
             try: 
 
-                cursor.execute("UPDATE users SET is_active_account = %s WHERE user_id = %s", (activate_account, user_id,))
-                conn.commit()
+                if activate_account:
+                    cursor.execute("UPDATE users SET is_active_account = TRUE WHERE user_id = %s", (user_id,))
+                    conn.commit()
+                else:
+                    cursor.execute(DEACTIVATE_USER_QUERY, (user_id,))
+                    revoked = cursor.fetchone()
+                    conn.commit()
+
+                    # Write-through -> this process rejects the user's tokens right away (others via NOTIFY)
+                    if revoked is not None:
+                        revocation_list.revoke(user_id, float(revoked[0]))
 
                 return jsonify({"message": f"User {user_id} active account status updated to {activate_account}"}), 200
 
+            except OVERLOAD_ERRORS:
+                raise # -> 503 + Retry-After (errorhandlers)
+
             except Exception as e: # Handle database exceptions for caught-errors
                 conn.rollback() # Undo the committed SQL-changes for this recent SET OF COMMITS / Transaction Session
                 return jsonify({"error": str(e)}), 500
@@ -321,9 +607,57 @@ def updateActiveStatus(user_id : str):
     else:
         return jsonify({"error": "You are not permitted to perform this action!"}), 403
 
+# Many users at once (i.e. approving a new intake) | body: {"new_active_status": bool, "user_ids": [...]}
+# or {"new_active_status": bool, "status": "needs-approval" | "excessive-overdue"} -> 1 statement, however many users
+@app.patch("/api/users/active-status")
+@routeClass(ADMIN)
+@requireLogin
+def updateActiveStatusBatch():
+
+    if not isAuthorized("users", "UPDATE", "is_active_account"):
+        return jsonify({"error": "You are not permitted to perform this action!"}), 403
+
+    try:
+        bulk_request = parseActiveStatusRequest(request.get_json(silent=True))
+    except InvalidBulkRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
+    try:
+        # {"results": [{"user_id", "status": "updated" | "not_found"}, ...]}
+        results, revocations = setActiveStatus(cursor, bulk_request)
+        conn.commit()
+
+        # Write-through -> this process rejects the deactivated users' tokens right away (others via NOTIFY)
+        for user_id, revoked_at in revocations:
+            revocation_list.revoke(user_id, revoked_at)
+
+        return jsonify({"results": results, "updated": sum(result["status"] == "updated" for result in results)}), 200
+
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+
+# Filter says 'definitely free' -> no query | else 1 probe of the unique lower(user_name) index
+def isUserNameTaken(user_name):
+    if not username_filter.mightContain(user_name):
+        USERNAME_LOOKUPS.inc(answered_by="filter")
+        return False
+
+    USERNAME_LOOKUPS.inc(answered_by="database")
+    cursor = getDbConnection().cursor()
+    runQuery(cursor, USER_NAME_TAKEN, {"user_name": user_name})
+    return cursor.fetchone()[0]
+
 @app.post("/api/users")
+@routeClass(LOGIN)
 def processUser(): # Log-in or Create New User-account, depending on if it already exists.
-   
+
     request_header_data = request.get_json()
     
     # Get all data-fields (columns) required to create the user in my table
@@ -346,7 +680,6 @@ def processUser(): # Log-in or Create New User-account, depending on if it alrea
         # Return HTML-message error
         id_pattern = r'^\d{4}$' # 4 digits == librarianID
         if not re.match(id_pattern, user_id):
-            print("here 3")
             return jsonify({"error": f"""Librarian {'userID'} must be exactly 4 digits."""}), 400
 
     # Student ID:
@@ -355,191 +688,354 @@ def processUser(): # Log-in or Create New User-account, depending on if it alrea
         # Return HTML-message error
         id_pattern = r'^\d{9}$' # 9 digits == studentID
         if not re.match(id_pattern, user_id):
-            print("here 4")
             return jsonify({"error": f"""Student {'userID'} must be exactly 9 digits."""}), 400
 
+    # 429 (+ Retry-After) BEFORE any db/bcrypt work if this user_id or client-IP is over its log-in rate
+    login_admission.admit(user_id, request.remote_addr)
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
     try: 
 
         # Check if this user already exists — if so, return 'Welcome Back' (account already exists),
         # instead of duplicating the entry in the table
-        cursor.execute("SELECT * FROM users WHERE user_id = %s", (user_id,))
-        user_exists = cursor.fetchone() 
+        runQuery(cursor, LOGIN_LOOKUP, {"user_id": user_id})
+        user_exists = cursor.fetchone() # (role_id, is_active_account, books_overdue, password_hash, book_checkouts) | None
 
         # * FIRST: Check If this user already exists (to avoid unnecessary computations if the user doesn't) [i.e., as below]
         if user_exists:
 
-            # * Get/Fetch password-hash (password CIPHERTEXT w/ un-enc salt sprinkled on top)
-            # * for this existing user_account
-            cursor.execute("SELECT password_hash FROM users WHERE user_id = %s", (user_id,))
-            stored_password_hash = cursor.fetchone()[0] # Tuple of 1 element/column_field | * === tuple of all column_fields for this entry
+            stored_role_id, is_active_account, books_overdue, stored_password_hash, book_checkouts = user_exists
             stored_password_hash = bytes(stored_password_hash) # Convert from memory-view format back to bytes-format :)
 
-            correct_password = (stored_password_hash == bcrypt.hashpw(password.encode('utf-8'), stored_password_hash))
+            # No connection is held while waiting on the hashing-pool (-> a login storm can't drain the db-pool)
+            releaseDbConnection()
+            with timed("bcrypt_verify"):
+                correct_password, rehashed_password = password_hasher.verify(password, stored_password_hash)
+
             if correct_password:
-                is_active_account = user_exists[5] # Get Active Status, i.e. 5th element in returned tuple of row-entry values (i.e. column_field values)
+                # BCRYPT_ROUNDS changed since this hash was made -> store the re-hash (made in the same worker-call)
+                if rehashed_password is not None:
+                    conn = getDbConnection()
+                    runQuery(conn.cursor(), UPDATE_PASSWORD_HASH, {"password_hash": rehashed_password, "user_id": user_id})
+                    conn.commit()
+
                 if not is_active_account:
-                    num_books_overdue = len(user_exists[6])
-                    if num_books_overdue == 0: # New account
+                    if len(books_overdue) == 0: # New account
                         return jsonify({'error': 'A librarian will activate your newly created account shortly.'}), 403
                     
                     return jsonify({'error': """You're account has been deactivated for >3 overdue books. Please return them to access your account."""}), 403
-                
-                cursor.execute("SELECT * FROM user_book_checkouts WHERE user_id = %s", (user_id,))
-                book_checkouts = [book_isbn_id for x, book_isbn_id, z in cursor.fetchall()]
-                return jsonify({'message': 'Welcome Back!', 'user_id': user_id, 'is_active_account': is_active_account, 'book_checkouts': book_checkouts}), 201  # Log-in Success 
+
+                # Session token for the STORED role (not the role_id the client sent) | 'Authorization: Bearer <token>' from now on
+                token, claims = issueToken(user_id, stored_role_id)
+                return jsonify({'message': 'Welcome Back!', 'user_id': user_id, 'role_id': stored_role_id, 'is_active_account': is_active_account, 'book_checkouts': book_checkouts,
+                                'token': token, 'token_expires_at': claims["exp"]}), 201  # Log-in Success 
             else:
                 return jsonify({'error': 'Invalid Password. Please Try Again!'}), 401  # Log-in Attempt #1 | Try Again
 
         else:
-            cursor.execute("SELECT * FROM users WHERE user_name = %s", (user_name,))
-            is_duplicate_user_name = cursor.fetchone()
-            if is_duplicate_user_name:
-                print("here 7")
+            if len(user_name) > MAX_USER_NAME_LENGTH:
+                return jsonify({'error': f"Usernames are at most {MAX_USER_NAME_LENGTH} characters long"}), 400
+            if isUserNameTaken(user_name):
                 return jsonify({'error': 'Username is taken! Please enter a new username.'}), 409 # Error
         
-        # Random salt to prevent rainbow-table attacks,
+        # Random salt (per hash, in the worker) to prevent rainbow-table attacks,
         # which map/backtrack common passwords from their STATIC encrypted-text (cipher-text)
-        random_salt = bcrypt.gensalt()
-        
-        # Generate cipher-text, w/ unique salt sprinkled on top for randomness...
-        password_hash = bcrypt.hashpw(password.encode('utf-8'), random_salt)
+        releaseDbConnection()
+        with timed("bcrypt_hash"):
+            password_hash = password_hasher.hash(password)
+        conn = getDbConnection()
+        cursor = conn.cursor()
 
         # Insert new-user entry into my database
         # -- non-serial, non-default values are explicitly inserted
-        cursor.execute(
-            """
-                INSERT INTO users (role_id, user_id, user_name, password_hash, is_active_account, books_overdue, string_password_hash)
-                VALUES ( 
-                    %s, %s, %s, %s, %s, %s, %s
-                );
-            """,
-            (role_id, user_id, user_name, password_hash, 'TRUE' if role_id == 1 else 'FALSE', [], password_hash)       
-        )
-        conn.commit()
+        # (The unique indexes decide races: the same user_id / username signing up twice at once -> 1 of them gets a 409)
+        try:
+            runQuery(cursor, INSERT_USER, {"role_id": role_id, "user_id": user_id, "user_name": user_name, "password_hash": password_hash, "is_active_account": role_id == 1})
+            conn.commit()
+        except psycopg2.errors.UniqueViolation as e:
+            conn.rollback()
+            if e.diag.constraint_name == USER_NAME_INDEX:
+                return jsonify({'error': 'Username is taken! Please enter a new username.'}), 409
+            return jsonify({'error': 'This user ID was just registered. Please log in instead.'}), 409
+
+        username_filter.add(user_name) # (Write-through | the NOTIFY tells the other processes)
+
+        # Librarian accounts are active right away -> logged in (w/ a token) | students wait for a librarian's approval first
+        if role_id == 1:
+            token, claims = issueToken(user_id, role_id)
+            return jsonify({'message': 'Congratulations! You have made an account!', 'user_id': user_id, 'role_id': role_id, 'is_active_account': True,
+                            'token': token, 'token_expires_at': claims["exp"]}), 200
 
         return jsonify({'message': 'Congratulations! You have made an account!', 'user_id': user_id, 'is_active_account': False}), 200  # Sign-Up-Creation-Success Success 
 
+    except (HashingPoolSaturated, *OVERLOAD_ERRORS):
+        raise # -> 503 + Retry-After (errorhandlers)
+
     except Exception as e:
+        getDbConnection().rollback() # (The connection may have been swapped while hashing)
         return jsonify({'error': str(e)}), 500
 
 
 @app.get("/api/books")
+@routeClass(CATALOG_READ)
+@readOnly
+@requireLogin
 def getBooks():
 
-    # Update the # of overdue books (check time-diff b/w checkout_time && NOW() >= 1 month) for each user
-    updateOverdueBooksPerUser()
-
     request_url_query_param_data = request.args
-    role_id = int(request_url_query_param_data.get("role_id")) # Convert back from string (url-query-param) to integer
-    table_name = request_url_query_param_data.get("table_name")
-    action = request_url_query_param_data.get("action")
-    column_field = request_url_query_param_data.get("column_field", "N/A")
-
-    if hasPermissions(role_id, table_name, action, column_field):
-        cursor.execute(f"""{action} {column_field} FROM {table_name};""") # Tuple of each column-value | 'rows' (r) tuples total
-        res = cursor.fetchall() # Get ALL books, i.e. ALL row-entries in the books-table
-        books = [OrderedDict({"book_isbn_id": book_isbn_id, "title": title, "author": author, "published_year": published_year, "total_book_count": book_count, "available_count": available_count}) for book_isbn_id, title, author, published_year, book_count, available_count in res]
-        return jsonify({"books": books}), 200
-
-    # Invalid Role_ID 
-    else:
+
+    # Keyset pagination (?limit=&cursor=&sort=) + filters (?author=&min_year=&max_year=&available=) + projection (?fields=)
+    try:
+        listing = parseListingArgs(request_url_query_param_data)
+    except InvalidListingRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Every returned column needs SELECT on it (a '*'-grant covers them all)
+    if not all(isAuthorized("books", "SELECT", column) for column in listing["fields"]):
         return jsonify({"error": "You are not permitted to view this resource!"}), 403
 
+    conn = getDbConnection()
+
+    # Cache at the books-version this (routed) connection sees -> the rows come from memory (the version read is needed
+    # for the ETag anyway) | a replica that is behind the cache (or ahead of it) -> its own rows, as before
+    versions = getDataVersions(conn.cursor(), "books")
+    etag, not_modified = checkVersionsNotModified(versions)
+    if not_modified:
+        return not_modified
+
+    rows = catalog_cache.listingRows(listing, versions["books"]) if catalog_cache.ready() else None
+    if rows is not None:
+        return withEtag(Response(encodeBookListing(rows, listing), status=200, mimetype="application/json"), etag)
+
+    # Streamed: {"books": [...], "next_cursor": "..." | null}, encoded chunk-by-chunk from a server-side cursor
+    # (stream_with_context keeps this request's pooled connection checked-out until the last chunk is sent)
+    return withEtag(Response(stream_with_context(streamBookListing(conn, listing)), status=200, mimetype="application/json"), etag)
+
+# url: /api/books/search?q=harry pot&limit=20[&cursor=...][&fields=...] -> {"books": [...best match first], "next_cursor": "..." | null}
+@app.get("/api/books/search")
+@routeClass(CATALOG_READ)
+@readOnly
+@requireLogin
+def searchBooks():
+
+    try:
+        search = parseSearchArgs(request.args)
+    except InvalidSearchRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Same check as GET /api/books
+    if not all(isAuthorized("books", "SELECT", column) for column in search["fields"]):
+        return jsonify({"error": "You are not permitted to view this resource!"}), 403
+
+    cursor = getDbConnection().cursor()
+
+    # (Search-as-you-type repeats the same prefixes a lot -> 304 / the precompressed copy while 'books' is unchanged)
+    etag, not_modified = checkNotModified(cursor, "books")
+    if not_modified:
+        return not_modified
+
+    query, params = buildSearchQuery(search)
+    runQuery(cursor, query, params)
+    rows = cursor.fetchall()
+
+    return withEtag(jsonify({"books": rowLayout(search["fields"]).toDicts(rows[:search["limit"]]), "next_cursor": nextSearchCursor(search, len(rows))}), etag), 200
+
+# Live availability changes (Server-Sent Events) | instead of re-polling the whole GET /api/books list
+# -> new EventSource(".../api/books/events?token=...") | resumes from the 'Last-Event-ID' header on reconnect
+#    (or '?last_event_id=', for clients that can't set headers)
+@app.get("/api/books/events")
+@requireLogin
+def streamCatalogEvents():
+
+    if not isAuthorized("books", "SELECT", "*"):
+        return jsonify({"error": "You are not permitted to view this resource!"}), 403
+
+    try:
+        subscriber, backlog = catalog_event_broker.subscribe(request.headers.get("Last-Event-ID") or request.args.get("last_event_id"))
+    except TooManySubscribers:
+        return jsonify({"error": "Too many live connections. Please try again shortly."}), 503, {"Retry-After": "5"}
+
+    # NOTE: No database connection is held while streaming (events come from the process' single listener)
+    return Response(catalog_event_broker.stream(subscriber, backlog), status=200, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}) # (X-Accel-Buffering: nginx must not buffer the stream)
 
 @app.post("/api/books")
+@routeClass(ADMIN)
+@requireLogin
 def insertBook():
 
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
     request_header_data = request.get_json()
 
-    role_id = request_header_data.get("role_id")
-    table_name = request_header_data.get("table_name")
-    action = request_header_data.get("action")
-    column_field = request_header_data.get("column_field", "N/A") # 'None' for Insert/Delete queries (queries for ENTIRE ROW-ENTRIES -> NOT just a specific column to only work on)
-
-    book_isbn_id = request.get_json("book_isbn_id")
-    title = request.get_json("title")
-    author = request.get_json("author")
-    published_year = request.get_json("published_year")
-    total_book_count = request.get_json("total_book_count")
-    available_count = request.get_json("available_count")
-
-    # Validate missing fields
-    if not book_isbn_id or not title or not author or not published_year or not total_book_count or not available_count:
-        return jsonify({'error': 'All fields are necessary'}), 400
+    if not isAuthorized("books", "INSERT", "N/A"):
+        return jsonify({"error": "You are not permitted to perform this action!"}), 403
 
-    # Check for duplicate books
-    cursor.execute("SELECT * FROM books WHERE book_isbn_id = %s", (book_isbn_id,)) # Ensure you pass a single-element tuple for book_isbn_id. In Python, a single-element tuple requires a trailing comma (i.e., (book_isbn_id,))
-    book = cursor.fetchone() # Unique Books in table only, so fetchone() works (no need for fetchall()[0]-tuple)
-    if book: # book == None => New book-entry in 'books_table' :)
-        return jsonify({'error': 'Book {book_isbn_id} already exists!'}), 400
+    # Same validation as the bulk-import (all fields present, integers, 0 <= available_count <= total_book_count)
+    try:
+        book = validateBookRecord(request_header_data)
+    except InvalidBookRecord as e:
+        return jsonify({'error': str(e)}), 400
 
-    if hasPermissions(role_id, table_name, action, column_field):
-        try: 
+    book_isbn_id = book[0]
 
-            cursor.execute("INSERT into books (book_isbn_id, title, author, published_year, total_book_count, available_count) VALUES (%s, %s, %s, %s, %s, %s, %s);", (book_isbn_id, title, author, published_year, total_book_count, available_count,))
-            conn.commit()
+    try: 
+        # ON CONFLICT DO NOTHING -> duplicate-check + insert in 1 round-trip (and no check-then-insert race)
+        cursor.execute("INSERT INTO books (book_isbn_id, title, author, published_year, total_book_count, available_count) VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT (book_isbn_id) DO NOTHING;", book)
+        if cursor.rowcount == 0:
+            conn.rollback()
+            return jsonify({'error': f'Book {book_isbn_id} already exists!'}), 400
 
-            return {"message": f"New book {book_isbn_id} added."}, 200
-        
-        except Exception as e: # Handle database exceptions
-            conn.rollback() 
-            return jsonify({"error": str(e)}), 500 # Database-logic error (NOT a user error) -> HTTP-error-status code '500'
+        cache_version = catalog_cache.writtenVersion(cursor)
+        conn.commit()
+        catalog_cache.writeRows([book], cache_version)
+
+        return {"message": f"New book {book_isbn_id} added."}, 200
     
-    else:
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e: # Handle database exceptions
+        conn.rollback() 
+        return jsonify({"error": str(e)}), 500 # Database-logic error (NOT a user error) -> HTTP-error-status code '500'
+
+
+# Bulk import: raw CSV/NDJSON request-body (?format=csv|ndjson) | permission-fields go in the url-query-params (the body is the file)
+# -> Librarian-only: needs INSERT on books + UPDATE on every column an upsert can overwrite
+@app.post("/api/books/import")
+@routeClass(ADMIN)
+@requireLogin
+def importBooks():
+
+    request_url_query_param_data = request.args
+    import_format = request_url_query_param_data.get("format", "csv").lower()
+
+    if not isAuthorized("books", "INSERT", "N/A") or not all(isAuthorized("books", "UPDATE", column) for column in BOOK_COLUMNS[1:]):
         return jsonify({"error": "You are not permitted to perform this action!"}), 403
 
+    conn = getDbConnection()
+
+    try:
+        lines = (raw_line.decode("utf-8") for raw_line in request.stream) # Line-by-line off the socket (never the whole body in memory)
+        report = importBookRecords(conn, parseRecords(lines, import_format))
+        conn.commit() # All-or-nothing for the valid rows | invalid rows are only reported
+
+        return jsonify(report), 200
+
+    except (InvalidBookRecord, UnicodeDecodeError) as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.get("/api/books/export")
+@routeClass(ADMIN)
+@readOnly
+@requireLogin
+def exportBooks():
+
+    request_url_query_param_data = request.args
+    export_format = request_url_query_param_data.get("format", "csv").lower()
+
+    if not isAuthorized("books", "SELECT", "*"):
+        return jsonify({"error": "You are not permitted to view this resource!"}), 403
+
+    if export_format not in IMPORT_FORMATS:
+        return jsonify({"error": f"'format' must be one of {list(IMPORT_FORMATS)}"}), 400
+
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return Response(stream_with_context(streamBookExport(getDbConnection(), export_format)), status=200, mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=books.{export_format}"})
+
+# CLI equivalents (run from server/): 'flask import-books catalog.csv' | 'flask export-books catalog.ndjson --format ndjson'
+@app.cli.command("import-books")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "import_format", type=click.Choice(IMPORT_FORMATS), default=None, help="Defaults to the file extension.")
+def importBooksCommand(path, import_format):
+    import_format = import_format or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+
+    with open(path, "r", encoding="utf-8", newline="") as catalog_file:
+        with db_pool.connection() as conn:
+            report = importBookRecords(conn, parseRecords(catalog_file, import_format))
+
+    click.echo(f"{report['received']} rows read | {report['inserted']} inserted | {report['updated']} updated | {report['failed']} failed")
+    for error in report["errors"]:
+        click.echo(f"  line {error['line']}: {error['error']}", err=True)
+
+@app.cli.command("export-books")
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--format", "export_format", type=click.Choice(IMPORT_FORMATS), default="csv")
+def exportBooksCommand(path, export_format):
+    with open(path, "w", encoding="utf-8", newline="") as catalog_file:
+        with db_pool.connection() as conn:
+            for chunk in streamBookExport(conn, export_format):
+                catalog_file.write(chunk)
+
+    click.echo(f"Catalog exported to {path}")
+
 
 @app.delete("/api/books/<book_isbn_id>") # book_isbn_id is pulled from the query-param-path, hence its in the function-arg directly
+@routeClass(ADMIN)
+@requireLogin
 def removeBook(book_isbn_id : str):
 
-    request_header_data = request.get_json()
-
-    role_id = request_header_data.get("role_id")
-    table_name = request_header_data.get("table_name")
-    action = request_header_data.get("action")
-    column_field = request_header_data.get("column_field", "N/A") # 'None' for Insert/Delete queries (queries for ENTIRE ROW-ENTRIES -> NOT just a specific column to only work on)
+    conn = getDbConnection()
+    cursor = conn.cursor()
 
-    # Will only run the below code if these 4 params insert within the exact same row-entry
-    # in my permissions-table — SO, by default, a SQL-injection won't push through here.
-    if hasPermissions(role_id, table_name, action, column_field):
+    # Permission comes from the caller's signed token (not from request-body fields they could make up)
+    if isAuthorized("books", "DELETE", "N/A"):
         try: 
 
             # NOTE: First, check if students currently borrowing this book (can't remove it from the system
             # until ALL COPIES are returned back)
-            cursor.execute('SELECT * FROM user_book_checkouts where book_isbn_id = CAST(%s AS TEXT);', (str(book_isbn_id),))
-            if cursor.rowcount != 0:
+            if isBookCheckedOut(cursor, str(book_isbn_id)): # (user_book_checkouts_book_isbn_idx)
                 return jsonify({"error": "Students are currently borrowing this book!"}), 409
 
 
-            cursor.execute("DELETE FROM books WHERE book_isbn_id=0060597720;")
+            cursor.execute("DELETE FROM books WHERE book_isbn_id = %s;", (str(book_isbn_id),))
             if cursor.rowcount == 0:
                 return {"message": f"No matching book found. Nothing deleted."}, 404 # 404 not found
             
+            cache_version = catalog_cache.writtenVersion(cursor)
             conn.commit() # MAKE SURE TO COMMIT THESE CHANGES TO SUPABASE (i.e. remote-repo),
             # SO I CAN ACTUALLY SEE THEM (i.e. not just reflected in my local database)
+            catalog_cache.writeRows([], cache_version, deleted=[str(book_isbn_id)])
 
             return {"message": f"Book {book_isbn_id} deleted."}, 200
         
+        except OVERLOAD_ERRORS:
+            raise # -> 503 + Retry-After (errorhandlers)
+
         except Exception as e: # Handle database exceptions
+            conn.rollback()
             return jsonify({"error": str(e)}), 500
     
     else:
         return jsonify({"error": "You are not permitted to perform this action!"}), 403
 
 @app.patch("/api/books/<book_isbn_id>") 
+@routeClass(ADMIN)
+@requireLogin
 def updateBookInfo(book_isbn_id : str):
 
-    request_header_data = request.get_json()
+    conn = getDbConnection()
+    cursor = conn.cursor()
 
-    role_id = request_header_data.get("role_id")
-    table_name = request_header_data.get("table_name")
-    action = request_header_data.get("action")
-    column_field = request_header_data.get("column_field", "N/A") # 'None' for Insert/Delete queries (queries for ENTIRE ROW-ENTRIES -> NOT just a specific column to only work on)
+    request_header_data = request.get_json()
 
     valid_updatable_book_headers = set({"book_isbn_id", "title", "author", "published_year", "total_book_count", "available_count"})
 
     set_clause = [] 
     defined_param_values_to_replace = []
+    updated_columns = []
 
     new_book_isbn_id = book_isbn_id
 
@@ -549,6 +1045,7 @@ def updateBookInfo(book_isbn_id : str):
 
             set_clause.append(f'{old_val} = %s')
             defined_param_values_to_replace.append(new_val)
+            updated_columns.append(old_val)
 
             if old_val == "book_isbn_id": # New book_isbn_id provided | Changed (hence in json-headers)
                 new_book_isbn_id = new_val
@@ -559,32 +1056,37 @@ def updateBookInfo(book_isbn_id : str):
         return jsonify({"error": "No valid fields provided for update"}), 400
     
     set_clause = (", ").join(set_clause)
+    # RETURNING the updated row -> 1 round-trip (vs. UPDATE + re-SELECT)
     query = f"""UPDATE books
                 SET {set_clause}
-                WHERE book_isbn_id = %s"""
+                WHERE book_isbn_id = %s
+                RETURNING {', '.join(BOOK_COLUMNS)}"""
     
     # Change to tuple (that's what the cursor.execute accepts for the parameterized-queries | immutable)
     defined_param_values_to_replace.append(book_isbn_id) # Old 'book_isbn_id' is also a parameterized-query %s (to select which book-row-entry to search for)
     defined_param_values_to_replace_tuple = tuple(defined_param_values_to_replace)
 
-    # Will only run the below code if these 4 params insert within the exact same row-entry
-    # in my permissions-table — SO, by default, a SQL-injection won't push through here.
-    if hasPermissions(role_id, table_name, action, column_field):
+    # The caller needs UPDATE on EVERY column they're changing (checked against their signed token's permissions)
+    if all(isAuthorized("books", "UPDATE", column) for column in updated_columns):
         try: 
             cursor.execute(query, defined_param_values_to_replace_tuple)
-            conn.commit()
-
-            cursor.execute("SELECT * from books where book_isbn_id = %s", (new_book_isbn_id,))
-            column_fields = [desc[0] for desc in cursor.description] # desc[1] = col-field-value for this row-entry 
-    
             updated_book_values = cursor.fetchone()
-            book_info = dict(zip(column_fields, updated_book_values))
-            book_info = json.dumps(book_info)
+            if updated_book_values is None:
+                conn.rollback()
+                return jsonify({"error": f"Book {book_isbn_id} not found"}), 404
 
-            return {"message": f"Book {new_book_isbn_id} succesfully updated.",
-                    "updated_book" : book_info
-                   }, 200
+            cache_version = catalog_cache.writtenVersion(cursor)
+            conn.commit()
+            catalog_cache.writeRows([updated_book_values], cache_version, deleted=[book_isbn_id] if updated_book_values[0] != book_isbn_id else ())
+
+            # A JSON object (not a JSON-encoded string inside the JSON response, as before)
+            return jsonify({"message": f"Book {new_book_isbn_id} succesfully updated.",
+                            "updated_book" : BOOK_LAYOUT.toDict(updated_book_values)
+                           }), 200
         
+        except OVERLOAD_ERRORS:
+            raise # -> 503 + Retry-After (errorhandlers)
+
         except Exception as e: # Handle database exceptions
             conn.rollback() 
             return jsonify({"error": str(e)}), 500
@@ -592,104 +1094,335 @@ def updateBookInfo(book_isbn_id : str):
     else:
         return jsonify({"error": "You are not permitted to perform this action!"}), 403
 
-@app.patch("/api/users/<user_id>/borrow-book") # user_id is pulled from the query-param-path, hence its in the function-arg directly
-def borrowBook(user_id : str):
+# Many books at once (i.e. count corrections after an inventory) | body: {"patches": [{"book_isbn_id": "...", "total_book_count": 4, ...}, ...]}
+# -> every patch is checked against the caller's per-column UPDATE permissions | the allowed ones are applied in 1 statement
+@app.patch("/api/books")
+@routeClass(ADMIN)
+@requireLogin
+def updateBookInfoBatch():
+
+    try:
+        patches, rejected = parseBookPatches(request.get_json(silent=True), lambda column: isAuthorized("books", "UPDATE", column))
+    except InvalidBulkRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
+    try:
+        results = rejected
+        if patches:
+            results = sorted(rejected + patchBooks(cursor, patches), key=lambda result: result["position"])
+            updated_rows = [tuple(result["book"][column] for column in BOOK_COLUMNS) for result in results if result["status"] == "updated"]
+            cache_version = catalog_cache.writtenVersion(cursor) if updated_rows else None # (0 rows -> no bump of ours to read)
+            conn.commit()
+            catalog_cache.writeRows(updated_rows, cache_version)
+
+        # {"results": [{"book_isbn_id", "position", "status": "updated" | "not_found" | "invalid_counts" | "invalid" | "forbidden", ...}, ...]}
+        return jsonify({"results": results, "updated": sum(result["status"] == "updated" for result in results)}), 200
+
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+
+# Runs one circulation batch (1 statement) as its own transaction, retrying if it lost a race:
+# -> UniqueViolation: a concurrent request by the SAME user borrowed the same book between our check + insert
+# -> DeadlockDetected / SerializationFailure: Postgres aborted us to break a lock cycle
+# -> The committed results are written through to the catalog cache (at the books-version this statement bumped to)
+def runCirculationBatch(conn, circulation_fn, user_id, book_isbn_ids, attempts=3):
+    for attempt in range(1, attempts + 1):
+        try:
+            cursor = conn.cursor()
+            results = circulation_fn(cursor, user_id, book_isbn_ids)
+            changed = any(result.get("available_count") is not None for result in results) # (none -> books wasn't bumped)
+            cache_version = catalog_cache.writtenVersion(cursor) if changed else None
+            conn.commit()
+
+            catalog_cache.writeAvailability(results, cache_version)
+            return results
+        except (psycopg2.errors.UniqueViolation, psycopg2.errors.DeadlockDetected, psycopg2.errors.SerializationFailure):
+            conn.rollback()
+            if attempt == attempts:
+                raise
 
-    # First update the overdue-books for this user_id | update their books_overdue column accordingly
-    updateOverdueBooksPerUser()
+# Borrowing requires an active account w/ <= 3 overdue books | returns an error-response tuple, or None if the user may borrow
+def checkCanBorrow(conn, cursor, user_id):
+
+    # First recompute the overdue-books for THIS user_id only (1 indexed UPDATE ... RETURNING, not a table-wide rewrite)
+    with timed("overdue_refresh_user"):
+        user_overdue_state = refreshOverdueBooksForUser(cursor, user_id)
+    if user_overdue_state is None:
+        return jsonify({"error": f"User {user_id} not found"}), 404
+
+    books_overdue, is_active = user_overdue_state
+    conn.commit() # Keep the refreshed books_overdue (even if we refuse the borrow below)
 
     # Then: Check if the updated overdue-books count for this user_id
     # is now EXCESSIVELY OVERDUE
-    cursor.execute("SELECT books_overdue FROM users where user_id = %s AND array_length(books_overdue, 1) > 3", (user_id,))
-    if cursor.fetchone(): 
+    if len(books_overdue) > 3:
         return jsonify({"error": "You have exceeded the overdue-limit. Please return your overdue books to continue borrowing books."}), 403 # 403 Forbidden | Valid Request from AUTHENTICATED CLIENT; BUT: They are restricted from borrowing books b/c of the >3 overdue books-policy violation...
 
     # USER CAN'T BORROW A BOOK (deactivated_account) "You're account is currently deactivated. You either have >3 overdue books OR are a newly registered user (wait for librarian approval)."
-    cursor.execute("SELECT is_active_account FROM users WHERE user_id = %s", (user_id,))
-    is_active = cursor.fetchone()[0]
     if not is_active: # deactivated account
         return jsonify({"error": "You're account is currently deactivated. You either have >3 overdue books OR are a newly registered user (wait for librarian approval)."}), 403 # Forbidden
 
+    return None
+
+@app.patch("/api/users/<user_id>/borrow-book") # user_id is pulled from the query-param-path, hence its in the function-arg directly
+@routeClass(CIRCULATION)
+@requireLogin
+def borrowBook(user_id : str):
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
     # JSON-header-fields specified for MOST FRONTEND API-REQUESTS :)
     # + additional elements as below (i.e. book_isbn_id)
     request_header_data = request.get_json()
 
-    role_id = request_header_data.get("role_id")
-    table_name = request_header_data.get("table_name")
-    action = request_header_data.get("action")
-    column_field = request_header_data.get("column_field", "N/A")
-
     book_isbn_id = request_header_data.get("book_isbn_id")
-    
-    if hasPermissions(role_id, table_name, action, column_field):
-        
-        try: 
-            cursor.execute("SELECT available_count FROM books WHERE book_isbn_id = %s", (book_isbn_id,))
-            books_available_count = cursor.fetchone()
 
-            # books_available_count == None -> Empty Return Value | -> provided books_isbn_id doesn't exist in the Books_table :)
-            if not books_available_count or books_available_count[0] == 0:
-                return {"error": "Book not available"}, 400
-            
-            cursor.execute(f"""{action} INTO {table_name} (user_id, book_isbn_id, checkout_time) VALUES (%s, %s, NOW());""", (user_id, book_isbn_id,))
-            
-            # Update 'books_checked_out' to DECREMENT by 1 for this user_id field
-            # cursor.execute("UPDATE books SET books_available_count = books_available_count - 1 WHERE book_isbn_id = %s", (book_isbn_id,))
-            cursor.execute(f"""UPDATE books
-                SET available_count = available_count - 1
-                WHERE book_isbn_id = {book_isbn_id}""")
-            
-            conn.commit()
+    if not isAuthorized("user_book_checkouts", "INSERT", "N/A") or not isCallerUser(user_id):
+        return jsonify({"error": "You are not permitted to perform this action!"}), 403
 
-            return {"message": "Book checked out succesfully!"}, 200
-        
-        except Exception as e: # Handle database exceptions for caught-errors
-            conn.rollback() 
-            return jsonify({"error": "Unable to borrow book", "details": str(e)}), 500
+    borrow_error = checkCanBorrow(conn, cursor, user_id)
+    if borrow_error:
+        return borrow_error
+
+    if not isinstance(book_isbn_id, str) or not book_isbn_id:
+        return {"error": "Missing 'book_isbn_id'"}, 400
+
+    try: 
+        # Same atomic path as the batch-endpoint (a batch of 1)
+        result = runCirculationBatch(conn, borrowBooks, user_id, [book_isbn_id])[0]
+
+        if result["status"] == "already_borrowed":
+            return {"error": "You have already borrowed this book"}, 409
+
+        # not_found / unavailable -> provided books_isbn_id doesn't exist in the Books_table, or 0 copies left :)
+        if result["status"] != "borrowed":
+            return {"error": "Book not available"}, 400
+
+        return {"message": "Book checked out succesfully!", "available_count": result["available_count"]}, 200
     
-    else:
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e: # Handle database exceptions for caught-errors
+        conn.rollback() 
+        return jsonify({"error": "Unable to borrow book", "details": str(e)}), 500
+
+@app.patch("/api/users/<user_id>/borrow-books")
+@routeClass(CIRCULATION)
+@requireLogin
+def borrowBooksBatch(user_id : str):
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
+    request_header_data = request.get_json()
+
+    if not isAuthorized("user_book_checkouts", "INSERT", "N/A") or not isCallerUser(user_id):
         return jsonify({"error": "You are not permitted to perform this action!"}), 403
+
+    try:
+        book_isbn_ids = parseBookIsbnIds(request_header_data.get("book_isbn_ids"))
+    except InvalidBatchRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    borrow_error = checkCanBorrow(conn, cursor, user_id)
+    if borrow_error:
+        return borrow_error
+
+    try:
+        # All-or-nothing per ISBN, in 1 transaction | {"results": [{"book_isbn_id", "status", "available_count"}, ...]}
+        results = runCirculationBatch(conn, borrowBooks, user_id, book_isbn_ids)
+        return jsonify({"results": results, "borrowed": sum(result["status"] == "borrowed" for result in results)}), 200
+
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": "Unable to borrow books", "details": str(e)}), 500
     
 @app.patch("/api/users/<user_id>/return-book") # user_id is pulled from the query-param-path, hence its in the function-arg directly
+@routeClass(CIRCULATION)
+@requireLogin
 def returnBook(user_id : str):
 
-    updateOverdueBooksPerUser()
+    conn = getDbConnection()
 
     request_header_data = request.get_json()
 
-    role_id = request_header_data.get("role_id")
-    table_name = request_header_data.get("table_name")
-    action = request_header_data.get("action")
-    column_field = request_header_data.get("column_field", "N/A")
-
     book_isbn_id = request_header_data.get("book_isbn_id")
     
-    if hasPermissions(role_id, table_name, action, column_field):
-        
-        try: 
-            cursor.execute("SELECT * FROM books WHERE book_isbn_id = %s", (book_isbn_id,))
-            book = cursor.fetchone()
+    if not isAuthorized("user_book_checkouts", "DELETE", "N/A") or not isCallerUser(user_id):
+        return jsonify({"error": "You are not permitted to perform this action!"}), 403
 
-            # book == None -> Empty Return Value | -> provided books_isbn_id doesn't exist in the Books_table :)
-            if not book:
-                return {"error": "Book not found"}, 400
-            
-            # "DELETE FROM user_book_checkouts WHERE user_id = user_id AND book_isbn_id = book_isbn_id
-            cursor.execute(f"""{action} FROM {table_name} 
-                            WHERE user_id = %s AND book_isbn_id = %s;""", 
-                            (user_id, book_isbn_id,))
-            
-            cursor.execute(f"""UPDATE books
-                SET available_count = available_count + 1
-                WHERE book_isbn_id = {book_isbn_id}""")
-            
-            conn.commit()
+    if not isinstance(book_isbn_id, str) or not book_isbn_id:
+        return {"error": "Missing 'book_isbn_id'"}, 400
 
-            return {"message": "Book returned successfully!"}, 200
-        
-        except Exception as e: # Handle database exceptions for caught-errors              
-            conn.rollback() 
-            return jsonify({"error": "Unable to return book", "details": str(e)}), 500
+    try: 
+        # DELETE the checkout + give the copy back + clear it from books_overdue, atomically
+        result = runCirculationBatch(conn, returnBooks, user_id, [book_isbn_id])[0]
+
+        # book == None -> Empty Return Value | -> provided books_isbn_id doesn't exist in the Books_table :)
+        if result["status"] == "not_found":
+            return {"error": "Book not found"}, 400
+
+        if result["status"] == "not_borrowed":
+            return {"error": "You haven't borrowed this book"}, 400
+
+        return {"message": "Book returned successfully!", "available_count": result["available_count"]}, 200
     
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e: # Handle database exceptions for caught-errors              
+        conn.rollback() 
+        return jsonify({"error": "Unable to return book", "details": str(e)}), 500
+
+@app.patch("/api/users/<user_id>/return-books")
+@routeClass(CIRCULATION)
+@requireLogin
+def returnBooksBatch(user_id : str):
+
+    conn = getDbConnection()
+
+    request_header_data = request.get_json()
+
+    if not isAuthorized("user_book_checkouts", "DELETE", "N/A") or not isCallerUser(user_id):
+        return jsonify({"error": "You are not permitted to perform this action!"}), 403
+
+    try:
+        book_isbn_ids = parseBookIsbnIds(request_header_data.get("book_isbn_ids"))
+    except InvalidBatchRequest as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        results = runCirculationBatch(conn, returnBooks, user_id, book_isbn_ids)
+        return jsonify({"results": results, "returned": sum(result["status"] == "returned" for result in results)}), 200
+
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": "Unable to return books", "details": str(e)}), 500
+
+
+VALID_PERMISSION_TABLES = set({"roles", "permissions", "users", "books", "user_book_checkouts"})
+VALID_PERMISSION_ACTIONS = set({"SELECT", "INSERT", "UPDATE", "DELETE"})
+PERMISSION_LAYOUT = RowLayout(("role_id", "table_name", "action", "column_field"))
+
+@app.get("/api/permissions")
+@routeClass(ADMIN)
+@requireLogin
+def getPermissions():
+
+    if isAuthorized("permissions", "SELECT", "*"):
+        permissions = PERMISSION_LAYOUT.toDicts(permission_index.listPermissions())
+        return jsonify({"permissions": permissions}), 200
+
     else:
-        return jsonify({"error": "You are not permitted to perform this action!"}), 403
\ No newline at end of file
+        return jsonify({"error": "You are not permitted to view this resource!"}), 403
+
+def getPermissionGrant(request_header_data):
+    # The permission being granted/revoked (the caller's own permissions come from their token)
+    grant = request_header_data.get("permission") or {}
+
+    grant_role_id = grant.get("role_id")
+    grant_table_name = grant.get("table_name")
+    grant_action = grant.get("action")
+    grant_column_field = grant.get("column_field", "N/A")
+
+    if grant_role_id is None or not grant_table_name or not grant_action or not grant_column_field:
+        return None, "'permission' must include role_id, table_name, action and column_field"
+
+    if grant_table_name not in VALID_PERMISSION_TABLES:
+        return None, f"Unknown table '{grant_table_name}'"
+
+    if grant_action not in VALID_PERMISSION_ACTIONS:
+        return None, f"Action must be one of {sorted(VALID_PERMISSION_ACTIONS)}"
+
+    return (grant_role_id, grant_table_name, grant_action, grant_column_field), None
+
+@app.post("/api/permissions")
+@routeClass(ADMIN)
+@requireLogin
+def addPermission():
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
+    request_header_data = request.get_json()
+
+    if not isAuthorized("permissions", "INSERT", "N/A"):
+        return jsonify({"error": "You are not permitted to perform this action!"}), 403
+
+    grant, error = getPermissionGrant(request_header_data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    try:
+        cursor.execute("INSERT INTO permissions (role_id, table_name, action, column_field) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING;", grant)
+        inserted = cursor.rowcount
+        conn.commit() # Trigger NOTIFY's every other process | we update our own index directly below
+
+        permission_index.grant(*grant)
+
+        if inserted == 0:
+            return jsonify({"message": "Permission already exists."}), 200
+
+        return jsonify({"message": "Permission added."}), 201
+
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e: # i.e. role_id doesn't exist (foreign-key violation)
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.delete("/api/permissions")
+@routeClass(ADMIN)
+@requireLogin
+def revokePermission():
+
+    conn = getDbConnection()
+    cursor = conn.cursor()
+
+    request_header_data = request.get_json()
+
+    if not isAuthorized("permissions", "DELETE", "N/A"):
+        return jsonify({"error": "You are not permitted to perform this action!"}), 403
+
+    grant, error = getPermissionGrant(request_header_data)
+    if error:
+        return jsonify({"error": error}), 400
+
+    # Don't let an admin lock every admin out of the permissions-table itself
+    if grant[1] == "permissions":
+        return jsonify({"error": "Permissions on the 'permissions' table can't be revoked through the API."}), 400
+
+    try:
+        cursor.execute("DELETE FROM permissions WHERE role_id = %s AND table_name = %s AND action = %s AND column_field = %s;", grant)
+        deleted = cursor.rowcount
+        conn.commit()
+
+        permission_index.revoke(*grant)
+
+        if deleted == 0:
+            return jsonify({"message": "No matching permission found. Nothing revoked."}), 404
+
+        return jsonify({"message": "Permission revoked."}), 200
+
+    except OVERLOAD_ERRORS:
+        raise # -> 503 + Retry-After (errorhandlers)
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
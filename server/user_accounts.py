@@ -0,0 +1,55 @@
+# Statements behind log-in / sign-up + the librarians' user listings (GET /api/users, GET /api/users/summary)
+# -> Kept out of server.py so they can be imported w/o starting the app (i.e. by bench/check_query_plans.py, which
+#    EXPLAINs every registered Query)
+
+import functools
+
+from queries import Query
+
+# Columns GET /api/users returns (never the password hashes) | also INCLUDE'd in the dashboard's partial indexes
+USER_LISTING_COLUMNS = ("role_id", "user_id", "user_name", "is_active_account", "books_overdue")
+USER_ACCOUNT_STATUSES = ("active", "needs-approval", "excessive-overdue")
+
+USERS_LISTING = Query("users_listing", f"SELECT {', '.join(USER_LISTING_COLUMNS)} FROM users ORDER BY user_id;")
+USERS_LISTING_BY_STATUS = Query("users_listing_by_status", f"SELECT {', '.join(USER_LISTING_COLUMNS)} FROM users WHERE account_status = %(status)s ORDER BY user_id;", {"status": "TEXT"})
+
+# ?fields= projections of the above | 1 Query per (projection, status-filter), built + registered once
+@functools.lru_cache(maxsize=None)
+def usersListingQuery(fields, by_status):
+    if fields == USER_LISTING_COLUMNS:
+        return USERS_LISTING_BY_STATUS if by_status else USERS_LISTING
+
+    suffix = "".join("1" if column in fields else "0" for column in USER_LISTING_COLUMNS)
+    if by_status:
+        return Query(f"users_listing_by_status_f{suffix}", f"SELECT {', '.join(fields)} FROM users WHERE account_status = %(status)s ORDER BY user_id;", {"status": "TEXT"})
+    return Query(f"users_listing_f{suffix}", f"SELECT {', '.join(fields)} FROM users ORDER BY user_id;")
+
+# Index-only scan over users_account_status_idx
+USERS_SUMMARY = Query("users_summary", "SELECT account_status, count(*) FROM users GROUP BY account_status;")
+
+# Log-in: the user, their password hash + their checked-out books in ONE round-trip (was 3 SELECTs)
+LOGIN_LOOKUP = Query("login_lookup",
+    """
+        SELECT
+            u.role_id,
+            u.is_active_account,
+            u.books_overdue,
+            u.password_hash,
+            ARRAY(SELECT ubc.book_isbn_id FROM user_book_checkouts ubc WHERE ubc.user_id = u.user_id ORDER BY ubc.checkout_time) AS book_checkouts
+        FROM users u
+        WHERE u.user_id = %(user_id)s;
+    """,
+    {"user_id": "TEXT"},
+)
+USER_NAME_TAKEN = Query("user_name_taken", "SELECT EXISTS (SELECT 1 FROM users WHERE lower(user_name) = lower(%(user_name)s));", {"user_name": "TEXT"}) # (users_user_name_lower_key)
+UPDATE_PASSWORD_HASH = Query("update_password_hash", "UPDATE users SET password_hash = %(password_hash)s, string_password_hash = %(password_hash)s::TEXT WHERE user_id = %(user_id)s;",
+                             {"password_hash": "BYTEA", "user_id": "TEXT"})
+INSERT_USER = Query("insert_user",
+    """
+        INSERT INTO users (role_id, user_id, user_name, password_hash, is_active_account, books_overdue, string_password_hash)
+        VALUES (%(role_id)s, %(user_id)s, %(user_name)s, %(password_hash)s, %(is_active_account)s, ARRAY[]::TEXT[], %(password_hash)s::TEXT);
+    """,
+    {"role_id": "INT", "user_id": "TEXT", "user_name": "TEXT", "password_hash": "BYTEA", "is_active_account": "BOOLEAN"},
+)
+
+MAX_USER_NAME_LENGTH = 64
@@ -0,0 +1,247 @@
+# Username availability w/o downloading every username / scanning 'users' per check
+# -> users.user_name is UNIQUE case-insensitively (users_user_name_lower_key ON lower(user_name)) -> 'taken?' === 1 index probe,
+#    + the INSERT itself can't create a duplicate (2 concurrent sign-ups -> 1 UniqueViolation -> 409)
+# -> Per-process Bloom filter over every (lower-cased) username: 'definitely not taken' needs NO database round-trip
+#    | 'maybe' (a real match, or a ~USERNAME_FILTER_ERROR_RATE false positive) falls through to the index probe
+# -> Kept complete across processes: a statement-trigger NOTIFY's 'user_names' w/ every new/renamed username -> every process
+#    adds them | rebuilt (1 streamed pass over 'users', in the background) on every listener (re)connect (-> at startup,
+#    + whenever NOTIFY's may have been missed), and once it holds more names than it was sized for
+# -> Not built yet / non-ASCII names (Python's + Postgres' lower() may disagree) -> always the index probe
+#
+# NOTE: Deleted users' names stay in the filter until the next rebuild -> they only cost the fallback probe
+
+import hashlib
+import json
+import math
+import threading
+import uuid
+
+from instrumentation import Counter, timed
+
+USER_NAMES_CHANNEL = "user_names"
+USER_NAME_INDEX = "users_user_name_lower_key"
+MAX_NOTIFY_PAYLOAD_BYTES = 7500 # (NOTIFY payloads are capped at 8000 bytes) | bigger statements send 'resync' instead
+
+USERNAME_LOOKUPS = Counter("username_lookups_total", "Username-taken checks, by who answered them (filter === no db round-trip).")
+
+# Case-insensitive duplicates that predate the index | [(lower(user_name), [[user_id, user_name], ...] oldest first), ...]
+DUPLICATE_USER_NAMES_QUERY = (
+    """
+        SELECT lower(user_name), json_agg(json_build_array(user_id, user_name) ORDER BY id)
+        FROM users
+        GROUP BY lower(user_name)
+        HAVING count(*) > 1
+        ORDER BY lower(user_name);
+    """
+)
+
+CREATE_USER_NAME_INDEX = f"CREATE UNIQUE INDEX IF NOT EXISTS {USER_NAME_INDEX} ON users (lower(user_name));"
+
+# 1 NOTIFY per statement w/ the new usernames (JSON array) | {"resync": true} if they don't fit in 1 payload
+CREATE_NOTIFY_USER_NAMES_FUNCTION = (
+    f"""
+        CREATE OR REPLACE FUNCTION notify_user_names() RETURNS TRIGGER AS $$
+        DECLARE
+            payload TEXT;
+        BEGIN
+            IF TG_OP = 'UPDATE' THEN
+                SELECT jsonb_agg(n.user_name)::TEXT INTO payload
+                FROM new_rows n JOIN old_rows o ON o.id = n.id
+                WHERE o.user_name IS DISTINCT FROM n.user_name;
+            ELSE
+                SELECT jsonb_agg(user_name)::TEXT INTO payload FROM new_rows;
+            END IF;
+
+            IF payload IS NULL THEN
+                RETURN NULL;
+            END IF;
+
+            IF octet_length(payload) > {MAX_NOTIFY_PAYLOAD_BYTES} THEN
+                payload := '{{"resync": true}}';
+            END IF;
+
+            PERFORM pg_notify('{USER_NAMES_CHANNEL}', payload);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    """
+)
+
+USER_COUNT_QUERY = "SELECT count(*) FROM users;"
+ALL_USER_NAMES_QUERY = "SELECT user_name FROM users;"
+
+class DuplicateUserNamesError(Exception):
+    pass
+
+
+# Duplicates -> fails (nothing is renamed behind the users' backs: they log in by that name) | an operator renames
+# all but 1 account per name (i.e. 'UPDATE users SET user_name = ... WHERE user_id = ...'), then re-runs the migration
+def createUserNameIndex(cursor):
+    cursor.execute(DUPLICATE_USER_NAMES_QUERY)
+    duplicates = cursor.fetchall()
+    if duplicates:
+        conflicts = "\n".join(f"  '{user_name}': " + ", ".join(f"{user_id} ('{name}')" for user_id, name in accounts) for user_name, accounts in duplicates)
+        raise DuplicateUserNamesError(f"{len(duplicates)} username(s) are taken by more than 1 account (case-insensitively) -> rename all but 1 of each, then migrate again:\n{conflicts}")
+
+    cursor.execute(CREATE_USER_NAME_INDEX)
+
+def createUserNameNotifications(cursor):
+    cursor.execute(CREATE_NOTIFY_USER_NAMES_FUNCTION)
+
+    for event, referencing in (("INSERT", "NEW TABLE AS new_rows"), ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows")):
+        trigger_name = f"users_user_names_{event.lower()}_trigger"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name} ON users;")
+        cursor.execute(
+            f"""
+                CREATE TRIGGER {trigger_name}
+                AFTER {event} ON users
+                REFERENCING {referencing}
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_user_names();
+            """
+        )
+
+
+class BloomFilter:
+    # 'capacity' keys at ~'error_rate' false positives | k bit-positions per key from 1 blake2b digest (double hashing)
+
+    __slots__ = ("size", "hash_count", "bits")
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first, step = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+# lower-cased key | None -> the filter can't vouch for this name (non-ASCII)
+def _filterKey(user_name):
+    return user_name.lower() if user_name.isascii() else None
+
+
+class UsernameFilter:
+
+    def __init__(self, db_pool, error_rate=0.01, min_capacity=10_000):
+        self.db_pool = db_pool
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+
+        self._lock = threading.Lock() # Adds (read-modify-write of the bit-array bytes) + swaps
+        self._filter = None # None until the first rebuild finished
+        self._capacity = 0
+        self._count = 0
+        self._added_during_rebuild = None # Names NOTIFY'd while a rebuild scans (its snapshot may not have them)
+        self._rebuild_thread = None
+        self._rebuild_requested = False
+
+    def ready(self):
+        return self._filter is not None
+
+    # False === definitely not taken | True === maybe (or the filter isn't ready) -> ask the database
+    def mightContain(self, user_name):
+        key = _filterKey(user_name)
+        current = self._filter
+        if key is None or current is None:
+            return True
+        return key in current
+
+    def add(self, user_name):
+        key = _filterKey(user_name)
+        if key is None:
+            return
+
+        with self._lock:
+            if self._added_during_rebuild is not None:
+                self._added_during_rebuild.append(key)
+            if self._filter is None:
+                return
+            self._filter.add(key)
+            self._count += 1
+            outgrown = self._count > self._capacity
+
+        if outgrown:
+            self.scheduleRebuild()
+
+    def rebuild(self):
+        with self._lock:
+            self._added_during_rebuild = []
+
+        try:
+            with timed("username_filter_rebuild"), self.db_pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(USER_COUNT_QUERY)
+                    count = cursor.fetchone()[0]
+
+                capacity = max(self.min_capacity, 2 * count) # Room to grow before the next rebuild
+                rebuilt = BloomFilter(capacity, self.error_rate)
+                added = 0
+
+                cursor = conn.cursor(name=f"username_filter_{uuid.uuid4().hex}") # Server-side -> streamed, not all in memory
+                cursor.itersize = 10_000
+                try:
+                    cursor.execute(ALL_USER_NAMES_QUERY)
+                    for (user_name,) in cursor:
+                        key = _filterKey(user_name)
+                        if key is not None:
+                            rebuilt.add(key)
+                            added += 1
+                finally:
+                    cursor.close()
+
+            with self._lock:
+                for key in self._added_during_rebuild:
+                    rebuilt.add(key)
+                added += len(self._added_during_rebuild)
+                self._filter, self._capacity, self._count = rebuilt, capacity, added
+        finally:
+            with self._lock:
+                self._added_during_rebuild = None
+
+    # Requested while a rebuild is already scanning -> 1 more pass after it (its snapshot may predate what was missed)
+    def scheduleRebuild(self):
+        with self._lock:
+            self._rebuild_requested = True
+            if self._rebuild_thread is not None:
+                return
+            self._rebuild_thread = threading.Thread(target=self._rebuildInBackground, name="username-filter-rebuild", daemon=True)
+            self._rebuild_thread.start()
+
+    def _rebuildInBackground(self):
+        while True:
+            with self._lock:
+                if not self._rebuild_requested:
+                    self._rebuild_thread = None
+                    return
+                self._rebuild_requested = False
+
+            try:
+                self.rebuild()
+            except Exception as e: # Not ready / stale-but-complete until the next (re)connect -> only costs db probes
+                print(f"Username filter rebuild failed: {e}")
+
+    # NotificationListener handler | None (i.e. (re)connected, may have missed NOTIFY's) / 'resync' -> rebuild
+    def onNotification(self, payload):
+        if payload is None:
+            self.scheduleRebuild()
+            return
+
+        user_names = json.loads(payload)
+        if isinstance(user_names, dict):
+            self.scheduleRebuild()
+            return
+        for user_name in user_names:
+            self.add(user_name)
+
+    def stats(self):
+        return {"ready": self.ready(), "names": self._count, "capacity": self._capacity}